@@ -0,0 +1,315 @@
+"""AIMD request rate and concurrency per endpoint, learned from 429s and rate-limit headers"""
+import os
+import json
+import time
+import atexit
+import threading
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+from rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_PATH = os.path.join(".cache", "adaptive_limits.json")
+
+# Until the first 429 each success raises the rate by 10% (slow start, to find the limit fast).
+# After that the rate grows by 5% of the rate at the last 429 per second of saturated sending,
+# so it is back there ~10s after halving, and each 429 halves rate and concurrency again
+SLOW_START_GAIN = 0.1
+ADDITIVE_GAIN = 0.05
+DECREASE_FACTOR = 0.5
+MIN_PER_MINUTE = 1.0
+# Learned limits are written at most this often, except right after a decrease
+SAVE_INTERVAL = 30.0
+
+
+def adaptive_enabled() -> bool:
+    return os.getenv("ADAPTIVE_RATE_LIMIT", "true").lower() == "true"
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date); None if absent or invalid"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _header(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = headers.get(f"X-RateLimit-{name}") or headers.get(f"RateLimit-{name}")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class AdaptiveLimiter:
+    """Adjusts an endpoint's RateLimiter and in-flight cap from what the service reports
+
+    Starts from the limiter's configured rate (or the rate learned before a restart) and grows
+    it on success up to `max_per_minute`: quickly until the first 429, additively after. A 429
+    cuts rate and concurrency in half, at most once per second or Retry-After, since a burst of
+    429s from requests already in flight is one signal. X-RateLimit-Limit
+    (counted over RATE_LIMIT_HEADER_WINDOW seconds) caps the rate, and X-RateLimit-Remaining: 0
+    pauses the endpoint until X-RateLimit-Reset. The per-hour limit scales with the per-minute one.
+
+    The configured burst capacity is kept until the service shows it enforces a limit (a 429 or
+    rate-limit headers); from then on requests are spaced evenly at the learned rate. A 429 that
+    arrives while still bursting only switches spacing on.
+    """
+
+    def __init__(self, key: str, rate_limiter: RateLimiter, max_per_minute: Optional[float] = None,
+                 max_concurrency: int = 16, header_window: float = 60.0,
+                 state: Optional[Dict[str, Any]] = None, on_change=None):
+        self.key = key
+        self.rate_limiter = rate_limiter
+        self.base_per_minute = float(rate_limiter.per_minute)
+        self.base_per_hour = float(rate_limiter.per_hour)
+        self.max_per_minute = max(self.base_per_minute, float(max_per_minute or self.base_per_minute))
+        self.max_concurrency = max(1, max_concurrency)
+        self.header_window = header_window
+        self.on_change = on_change  # called with this limiter when there is something to persist
+
+        # Learned under a different configured rate (the plan changed?): start over from the new one
+        if not state or state.get("base_per_minute") != self.base_per_minute:
+            state = {}
+        self.ceiling: Optional[float] = state.get("ceiling")  # per minute, from rate-limit headers
+        self.per_minute = self._bounded(state.get("per_minute", self.base_per_minute))
+        self.concurrency = min(float(self.max_concurrency), max(1.0, state.get("concurrency", self.max_concurrency / 4)))
+        self.slow_start = state.get("slow_start", True)
+        self.spread = state.get("spread", False)
+        self.peak = state.get("peak", self.per_minute)  # rate when the last 429 came in
+
+        self.in_flight = 0
+        self.slot_waiters = 0
+        self.increases = 0
+        self.decreases = 0
+        self.last_decrease = 0.0  # time.monotonic()
+        self.last_increase = time.monotonic()
+        self._cond = threading.Condition()
+        self._apply()
+
+    def _bounded(self, per_minute: float) -> float:
+        upper = self.max_per_minute if self.ceiling is None else min(self.max_per_minute, self.ceiling)
+        return min(max(MIN_PER_MINUTE, per_minute), max(MIN_PER_MINUTE, upper))
+
+    def _apply(self):
+        """Push the current rate into the token buckets"""
+        per_hour = self.base_per_hour * self.per_minute / self.base_per_minute if self.base_per_minute else self.base_per_hour
+        self.rate_limiter.set_limits(self.per_minute, max(per_hour, self.per_minute), spread=self.spread)
+
+    def acquire_slot(self, cancel_event: Optional[threading.Event] = None) -> bool:
+        """Wait until fewer than `concurrency` requests are in flight; False if cancelled"""
+        with self._cond:
+            self.slot_waiters += 1
+            try:
+                while self.in_flight >= int(self.concurrency):
+                    if cancel_event is not None and cancel_event.is_set():
+                        return False
+                    self._cond.wait(0.5)
+            finally:
+                self.slot_waiters -= 1
+            self.in_flight += 1
+            return True
+
+    def release_slot(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, headers: Mapping[str, str]) -> Optional[float]:
+        """Additive increase; returns seconds to pause if the headers say the quota is used up
+
+        Called once the response headers are in. Rate and concurrency only grow while they
+        are what holds requests back (someone queued for a token or a slot), so a quiet period
+        doesn't inflate them past anything the service has confirmed.
+        """
+        rate_limited = self.rate_limiter.queue_length() > 0
+        with self._cond:
+            now = time.monotonic()
+            elapsed = min(now - self.last_increase, 1.0)
+            self.last_increase = now
+            if rate_limited:
+                if self.slow_start:
+                    self.per_minute = self._bounded(self.per_minute * (1 + SLOW_START_GAIN))
+                else:
+                    self.per_minute = self._bounded(self.per_minute + ADDITIVE_GAIN * self.peak * elapsed)
+                self.increases += 1
+            if self.slot_waiters > 0:
+                step = 1 if self.slow_start else 1 / self.concurrency
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + step)
+            pause = self._observe_headers(headers)
+            self._apply()
+            self._cond.notify_all()
+        self._changed(urgent=False)
+        return pause
+
+    def on_throttle(self, headers: Mapping[str, str]) -> Optional[float]:
+        """Multiplicative decrease after a 429; returns the Retry-After (or reset) wait if given"""
+        retry_after = parse_retry_after(headers.get("Retry-After"))
+        with self._cond:
+            now = time.monotonic()
+            bursting = not self.spread
+            self.spread = True
+            decreased = not bursting and now - self.last_decrease >= max(1.0, retry_after or 0.0)
+            if bursting:
+                # Requests went out in bursts of the configured capacity: spacing them evenly comes
+                # first, and the rate is only cut if 429s keep coming after that
+                self.last_decrease = now
+                logger.info("%s: 429 received, now spacing requests at %.1f requests/min",
+                            self.key, self.per_minute)
+            elif decreased:
+                self.peak = self.per_minute
+                self.per_minute = self._bounded(self.per_minute * DECREASE_FACTOR)
+                self.concurrency = max(1.0, self.concurrency * DECREASE_FACTOR)
+                self.slow_start = False
+                self.decreases += 1
+                self.last_decrease = now
+                logger.info("%s: 429 received, now %.1f requests/min and %d in flight",
+                            self.key, self.per_minute, int(self.concurrency))
+            pause = self._observe_headers(headers)
+            self._apply()
+        if decreased or bursting:
+            self._changed(urgent=True)
+        return retry_after if retry_after is not None else pause
+
+    def _observe_headers(self, headers: Mapping[str, str]) -> Optional[float]:
+        limit = _header(headers, "Limit")
+        remaining = _header(headers, "Remaining")
+        if limit or remaining is not None:
+            self.spread = True
+        if limit:
+            self.ceiling = max(MIN_PER_MINUTE, limit * 60 / self.header_window)
+            self.per_minute = self._bounded(self.per_minute)
+        if remaining == 0:
+            reset = _header(headers, "Reset")
+            if reset is not None:
+                # Either seconds until the window resets or an epoch timestamp
+                return max(0.0, reset - time.time()) if reset > 10 ** 9 else reset
+        return None
+
+    def retry_delay(self, attempt: int, max_delay: float) -> float:
+        """Backoff for a 429 without Retry-After: one request interval at the learned rate, doubled per attempt"""
+        return min(60 / self.per_minute * (2 ** attempt), max_delay)
+
+    def state(self) -> Dict[str, Any]:
+        return {"per_minute": round(self.per_minute, 3), "concurrency": round(self.concurrency, 3),
+                "ceiling": self.ceiling, "slow_start": self.slow_start, "spread": self.spread,
+                "peak": round(self.peak, 3), "base_per_minute": self.base_per_minute, "updated": time.time()}
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "per_minute": round(self.per_minute, 1),
+            "per_hour": round(self.rate_limiter.per_hour, 1),
+            "concurrency": int(self.concurrency),
+            "in_flight": self.in_flight,
+            "ceiling_per_minute": self.ceiling,
+            "slow_start": self.slow_start,
+            "spread": self.spread,
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
+    def _changed(self, urgent: bool):
+        if self.on_change is not None:
+            self.on_change(self, urgent)
+
+
+class AdaptiveStateStore:
+    """Learned limits in a small JSON file so they survive restarts"""
+
+    def __init__(self, path: str = DEFAULT_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty: Dict[str, AdaptiveLimiter] = {}
+        self._last_save = 0.0
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.states = json.load(f)
+        except (OSError, ValueError):
+            self.states = {}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.states.get(key)
+
+    def changed(self, limiter: AdaptiveLimiter, urgent: bool):
+        with self._lock:
+            self._dirty[limiter.key] = limiter
+            if not urgent and time.monotonic() - self._last_save < SAVE_INTERVAL:
+                return
+        self.save()
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            for key, limiter in self._dirty.items():
+                self.states[key] = limiter.state()
+            self._dirty = {}
+            self._last_save = time.monotonic()
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                # Write, then swap in atomically
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.states, f, indent=2)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"Could not save learned rate limits: {str(e)}")
+
+
+_store = None
+_limiters: Dict[tuple, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def adaptive_limiters() -> Dict[str, AdaptiveLimiter]:
+    """Adaptive limiters created so far in this process, by endpoint (numbered if several share one)"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    by_key: Dict[str, AdaptiveLimiter] = {}
+    for limiter in limiters:
+        key, number = limiter.key, 1
+        while key in by_key:
+            number += 1
+            key = f"{limiter.key}#{number}"
+        by_key[key] = limiter
+    return by_key
+
+
+def get_adaptive_limiter(key: str, rate_limiter: RateLimiter) -> AdaptiveLimiter:
+    """The process-wide adaptive limiter for an endpoint and rate limiter, seeded from the saved state
+
+    Clients with their own RateLimiter on the same endpoint get their own adaptive limiter, since
+    it drives that RateLimiter's buckets; the learned state is still saved under the endpoint key.
+    """
+    global _store
+    # The adaptive limiter keeps the rate limiter alive, so its id stays unique
+    registry_key = (key, id(rate_limiter))
+    with _limiters_lock:
+        limiter = _limiters.get(registry_key)
+        if limiter is None:
+            if _store is None:
+                _store = AdaptiveStateStore(os.getenv("ADAPTIVE_STATE_PATH", DEFAULT_STATE_PATH))
+                atexit.register(_store.save)
+            limiter = _limiters[registry_key] = AdaptiveLimiter(
+                key, rate_limiter,
+                max_per_minute=float(os.getenv("ADAPTIVE_MAX_PER_MINUTE", "600")),
+                max_concurrency=int(os.getenv("ADAPTIVE_MAX_CONCURRENCY", "16")),
+                header_window=float(os.getenv("RATE_LIMIT_HEADER_WINDOW", "60")),
+                state=_store.get(key), on_change=_store.changed,
+            )
+            if _store.get(key):
+                logger.info("%s: resuming at %.1f requests/min and %d in flight (learned earlier)",
+                            key, limiter.per_minute, int(limiter.concurrency))
+        return limiter
@@ -0,0 +1,129 @@
+"""Helpers for the notebook's research agent: cached tool results and windowed conversation history"""
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import logging
+from typing import Any, Callable, List, Optional, Sequence
+
+from chunking import estimate_tokens
+from response_cache import MemoryCache, SQLiteCache
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOOL_CACHE_PATH = os.path.join(".cache", "tool_cache.db")
+
+
+def normalize_tool_input(value: Any) -> Any:
+    """Tool input with case, whitespace, key order and empty optional fields evened out"""
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {key: normalize_tool_input(value[key]) for key in sorted(value)
+                if value[key] is not None and value[key] != ""}
+    if isinstance(value, (list, tuple)):
+        return [normalize_tool_input(item) for item in value]
+    return value
+
+
+def tool_cache_key(tool_name: str, tool_input: Any) -> str:
+    encoded = json.dumps(normalize_tool_input(tool_input), sort_keys=True, default=str)
+    return f"tool:{tool_name}:{hashlib.md5(encoded.encode()).hexdigest()}"
+
+
+class ToolResultCache:
+    """Tool outputs keyed on tool name plus normalized input, with the backend's TTL
+
+    Identical calls that arrive while one is running (e.g. two tool calls in the same agent
+    step) share its result. Failed calls and outputs that aren't JSON serializable are not cached.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._flight = SingleFlight()
+
+    @property
+    def stats(self):
+        return self.backend.stats
+
+    def run(self, tool_name: str, tool_input: Any, fn: Callable[[], Any]) -> Any:
+        key = tool_cache_key(tool_name, tool_input)
+        cached = self.backend.get(key)
+        if cached is not None:
+            return cached
+
+        def call():
+            result = fn()
+            if result is not None:
+                try:
+                    self.backend.set(key, result)
+                except (TypeError, ValueError):
+                    logger.info("Not caching %s output (not JSON serializable)", tool_name)
+            return result
+
+        result, _ = self._flight.do(key, call)
+        return result
+
+
+_tool_cache = None
+_tool_cache_created = False
+_tool_cache_lock = threading.Lock()
+
+
+def create_tool_cache_from_env() -> Optional[ToolResultCache]:
+    """Build the tool cache from TOOL_CACHE_* environment variables"""
+    if os.getenv("ENABLE_TOOL_CACHE", "true").lower() in ("false", "0", "no"):
+        return None
+
+    # Search results go stale faster than model responses to the same prompt
+    ttl = float(os.getenv("TOOL_CACHE_TTL", "21600")) or None
+    max_entries = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1000"))
+    path = os.getenv("TOOL_CACHE_PATH", DEFAULT_TOOL_CACHE_PATH)
+    try:
+        backend = SQLiteCache(path, max_entries=max_entries, max_bytes=64 * 1024 * 1024, ttl=ttl)
+    except sqlite3.Error as e:
+        logger.warning("Could not open tool cache at %s (%s), using in-memory cache", path, e)
+        backend = MemoryCache(max_entries=max_entries, ttl=ttl)
+    return ToolResultCache(backend)
+
+
+def get_tool_cache() -> Optional[ToolResultCache]:
+    """Return the process-wide tool cache (None when ENABLE_TOOL_CACHE is off)"""
+    global _tool_cache, _tool_cache_created
+    with _tool_cache_lock:
+        if not _tool_cache_created:
+            _tool_cache = create_tool_cache_from_env()
+            _tool_cache_created = True
+        return _tool_cache
+
+
+def message_tokens(message) -> int:
+    """Estimated tokens of a LangChain message, tool call arguments included"""
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, default=str)
+    tool_calls = getattr(message, "tool_calls", None)
+    return estimate_tokens(content) + (estimate_tokens(json.dumps(tool_calls, default=str)) if tool_calls else 0)
+
+
+def window_messages(messages: Sequence[Any], max_tokens: int) -> List[Any]:
+    """The most recent conversation turns that fit in max_tokens
+
+    The current turn (from the latest human message on, with its tool calls and results) is
+    always kept whole. Earlier turns are added newest first and only whole, so a tool call
+    is never separated from its result.
+    """
+    starts = [i for i, message in enumerate(messages) if message.type == "human"]
+    if not starts:
+        return list(messages)
+
+    kept = list(messages[starts[-1]:])
+    budget = max_tokens - sum(message_tokens(message) for message in kept)
+    for start, end in reversed(list(zip(starts, starts[1:]))):
+        turn = list(messages[start:end])
+        cost = sum(message_tokens(message) for message in turn)
+        if cost > budget:
+            break
+        kept = turn + kept
+        budget -= cost
+    return kept
@@ -1,43 +1,36 @@
 import os
 import json
 import streamlit as st
-import requests
 import time 
-import random  
-import hashlib 
-from datetime import datetime, timedelta 
-from typing import Dict, List, Optional, Any
+from datetime import datetime
+from functools import partial
 import logging
-import traceback
-from dotenv import load_dotenv
-from io import BytesIO
-from PyPDF2 import PdfReader
-import ibm_boto3
-from ibm_botocore.client import Config
-from ibm_botocore.exceptions import ClientError
-
-# Load environment variables
-load_dotenv()
-
-# Config
-API_KEY = os.getenv("API_KEY")
-DEPLOYMENT_ID = os.getenv("DEPLOYMENT_ID")
-COS_API_KEY = os.getenv("COS_API_KEY")
-COS_INSTANCE_ID = os.getenv("COS_INSTANCE_ID")
-COS_ENDPOINT = os.getenv("COS_ENDPOINT")
-COS_BUCKET = os.getenv("COS_BUCKET")
+from settings import get_settings
+from response_cache import get_response_cache
+from rate_limiter import get_rate_limiter
+from endpoint_pool import get_endpoint_pool
+from adaptive_limit import adaptive_limiters
+from response_handlers import parse_response
+from pdf_extract import extract_pdf_text, memo_size_bytes
+from chunking import estimate_tokens
+from upload_queue import get_upload_queue
+from jobs import QUEUED, WAITING, RUNNING, DONE, FAILED, CANCELLED, get_job_manager
+from tracing import tracer
+from library_import import ImportStats, iter_references, process_references
+from prompt_compaction import compact_payload, compaction_enabled
+from pipeline import SECTION_TYPES, generate_output, index_output, local_citations, output_filename, store_output
+from output_index import backfill_from_cos, get_output_index
+from cos_storage import get_cos_bucket, get_cos_client
+from result_store import ResearchOutput, get_blob_store
+from memory_report import format_bytes, session_breakdown, total_size
+
+# Config: .env is loaded and parsed on the first run only, reruns reuse it
+settings = get_settings()
+API_KEY = settings.api_key
+DEPLOYMENT_ID = settings.deployment_id
 
 # Basic validation
-required_vars = [
-    ("API_KEY", API_KEY), 
-    ("DEPLOYMENT_ID", DEPLOYMENT_ID),
-    ("COS_API_KEY", COS_API_KEY),
-    ("COS_INSTANCE_ID", COS_INSTANCE_ID),
-    ("COS_ENDPOINT", COS_ENDPOINT),
-    ("COS_BUCKET", COS_BUCKET)
-]
-
-missing_vars = [name for name, value in required_vars if not value]
+missing_vars = settings.missing()
 if missing_vars:
     st.error(f"❌ The following environment variables are missing: {', '.join(missing_vars)}")
     st.info("Please add them to your .env file with the following format:")
@@ -49,376 +42,175 @@ if missing_vars:
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Simple in-memory cache
-request_cache = {}
-
-# IBM Watson ML Client with rate limit handling
-class IBMWatsonMLClient:
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.iam_token_url = "https://iam.cloud.ibm.com/identity/token"
-        self.base_url = "https://us-south.ml.cloud.ibm.com/ml/v1"
-        self.access_token = None
-        self.token_expiry = datetime.now()
-        
-        # Rate limiting components
-        self.max_retries = 5
-        self.base_delay = 2  # Base delay in seconds
-        self.max_delay = 60  # Maximum delay in seconds
-        
-        # Track requests for rate limiting
-        self.requests_this_minute = []
-        self.requests_this_hour = []
-
-    def authenticate(self) -> str:
-        """Authenticate with IBM Cloud and get access token"""
-        try:
-            headers = {"Content-Type": "application/x-www-form-urlencoded"}
-            data = {
-                "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
-                "apikey": self.api_key
-            }
-            response = requests.post(self.iam_token_url, headers=headers, data=data)
-            response.raise_for_status()
-            
-            auth_data = response.json()
-            self.access_token = auth_data.get('access_token')
-            
-            # Set token expiry time (usually 1 hour, but subtract 5 min for safety)
-            expires_in = auth_data.get('expires_in', 3600)
-            self.token_expiry = datetime.now() + timedelta(seconds=expires_in - 300)
-            
-            return self.access_token
-        except Exception as e:
-            st.error(f"Authentication error: {str(e)}")
-            raise
-
-    def is_token_valid(self):
-        """Check if the current token is valid"""
-        return self.access_token and datetime.now() < self.token_expiry
-    
-    def clean_request_tracking(self):
-        """Remove old timestamps from request tracking"""
-        now = datetime.now()
-        minute_ago = now - timedelta(minutes=1)
-        hour_ago = now - timedelta(hours=1)
-        
-        self.requests_this_minute = [t for t in self.requests_this_minute if t > minute_ago]
-        self.requests_this_hour = [t for t in self.requests_this_hour if t > hour_ago]
-    
-    def check_rate_limits(self):
-        """Check if we're hitting rate limits"""
-        self.clean_request_tracking()
-        max_per_minute = 5
-        max_per_hour = 100
-        
-        return {
-            "minute_exceeded": len(self.requests_this_minute) >= max_per_minute,
-            "hour_exceeded": len(self.requests_this_hour) >= max_per_hour,
-            "wait_time": self.calculate_wait_time(self.requests_this_minute, max_per_minute, 60)
-        }
-    
-    def calculate_wait_time(self, requests, max_requests, window_seconds):
-        """Calculate how long to wait before next request"""
-        if not requests or len(requests) < max_requests:
-            return 0
-            
-        # Calculate time until oldest request leaves the window
-        oldest = requests[0]
-        wait_seconds = (oldest + timedelta(seconds=window_seconds) - datetime.now()).total_seconds()
-        return max(0, wait_seconds + 0.1)  # Add a small buffer
-    
-    def record_request(self):
-        """Record this request for rate limiting"""
-        now = datetime.now()
-        self.requests_this_minute.append(now)
-        self.requests_this_hour.append(now)
-
-    def chat_completion(self, deployment_id: str, messages: List[Dict[str, str]], 
-                        stream: bool = False, version: str = "2021-05-01"):
-        """Send a request to the Watson ML chat API with rate limit handling"""
-        # Check cache first (only for non-streaming requests)
-        if not deployment_id:
-            raise ValueError("deployment_id cannot be None")
-        if not stream:
-            cache_key = hashlib.md5(json.dumps(messages, sort_keys=True).encode()).hexdigest()
-            if cache_key in request_cache:
-                logger.info("Using cached response")
-                return request_cache[cache_key]
-        
-        # Check rate limits
-        rate_limits = self.check_rate_limits()
-        if rate_limits["minute_exceeded"]:
-            wait_time = rate_limits["wait_time"]
-            if wait_time > 0:
-                # Show wait time in UI
-                progress_bar = st.progress(0)
-                message = st.empty()
-                
-                for i in range(int(wait_time) + 1):
-                    progress = i / wait_time
-                    message.info(f"⏳ Rate limit reached. Waiting {wait_time - i:.1f} seconds...")
-                    progress_bar.progress(progress)
-                    time.sleep(1)
-                    
-                message.empty()
-                progress_bar.empty()
-        
-        # Ensure we have a valid token
-        if not self.is_token_valid():
-            self.authenticate()
-            
-        # Select the appropriate endpoint
-        if stream:
-            endpoint = "text/generation_stream"
-        else:
-            endpoint = "text/generation"
-            
-        url = f"{self.base_url}/deployments/{deployment_id}/{endpoint}"
-        
-        # Execute the request with retries and backoff
-        for attempt in range(self.max_retries):
-            try:
-                # Prepare headers
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.access_token}",
-                    "Accept": "application/json"
-                }
-                
-                # Make the request
-                response = requests.post(
-                    url, 
-                    headers=headers, 
-                    params={"version": version}, 
-                    json={"messages": messages},
-                    stream=stream
-                )
-                
-                # Record this request for rate limiting
-                self.record_request()
-                
-                # Handle specific status codes
-                if response.status_code == 429:  # Too Many Requests
-                    retry_after = int(response.headers.get('Retry-After', self.base_delay * (2 ** attempt)))
-                    wait_time = min(retry_after + random.uniform(0.1, 1.0), self.max_delay)
-                    
-                    if attempt < self.max_retries - 1:
-                        # Show wait message
-                        st.warning(f"⏳ Rate limit exceeded. Waiting {wait_time:.1f} seconds before retry {attempt+1}/{self.max_retries}...")
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        st.error(f"❌ Rate limit exceeded after {self.max_retries} retries. Please try again later.")
-                        raise Exception("Rate limit exceeded after multiple retries")
-                
-                elif response.status_code == 401:  # Unauthorized
-                    # Token might be expired, refresh and retry
-                    self.authenticate()
-                    continue
-                
-                # For any other error, raise it
-                response.raise_for_status()
-                
-                # Success! Process and cache the response if non-streaming
-                if not stream:
-                    result = response.json()
-                    request_cache[cache_key] = result  # Cache the result
-                    return result
-                else:
-                    return response
-                
-            except requests.exceptions.HTTPError as e:
-                # Already handled 429 and 401 above
-                if e.response.status_code not in (429, 401):
-                    error_msg = str(e)
-                    try:
-                        error_json = e.response.json()
-                        if 'error' in error_json:
-                            error_msg = f"{error_msg} - {error_json['error']}"
-                    except:
-                        pass
-                    
-                    st.error(f"API error: {error_msg}")
-                    
-                    # If we're out of retries, raise the error
-                    if attempt >= self.max_retries - 1:
-                        raise
-                    
-                    # Otherwise backoff and retry
-                    wait_time = min(self.base_delay * (2 ** attempt) + random.uniform(0.1, 1.0), self.max_delay)
-                    time.sleep(wait_time)
-                    
-            except Exception as e:
-                st.error(f"Request error: {str(e)}")
-                if attempt >= self.max_retries - 1:
-                    raise
-                
-                wait_time = min(self.base_delay * (2 ** attempt) + random.uniform(0.1, 1.0), self.max_delay)
-                time.sleep(wait_time)
-        
-        # If we get here, all retries failed
-        raise Exception(f"Failed after {self.max_retries} attempts")
-
-# Cloud Object Storage functions
-def get_cos_client():
-    """Get IBM COS client"""
-    try:
-        if not COS_API_KEY or not COS_INSTANCE_ID:
-            return None
-            
-        cos = ibm_boto3.client("s3",
-            ibm_api_key_id=COS_API_KEY,
-            ibm_service_instance_id=COS_INSTANCE_ID,
-            config=Config(signature_version="oauth"),
-            endpoint_url=COS_ENDPOINT
+# Process-wide response cache (survives reruns; on-disk backend survives restarts)
+response_cache = get_response_cache()
+semantic_cache = None
+if settings.semantic_cache:
+    # Only pay for the NumPy import when the semantic cache is on
+    from semantic_cache import get_semantic_cache
+    semantic_cache = get_semantic_cache(response_cache)
+
+CHUNK_MAX_TOKENS = settings.chunk_max_tokens
+LIBRARY_OUTPUT_DIR = settings.library_output_dir
+
+def get_client():
+    """This session's watsonx.ai client, built on first use so the first render doesn't wait on it"""
+    if 'client' not in st.session_state:
+        # Pulls in requests and the IAM/HTTP machinery
+        from watson_client import IBMWatsonMLClient
+        st.session_state.client = IBMWatsonMLClient(api_key=API_KEY, cache=response_cache,
+                                                    semantic_cache=semantic_cache, pool=get_endpoint_pool())
+    return st.session_state.client
+
+def run_generation(job, client, payload, selected_section, draft_all_sections, use_streaming, title,
+                   citations=None):
+    """Background job behind the Generate button; never touches the page, only `job`"""
+    # Rate-limit waits and retry backoff report to the job and stop when it's cancelled
+    client = client.bind(on_status=job.update, cancel_event=job.cancel_event)
+    content = generate_output(job, client, str(DEPLOYMENT_ID), payload, selected_section=selected_section,
+                              draft_all_sections=draft_all_sections, use_streaming=use_streaming,
+                              citations=citations, max_tokens=CHUNK_MAX_TOKENS)
+
+    # Save to Cloud Object Storage in the background, and to the local search index
+    filename = output_filename(title)
+    if store_output(filename, payload, content):
+        job.update(message=f"Research output generated and queued for Cloud Object Storage as '{filename}'.")
+    else:
+        job.update(message="Research output generated but could not be saved to Cloud Object Storage.")
+    return content
+
+def run_library_import(job, client, data, filename, research_question, section_type):
+    """Background job behind the library import; results are appended to a JSONL file as they arrive"""
+    client = client.bind(on_status=job.update, cancel_event=job.cancel_event)
+    os.makedirs(LIBRARY_OUTPUT_DIR, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(filename))[0].replace(' ', '_')[:30]
+    path = os.path.join(LIBRARY_OUTPUT_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{stem}.jsonl")
+
+    def show_progress(stats):
+        job.update(message=f"📚 {stats.done + stats.failed}/{stats.submitted} papers processed, "
+                           f"{stats.duplicates} duplicates skipped")
+
+    def index_result(record):
+        index_output(f"library/{os.path.basename(path)}/{record['index']}", record)
+
+    with open(path, "w", encoding="utf-8") as out:
+        stats = process_references(
+            client, str(DEPLOYMENT_ID), iter_references(data, filename), out, parse_response,
+            research_question=research_question, section_type=section_type,
+            on_progress=show_progress, cancel_event=job.cancel_event, stats=ImportStats(path),
+            on_result=index_result
         )
-        return cos
-    except Exception as e:
-        st.error(f"Error creating COS client: {str(e)}")
-        return None
-
-def ensure_bucket_exists(cos_client, bucket_name):
-    """Create bucket if it doesn't exist"""
-    try:
-        # Check if the bucket exists
-        cos_client.head_bucket(Bucket=bucket_name)
-        return True
-    except ClientError as e:
-        # If a client error is thrown, check if it's a 404 error.
-        if e.response.get('Error', {}).get('Code') == '404':
-            try:
-                # Create the bucket
-                location_constraint = 'us-south-standard'
-                cos_client.create_bucket(
-                    Bucket=bucket_name,
-                    CreateBucketConfiguration={
-                        'LocationConstraint': location_constraint
-                    }
-                )
-                return True
-            except Exception as create_e:
-                st.error(f"Error creating bucket: {str(create_e)}")
-                return False
-        else:
-            st.error(f"Error checking bucket: {str(e)}")
-            return False
-    except Exception as e:
-        st.error(f"Unexpected error with bucket {bucket_name}: {str(e)}")
-        return False
-
-def upload_to_cos(filename: str, data: str, max_retries=3):
-    """Upload data to IBM Cloud Object Storage with retries"""
+    job.check_cancelled()
+    job.update(message=f"📚 {stats.done} papers processed ({stats.failed} failed, "
+                       f"{stats.duplicates} duplicates, {stats.skipped} without a title).")
+    return stats
+
+def run_cos_backfill(job):
+    """Background job: add outputs already in Cloud Object Storage to the local search index"""
     cos_client = get_cos_client()
-    if not cos_client:
-        return False
-        
-    for attempt in range(max_retries):
-        try:
-            # Ensure bucket exists
-            if not ensure_bucket_exists(cos_client, COS_BUCKET):
-                return False
-            
-            # Upload the file
-            cos_client.put_object(
-                Bucket=COS_BUCKET, 
-                Key=filename, 
-                Body=data.encode('utf-8')
-            )
-            return True
-        except Exception as e:
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)  # Exponential backoff
+    if cos_client is None:
+        raise Exception("Cloud Object Storage is not configured")
+
+    def show_progress(stats):
+        job.update(message=f"☁️ {stats.listed} objects listed, {stats.indexed} outputs indexed, "
+                           f"{stats.skipped} already indexed")
+
+    stats = backfill_from_cos(get_output_index(), cos_client, get_cos_bucket(),
+                              on_progress=show_progress, cancel_event=job.cancel_event)
+    job.check_cancelled()
+    job.update(message=f"☁️ Indexed {stats.indexed} outputs from {stats.downloaded} objects "
+                       f"({stats.skipped} already indexed, {stats.failed} failed).")
+    return stats
+
+JOB_ICONS = {QUEUED: "🕒", WAITING: "⏳", RUNNING: "⚙️", DONE: "✅", FAILED: "❌", CANCELLED: "🚫"}
+JOBS_SHOWN = 5
+
+def show_jobs():
+    """This session's generation jobs; polled while any of them is still active"""
+    manager = get_job_manager()
+    for job_id in reversed(st.session_state.jobs[-JOBS_SHOWN:]):
+        job = manager.get(job_id)
+        if job is None:
+            continue
+        icon = JOB_ICONS[job.state]
+
+        if job.finished:
+            if job_id not in st.session_state.collected_jobs:
+                st.session_state.collected_jobs.add(job_id)
+                if job.state == DONE and isinstance(job.result, dict):
+                    st.session_state.research_output = ResearchOutput.from_dict(job.result)
+                    job.result = None  # the session's compact copy is the only one needed now
+                # Redraw the whole page so the output tabs pick up the result
+                st.rerun()
+
+            if job.state == DONE:
+                st.success(f"{icon} **{job.label}**: {job.message}")
+                if isinstance(job.result, ImportStats) and os.path.exists(job.result.output_path):
+                    with open(job.result.output_path, "rb") as f:
+                        st.download_button("⬇️ Download Results JSONL", f,
+                                           file_name=os.path.basename(job.result.output_path),
+                                           key=f"download_{job.id}")
+            elif job.state == CANCELLED:
+                st.info(f"{icon} **{job.label}**: {job.message}")
+            elif "429" in job.error or "Too Many Requests" in job.error or "Rate limit" in job.error:
+                st.error(f"{icon} **{job.label}**: Rate limit exceeded. {job.error}")
+                st.info("Tips to avoid rate limits: space out your requests, use smaller inputs, or try again later.")
             else:
-                st.error(f"COS upload error after {max_retries} attempts: {str(e)}")
-                return False
-
-# Response handlers
-def handle_streaming_response(response):
-    """Process a streaming response from the API"""
-    stream_container = st.empty()
-    full_content = ""
-    
-    try:
-        for chunk in response.iter_content(chunk_size=1024):
-            if chunk:
-                try:
-                    # Try to decode as JSON
-                    chunk_str = chunk.decode('utf-8')
-                    if chunk_str.startswith('data:'):
-                        # Handle SSE format
-                        json_str = chunk_str.replace('data:', '').strip()
-                        data = json.loads(json_str)
-                        text_chunk = data.get('results', [{}])[0].get('generated_text', '')
-                    else:
-                        # Try parsing as direct JSON
-                        data = json.loads(chunk_str)
-                        text_chunk = data.get('results', [{}])[0].get('generated_text', '')
-                except:
-                    # If parsing fails, just use the raw chunk
-                    text_chunk = chunk.decode('utf-8', errors='replace')
-                
-                full_content += text_chunk
-                stream_container.markdown(full_content)
-    except Exception as e:
-        st.error(f"Error processing streaming response: {str(e)}")
-        logger.error(traceback.format_exc())
-    
-    # Try to parse as JSON
-    try:
-        return json.loads(full_content)
-    except:
-        # Return as raw content if not JSON
-        return {"raw_content": full_content}
-
-def parse_response(response):
-    """Parse the non-streaming response"""
-    try:
-        # Extract the generated text from the response
-        if 'results' in response and len(response['results']) > 0:
-            content = response['results'][0].get('generated_text', '')
-        else:
-            content = str(response)
-        
-        # Try to parse as JSON
-        try:
-            return json.loads(content)
-        except:
-            # If not valid JSON, check if there's a JSON block in markdown
-            if "```json" in content and "```" in content.split("```json", 1)[1]:
-                json_block = content.split("```json", 1)[1].split("```", 1)[0].strip()
-                try:
-                    return json.loads(json_block)
-                except:
-                    pass
-            
-            # Return raw content if parsing fails
-            return {"raw_content": content}
-    except Exception as e:
-        st.error(f"Error parsing response: {str(e)}")
-        return {"error": str(e)}
+                st.error(f"{icon} **{job.label}**: {job.error}")
+            for warning in job.warnings:
+                st.warning(warning)
+            continue
+
+        # Show fields in the output tabs as soon as they have streamed in
+        if job.partial_result:
+            filled = sum(1 for value in job.partial_result.values() if value)
+            if filled > st.session_state.partial_fields.get(job_id, 0):
+                st.session_state.partial_fields[job_id] = filled
+                st.session_state.research_output = ResearchOutput.from_dict(job.partial_result)
+                st.rerun()
+
+        col1, col2 = st.columns([5, 1])
+        col1.info(f"{icon} **{job.label}** ({job.state}): {job.message}")
+        if col2.button("✖️ Cancel", key=f"cancel_{job.id}"):
+            manager.cancel(job.id)
+        if job.progress is not None:
+            st.progress(job.progress)
+        if job.partial_text:
+            st.markdown(job.partial_text)
 
 # Streamlit UI
 st.set_page_config(page_title="IBM Research Assistant", layout="wide")
 st.title("🔬 IBM Agentic Research Assistant")
 
 if 'research_output' not in st.session_state:
-    st.session_state.research_output = {}
+    st.session_state.research_output = ResearchOutput()
 
-if 'client' not in st.session_state:
-    if API_KEY:
-        st.session_state.client = IBMWatsonMLClient(api_key=API_KEY)
-    else:
-        st.error("❌ API_KEY is missing. Please check your environment variables.")
-        st.stop()
+# IDs of this session's background jobs, oldest first
+if 'jobs' not in st.session_state:
+    st.session_state.jobs = []
+    st.session_state.collected_jobs = set()
+    st.session_state.partial_fields = {}  # job ID -> output fields already shown while streaming
 
 # File Upload
 uploaded_file = st.sidebar.file_uploader("📄 Upload Academic Paper (PDF/Text)", type=["pdf", "txt"])
 if uploaded_file:
     if uploaded_file.type == "application/pdf":
+        col1, col2 = st.sidebar.columns(2)
+        first_page = col1.number_input("First page", min_value=1, value=1)
+        last_page = col2.number_input("Last page", min_value=1, value=2,
+                                      help="Extracting the whole paper? Set this to the last page.")
         try:
-            reader = PdfReader(uploaded_file)
-            abstract = "\n".join([page.extract_text() for page in reader.pages[:2]])
+            # Memoized on the file's hash, so reruns don't re-extract
+            extraction = extract_pdf_text(uploaded_file.getvalue(), int(first_page), int(last_page))
+            # Running headers, page numbers and the reference list only cost tokens
+            abstract = extraction.clean_text if compaction_enabled() else extraction.text
+            with st.sidebar.expander(f"⏱️ Extracted {len(extraction.pages)} of {extraction.page_count} pages"):
+                st.caption(f"Total extraction time: {extraction.total_seconds:.2f}s")
+                if compaction_enabled():
+                    saved = estimate_tokens(extraction.text) - estimate_tokens(abstract)
+                    st.caption(f"✂️ Cleanup removed ~{saved:,} tokens of boilerplate and whitespace")
+                for page_no, seconds in extraction.timings:
+                    st.text(f"Page {page_no}: {seconds * 1000:.0f} ms")
         except Exception as e:
             st.sidebar.error(f"Error extracting PDF text: {str(e)}")
             abstract = ""
@@ -435,6 +227,27 @@ else:
 # Streaming option
 use_streaming = st.sidebar.checkbox("Enable streaming responses", value=False)
 
+# Earlier outputs, searchable without a new Watson call
+output_index = get_output_index()
+if output_index is not None:
+    with st.sidebar.expander("🔎 Search Past Outputs"):
+        search_query = st.text_input("Title, author, DOI or any text", key="output_search")
+        if search_query:
+            started = time.perf_counter()
+            hits = output_index.search(search_query, limit=10)
+            st.caption(f"{len(hits)} result(s) in {(time.perf_counter() - started) * 1000:.1f} ms")
+            for hit in hits:
+                st.markdown(f"**{hit.title}**" + (f" ({hit.year})" if hit.year else ""))
+                if hit.snippet:
+                    st.caption(hit.snippet.replace("\n", " "))
+                if st.button("📂 Open", key=f"open_{hit.key}"):
+                    st.session_state.research_output = ResearchOutput.from_dict(output_index.get(hit.key))
+                    st.rerun()
+        st.caption(f"{len(output_index):,} outputs indexed")
+        if st.button("☁️ Index Outputs in Cloud Storage"):
+            job = get_job_manager().submit(run_cos_backfill, label="Indexing Cloud Object Storage")
+            st.session_state.jobs.append(job.id)
+
 # Rate limit information
 with st.sidebar.expander("ℹ️ Rate Limit Information"):
     st.info("""
@@ -445,7 +258,7 @@ with st.sidebar.expander("ℹ️ Rate Limit Information"):
     If you encounter "Too Many Requests" errors, this application will:
     1. Automatically wait and retry
     2. Use caching to avoid repeat requests
-    3. Show a progress indicator during wait periods
+    3. Show the wait in the job status, where it can be cancelled
     
     For best results, space out your requests and avoid rapid submissions.
     """)
@@ -477,21 +290,55 @@ with tab1:
     year = st.number_input("Year", min_value=1900, max_value=datetime.now().year, value=st.session_state.get('year', 2023))
     doi = st.text_input("DOI/URL", value=st.session_state.get('doi', ''))
     research_q = st.text_area("Research Question", value=st.session_state.get('research_q', ''))
-    section_type = st.selectbox("Section", ["Introduction", "Related Work", "Methodology"], index=["Introduction", "Related Work", "Methodology"].index(st.session_state.get('section_type', "Introduction")))
+    section_type = st.selectbox("Section", SECTION_TYPES, index=SECTION_TYPES.index(st.session_state.get('section_type', "Introduction")))
     section_topic = st.text_input("Topic for Section Draft", value=st.session_state.get('section_topic', ''))
+    draft_all_sections = st.checkbox("Draft all sections in one batch", value=False,
+                                     help="Sends one request per section concurrently instead of one after another")
 
     # Add these status indicators for request monitoring
     with st.expander("🔄 API Status"):
         col1, col2 = st.columns(2)
+        # Shared by every session's client, so there's no need to build one here
+        limiter = get_rate_limiter()
         with col1:
-            st.metric("Rate Limit Status", "Normal", delta="Available")
+            wait_time = limiter.wait_time()
+            if wait_time > 0:
+                st.metric("Rate Limit Status", "Throttled", delta=f"next slot in {wait_time:.0f}s", delta_color="inverse")
+            else:
+                st.metric("Rate Limit Status", "Normal", delta="Available")
         with col2:
-            if 'client' in st.session_state:
-                client = st.session_state.client
-                client.clean_request_tracking()
-                st.metric("Requests (Last Minute)", len(client.requests_this_minute), delta=f"{5-len(client.requests_this_minute)} remaining")
+            recent = limiter.requests_last_minute()
+            st.metric("Requests (Last Minute)", recent, delta=f"{max(0, int(limiter.per_minute) - recent)} remaining")
+
+        # Limits learned from the service's 429s (ADAPTIVE_RATE_LIMIT)
+        for key, adaptive in adaptive_limiters().items():
+            learned = adaptive.as_dict()
+            phase = "probing" if learned['slow_start'] else f"{learned['decreases']} backoffs"
+            st.caption(f"📈 {key.split('@')[0]}: {learned['per_minute']:.0f} requests/min, "
+                       f"{learned['concurrency']} at once ({phase})")
+
+        # Several regions/deployments configured: show where requests are going
+        endpoint_pool = get_endpoint_pool()
+        if endpoint_pool is not None:
+            for stats in endpoint_pool.stats():
+                latency = f"{stats['ewma_latency_ms']:.0f} ms" if stats['ewma_latency_ms'] is not None else "no data"
+                state = "🟢" if stats['healthy'] else f"🔴 back in {stats['ready_in_s']:.0f}s"
+                st.caption(f"{state} **{stats['name']}**: {latency}, {stats['successes']}/{stats['requests']} ok, "
+                           f"{stats['throttled']} throttled, {stats['requests_last_minute']} in the last minute")
+
+    # Same paper processed before: open that output instead of waiting on Watson again
+    previous_key = output_index.find(doi=doi, title=title) if output_index is not None else None
+    if previous_key:
+        st.info(f"📂 This paper has been processed before ({previous_key}).")
+        if st.button("📂 Open Previous Result"):
+            st.session_state.research_output = ResearchOutput.from_dict(output_index.get(previous_key))
+            st.rerun()
 
     if st.button("🧠 Generate Output"):
+        if not DEPLOYMENT_ID:
+            st.error("Deployment ID is missing. Please check your environment variables.")
+            st.stop()
+
         # Prepare the payload for the model - exactly as your template expects
         payload = {
             "text": abstract,
@@ -508,91 +355,73 @@ with tab1:
                 "topic": section_topic
             }
         }
-        
-        # Send as a user message - your prompt template is already deployed
-        messages = [{"role": "user", "content": json.dumps(payload)}]
 
-        try:
-            with st.spinner("Generating research insights..."):
-                # Use the enhanced client with rate limit handling
-                if use_streaming:
-                    # Use streaming API
-                    try:
-                        if not DEPLOYMENT_ID:
-                            st.error("Deployment ID is missing. Please check your environment variables.")
-                            st.stop()
-
-                        response = st.session_state.client.chat_completion(
-                            deployment_id=str(DEPLOYMENT_ID),
-                            messages=messages,
-                            stream=True
-                        )
-                        content = handle_streaming_response(response)
-                    except Exception as e:
-                        st.error(f"Streaming API failed: {str(e)}. Falling back to regular API.")
-                        use_streaming = False
-
-                        if not DEPLOYMENT_ID:
-                            st.error("Deployment ID is missing. Please check your environment variables.")
-                            st.stop()
-                        # Fallback to non-streaming
-                        response = st.session_state.client.chat_completion(
-                            deployment_id=str(DEPLOYMENT_ID),
-                            messages=messages,
-                            stream=False
-                        )
-                        content = parse_response(response)
-                else:
-                    # Use regular API
-                    if not DEPLOYMENT_ID:
-                        st.error("Deployment ID is missing. Please check your environment variables.")
-                        st.stop()
-                    response = st.session_state.client.chat_completion(
-                        deployment_id=str(DEPLOYMENT_ID),
-                        messages=messages,
-                        stream=False
-                    )
-                    content = parse_response(response)
-                
-                # Store the result
-                st.session_state.research_output = content
-                
-                # Save to Cloud Object Storage
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"{timestamp}_{title.replace(' ', '_')[:30]}.json"
-                
-                success = upload_to_cos(filename, json.dumps(content, indent=2))
-                
-                if success:
-                    st.success(f"✅ Research output generated and saved to Cloud Object Storage as '{filename}'.")
-                else:
-                    st.warning("✅ Research output generated but could not be saved to Cloud Object Storage.")
-                
-        except Exception as e:
-            error_msg = str(e)
-            
-            if "429" in error_msg or "Too Many Requests" in error_msg:
-                st.error("❌ Rate limit exceeded. The system will automatically retry after waiting.")
-                st.info("Tips to avoid rate limits: space out your requests, use smaller inputs, or try again later.")
-            else:
-                st.error(f"❌ Error: {error_msg}")
-                st.error(traceback.format_exc())
+        # Citations are formatted locally, so they show up before the model has answered
+        citations = local_citations(payload["metadata"])
+        if citations:
+            st.session_state.research_output = ResearchOutput(citations=citations)
+
+        # Normalized text and no empty fields: fewer input tokens, faster responses
+        payload, st.session_state.compaction = compact_payload(payload)
+
+        # Runs in the background; the page stays responsive and polls the job below
+        job = get_job_manager().submit(
+            partial(run_generation, client=get_client(), payload=payload,
+                    selected_section=section_type, draft_all_sections=draft_all_sections,
+                    use_streaming=use_streaming, title=title, citations=citations),
+            label=title or section_topic or "Research output"
+        )
+        st.session_state.jobs.append(job.id)
+
+    report = st.session_state.get("compaction")
+    if report is not None and report.tokens_saved > 0:
+        st.caption(f"✂️ Last prompt: ~{report.tokens_after:,} input tokens "
+                   f"(~{report.tokens_saved:,} saved by compaction, {report.ratio_saved:.0%})")
+
+    # Bulk mode: every paper in a reference library, using the research question and section above
+    with st.expander("📚 Bulk Import (BibTeX / RIS / CSV)"):
+        library_file = st.file_uploader("Reference library", type=["bib", "ris", "csv"])
+        st.caption("Duplicates (same DOI or near-identical title) are skipped. Results are written "
+                   "as JSON lines while the papers are processed.")
+        if library_file and st.button("🚀 Process Library"):
+            if not DEPLOYMENT_ID:
+                st.error("Deployment ID is missing. Please check your environment variables.")
+                st.stop()
+            job = get_job_manager().submit(
+                partial(run_library_import, client=get_client(), data=library_file.getvalue(),
+                        filename=library_file.name, research_question=research_q, section_type=section_type),
+                label=f"Library: {library_file.name}"
+            )
+            st.session_state.jobs.append(job.id)
+
+    if st.session_state.jobs:
+        manager = get_job_manager()
+        active = any(
+            manager.get(job_id) is not None and not manager.get(job_id).finished
+            for job_id in st.session_state.jobs
+        )
+        st.fragment(show_jobs, run_every=1.0 if active else None)()
 
 with tab2:
     st.subheader("Summary & Citations")
-    if st.session_state.research_output:
-        if "raw_content" in st.session_state.research_output:
-            st.text_area("Raw Response", st.session_state.research_output["raw_content"], height=400)
+    output = st.session_state.research_output
+    if output:
+        if output.is_raw:
+            st.text_area("Raw Response", output.raw_content or "", height=400)
         else:
             st.markdown("### 📌 Summary")
-            for point in st.session_state.research_output.get("summary", []):
+            for point in output.summary:
                 st.markdown(f"- {point}")
 
             st.markdown("### 📚 Citations")
-            citations = st.session_state.research_output.get("citations", {})
+            citations = output.citations or {}
             if isinstance(citations, dict):
                 for style, citation in citations.items():
-                    st.markdown(f"**{style}:** {citation}")
+                    if style == "BibTeX":
+                        st.markdown(f"**{style}:**")
+                        st.code(citation, language="latex")
+                    else:
+                        st.markdown(f"**{style}:** {citation}")
             elif isinstance(citations, str):
                 st.markdown(citations)
             else:
@@ -600,42 +429,115 @@ with tab2:
 
 
             st.download_button("⬇️ Download Citations JSON", 
-                              json.dumps(st.session_state.research_output.get("citations", {}), indent=2), 
+                              json.dumps(citations, indent=2), 
                               file_name="citations.json")
     else:
         st.info("Generate research output first.")
 
 with tab3:
     st.subheader("Hypotheses")
-    if st.session_state.research_output:
-        if "raw_content" in st.session_state.research_output:
+    output = st.session_state.research_output
+    if output:
+        if output.is_raw:
             st.info("Please check the Summary tab for the raw response.")
         else:
-            st.markdown(st.session_state.research_output.get("hypotheses", "No hypotheses found."))
+            st.markdown(output.hypotheses or "No hypotheses found.")
     else:
         st.info("Generate research output first.")
 
 with tab4:
     st.subheader("Section Draft")
-    if st.session_state.research_output:
-        if "raw_content" in st.session_state.research_output:
+    output = st.session_state.research_output
+    if output:
+        if output.is_raw:
             st.info("Please check the Summary tab for the raw response.")
         else:
-            draft = st.session_state.research_output.get("section_draft", "")
-            st.text_area("Generated Draft", draft, height=300)
-            st.download_button("⬇️ Download Draft", draft, file_name="section_draft.txt")
+            section_drafts = output.section_drafts
+            if section_drafts:
+                for section, draft in section_drafts.items():
+                    with st.expander(section, expanded=True):
+                        st.text_area(f"{section} Draft", draft, height=300)
+                        st.download_button("⬇️ Download Draft", draft,
+                                           file_name=f"{section.lower().replace(' ', '_')}_draft.txt",
+                                           key=f"download_{section}")
+            else:
+                draft = output.section_draft or ""
+                st.text_area("Generated Draft", draft, height=300)
+                st.download_button("⬇️ Download Draft", draft, file_name="section_draft.txt")
     else:
         st.info("Generate research output first.")
 
 # Add cache control in the sidebar
 st.sidebar.markdown("---")
-if st.sidebar.button("🗑️ Clear Cache"):
-    request_cache.clear()
-    st.sidebar.success("✅ Cache cleared successfully!")
-    
-# Display cache status
-if request_cache:
-    st.sidebar.info(f"📊 Cache contains {len(request_cache)} previous requests")
+if response_cache is not None:
+    if st.sidebar.button("🗑️ Clear Cache"):
+        response_cache.clear()
+        if semantic_cache is not None:
+            semantic_cache.clear()
+        st.sidebar.success("✅ Cache cleared successfully!")
+
+    # Display cache status
+    cache_entries = len(response_cache)
+    if cache_entries:
+        st.sidebar.info(f"📊 Cache contains {cache_entries} previous requests "
+                        f"({response_cache.size_bytes() / 1024:.1f} KB)")
+    stats = response_cache.stats
+    st.sidebar.caption(f"Cache hits: {stats.hits} · misses: {stats.misses} · evictions: {stats.evictions}")
+    if semantic_cache is not None:
+        st.sidebar.caption(f"Near-duplicate hits: {semantic_cache.hits} · "
+                           f"indexed requests: {len(semantic_cache)}")
+
+# Identical requests that piggybacked on one already in flight (caching on or off)
+coalesced = tracer.counters.get("coalesced", 0) + tracer.counters.get("coalesced_stream", 0)
+if coalesced:
+    st.sidebar.caption(f"🔗 {coalesced} duplicate request(s) shared an in-flight call")
+
+# Background upload status
+upload_metrics = get_upload_queue().metrics()
+with st.sidebar.expander("☁️ Cloud Storage Uploads"):
+    col1, col2 = st.columns(2)
+    col1.metric("Queued", upload_metrics["queue_depth"])
+    col2.metric("Uploaded", upload_metrics["uploaded"])
+    st.caption(f"Spooled locally: {upload_metrics['spooled']} · bundles: {upload_metrics['bundles']} · "
+               f"failed attempts: {upload_metrics['failed_attempts']}")
+    st.caption(f"Upload latency p50 {upload_metrics['latency_p50'] * 1000:.0f} ms · "
+               f"max {upload_metrics['latency_max'] * 1000:.0f} ms")
+    if get_upload_queue().last_error:
+        st.warning(get_upload_queue().last_error)
+
+# Hot-path latency metrics
+with st.sidebar.expander("⚡ Performance"):
+    rows = tracer.summary()
+    if rows:
+        st.dataframe(
+            [{"Span": row["span"], "Count": row["count"], "p50 (ms)": round(row["p50_ms"], 1),
+              "p95 (ms)": round(row["p95_ms"], 1), "p99 (ms)": round(row["p99_ms"], 1)} for row in rows],
+            hide_index=True
+        )
+        if tracer.counters:
+            st.caption(" · ".join(f"{name}: {value}" for name, value in sorted(tracer.counters.items())))
+        col1, col2 = st.columns(2)
+        col1.download_button("⬇️ Prometheus", tracer.export_prometheus(), file_name="metrics.prom")
+        col2.download_button("⬇️ JSON", json.dumps(tracer.export_json(), indent=2), file_name="metrics.json")
+    else:
+        st.caption("No requests timed yet.")
+
+# Where memory goes: this session's state vs the caches every session shares
+with st.sidebar.expander("🧠 Memory"):
+    breakdown = session_breakdown(st.session_state.to_dict())
+    st.metric("This session", format_bytes(sum(size for _, size in breakdown)))
+    st.caption(" · ".join(f"{key}: {format_bytes(size)}" for key, size in breakdown[:8]))
+    output = st.session_state.research_output
+    if output.offloaded_bytes():
+        st.caption(f"Current output: {format_bytes(output.offloaded_bytes())} kept on disk")
+    shared = []
+    if response_cache is not None:
+        where = "in memory" if response_cache.__class__.__name__ == "MemoryCache" else "on disk"
+        shared.append(f"Response cache: {format_bytes(response_cache.size_bytes())} {where}")
+    shared.append(f"PDF extractions: {format_bytes(memo_size_bytes())}")
+    shared.append(f"Background jobs: {format_bytes(total_size(job.result for job in get_job_manager().list_jobs()))}")
+    shared.append(f"Result blobs: {format_bytes(get_blob_store().size_bytes())} on disk")
+    st.caption(" · ".join(shared))
 
 # Add footer with tips
 st.markdown("---")
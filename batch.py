@@ -0,0 +1,118 @@
+"""Concurrent batch generation on top of IBMWatsonMLClient.chat_completion"""
+import os
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from response_cache import make_cache_key
+
+logger = logging.getLogger(__name__)
+
+
+class BatchResult:
+    """Outcome of one request in a batch"""
+
+    def __init__(self, index: int, result: Any = None, error: Optional[Exception] = None,
+                 shared: bool = False):
+        self.index = index
+        self.result = result
+        self.error = error
+        self.shared = shared  # True if a duplicate payload in the same batch produced this result
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def run_batch(client, deployment_id: str, messages_list: List[List[Dict[str, str]]],
+              max_workers: Optional[int] = None, version: str = "2021-05-01",
+              on_progress: Optional[Callable[[int, int, BatchResult], None]] = None,
+              thread_initializer: Optional[Callable[[], None]] = None) -> List[BatchResult]:
+    """Run many chat_completion calls concurrently and return results in input order
+
+    Requests still go through the client's shared rate limiter, so max_workers only bounds
+    how many are in flight at once. Identical payloads are sent once, and chat_completion itself
+    shares calls already in flight from other sessions. on_progress(done, total, result) is
+    called from the calling thread, so it is safe to update Streamlit elements in it.
+    """
+    if max_workers is None:
+        max_workers = int(os.getenv("BATCH_MAX_WORKERS", "3"))
+
+    total = len(messages_list)
+    results: List[Optional[BatchResult]] = [None] * total
+
+    # Group duplicate payloads so each unique request is submitted once
+    indexes_by_key: Dict[str, List[int]] = {}
+    for index, messages in enumerate(messages_list):
+        key = make_cache_key(messages, deployment_id, version)
+        indexes_by_key.setdefault(key, []).append(index)
+
+    def call(messages):
+        return client.chat_completion(deployment_id=deployment_id, messages=messages, version=version)
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=max_workers, initializer=thread_initializer) as executor:
+        futures = {
+            executor.submit(call, messages_list[indexes[0]]): indexes
+            for indexes in indexes_by_key.values()
+        }
+        for future in as_completed(futures):
+            indexes = futures[future]
+            try:
+                result, error = future.result(), None
+            except Exception as e:
+                logger.error("Batch request %d failed: %s", indexes[0], e)
+                result, error = None, e
+
+            for position, index in enumerate(indexes):
+                results[index] = BatchResult(index, result, error, shared=position > 0)
+                done += 1
+                if on_progress:
+                    on_progress(done, total, results[index])
+
+    return results
+
+
+def imap_bounded(fn: Callable[[Any], Any], items: Iterable[Any], max_workers: int,
+                 cancel_event=None, thread_name_prefix: str = "batch") -> Iterator[Tuple[Any, Future]]:
+    """Yield (item, future) for fn(item) in completion order, with at most 2 * max_workers in flight
+
+    items is consumed lazily from the calling thread, so inputs of any size never sit in memory
+    all at once. Once cancel_event is set no more items are read and calls that haven't started
+    are dropped; calls already running are still yielded when they finish.
+    """
+    pending: Dict[Future, Any] = {}
+
+    def collect(finished):
+        for future in finished:
+            item = pending.pop(future)
+            if not future.cancelled():
+                yield item, future
+
+    def cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix) as executor:
+        try:
+            items = iter(items)
+            # Checked before each item is read, so nothing past the cancellation is consumed
+            while not cancelled():
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                pending[executor.submit(fn, item)] = item
+                if len(pending) >= 2 * max_workers:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from collect(finished)
+
+            if cancelled():
+                for future in pending:
+                    future.cancel()
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from collect(finished)
+        finally:
+            # The consumer stopped early (error, Ctrl-C, closed generator): don't start the rest
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,147 @@
+"""Fixed vs adaptive (AIMD) rate limiting against a stand-in that enforces a real quota
+
+The mock server allows --quota generation calls per --window seconds and answers the rest
+with 429 + Retry-After, like a deployment on a plan the client doesn't know about. Each
+scenario keeps --concurrency workers sending for --duration seconds and reports throughput,
+429s and, for the adaptive client, the rate and concurrency it settled on:
+
+  fixed (configured)  the client's configured limit, e.g. a free-tier REQUESTS_PER_MINUTE
+  fixed (too high)    a limit above the quota, so the service's 429s do the limiting
+  adaptive            starts from the configured limit and learns the quota
+  adaptive (restart)  a new limiter seeded from the state the previous one saved
+
+    python benchmarks/bench_adaptive.py --quota 20 --configured 60 --duration 20
+    python benchmarks/bench_adaptive.py --headers   # also send X-RateLimit-* headers
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from adaptive_limit import AdaptiveLimiter, AdaptiveStateStore  # noqa: E402
+from endpoint_pool import Endpoint, EndpointPool  # noqa: E402
+from iam_token import TokenManager  # noqa: E402
+from mock_server import MockConfig, MockServer  # noqa: E402
+from rate_limiter import RateLimiter  # noqa: E402
+from watson_client import IBMWatsonMLClient  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def make_client(server, per_minute, adaptive_store=None, max_per_minute=None, window=1.0):
+    limiter = RateLimiter(per_minute=per_minute, per_hour=10 ** 9)
+    token_manager = TokenManager("bench", f"{server.url}/identity/token")
+    endpoint = Endpoint("bench", f"{server.url}/ml/v1", limiter, token_manager=token_manager, cooldown=0)
+    if adaptive_store is not None:
+        endpoint.adaptive = AdaptiveLimiter(endpoint.key, limiter, max_per_minute=max_per_minute,
+                                            header_window=window, state=adaptive_store.get(endpoint.key),
+                                            on_change=adaptive_store.changed)
+    client = IBMWatsonMLClient(api_key="bench", rate_limiter=limiter, base_url=endpoint.base_url,
+                               token_manager=token_manager, pool=EndpointPool([endpoint]), adaptive=False)
+    client.max_retries = 20
+    return client, endpoint
+
+
+def run_load(name, server, client, endpoint, duration, concurrency):
+    """Send from `concurrency` threads for `duration` seconds; one result row"""
+    done = []
+    errors = []
+    stop = time.monotonic() + duration
+    before = server.stats["quota_429"]
+
+    def worker(number):
+        i = 0
+        while time.monotonic() < stop:
+            try:
+                client.chat_completion("bench", [{"role": "user", "content": f"{name} {number} {i}"}])
+                done.append(time.monotonic())
+            except Exception as e:
+                errors.append(str(e))
+            i += 1
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    # Throughput over the last third shows where each setup settles
+    tail_start = started + elapsed * 2 / 3
+    row = {
+        "scenario": name,
+        "ok": len(done),
+        "errors": len(errors),
+        "rps": round(len(done) / elapsed, 2),
+        "tail_rps": round(sum(1 for t in done if t >= tail_start) / (elapsed / 3), 2),
+        "http_429": server.stats["quota_429"] - before,
+    }
+    if endpoint.adaptive is not None:
+        row["learned"] = endpoint.adaptive.as_dict()
+    learned = f"   -> {row['learned']['per_minute']:.0f}/min, {row['learned']['concurrency']} in flight" \
+        if "learned" in row else ""
+    print(f"{name:<20}{row['ok']:>6} ok{row['errors']:>4} failed{row['rps']:>8.1f} req/s "
+          f"(last third {row['tail_rps']:>5.1f}){row['http_429']:>6} x 429{learned}")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--quota", type=int, default=20, help="calls the mock allows per window")
+    parser.add_argument("--window", type=float, default=1.0, help="mock quota window in seconds")
+    parser.add_argument("--configured", type=float, default=60, help="client's configured requests per minute")
+    parser.add_argument("--max-per-minute", type=float, default=6000, help="upper bound for the adaptive rate")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per scenario")
+    parser.add_argument("--headers", action="store_true", help="mock sends X-RateLimit-* headers")
+    args = parser.parse_args()
+    # Each 429 is logged by the client; only the summary matters here
+    logging.disable(logging.CRITICAL)
+
+    quota_per_minute = args.quota * 60 / args.window
+    print(f"Quota {quota_per_minute:.0f}/min ({args.quota} per {args.window:g}s), "
+          f"client configured for {args.configured:.0f}/min, {args.concurrency} workers\n")
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store = AdaptiveStateStore(os.path.join(tmp, "adaptive_limits.json"))
+        scenarios = [
+            ("fixed (configured)", dict(per_minute=args.configured)),
+            ("fixed (too high)", dict(per_minute=args.max_per_minute)),
+            ("adaptive", dict(per_minute=args.configured, adaptive_store=store)),
+            ("adaptive (restart)", dict(per_minute=args.configured)),
+        ]
+        for name, options in scenarios:
+            if name == "adaptive (restart)":
+                store.save()
+                options["adaptive_store"] = AdaptiveStateStore(store.path)
+            # A fresh server per scenario so every one starts with an empty quota window
+            server = MockServer(MockConfig(latency=args.latency, quota=args.quota, quota_window=args.window,
+                                           quota_headers=args.headers)).start()
+            try:
+                client, endpoint = make_client(server, max_per_minute=args.max_per_minute,
+                                               window=args.window, **options)
+                rows.append(run_load(name, server, client, endpoint, args.duration, args.concurrency))
+            finally:
+                server.stop()
+
+    print(f"\nQuota ceiling: {quota_per_minute / 60:.1f} req/s")
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"adaptive_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"args": vars(args), "scenarios": rows}, f, indent=2)
+    print(f"Results saved to {os.path.relpath(path)}")
+
+
+if __name__ == "__main__":
+    main()
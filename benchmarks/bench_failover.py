@@ -0,0 +1,139 @@
+"""Routing and failover across several watsonx.ai endpoints, against local stand-ins
+
+Starts one mock server per endpoint (a fast region, a slower one and one that fails a share
+of its calls with 503s), sends concurrent generation requests through a single client and
+reports where they went, throughput, latency and how often a request failed over. The same
+load is then run against the failing endpoint alone, which is what a single-region setup
+sees during an outage.
+
+    python benchmarks/bench_failover.py --requests 300 --concurrency 8 --p500 0.5
+    python benchmarks/bench_failover.py --latencies 0.02,0.05,0.03 --p500 1.0
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from endpoint_pool import Endpoint, EndpointPool  # noqa: E402
+from iam_token import TokenManager  # noqa: E402
+from mock_server import MockConfig, MockServer  # noqa: E402
+from rate_limiter import RateLimiter  # noqa: E402
+from tracing import tracer  # noqa: E402
+from watson_client import IBMWatsonMLClient  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def make_client(servers, cooldown):
+    """One client over all servers; the last server is the one that fails"""
+    token_manager = TokenManager("bench", f"{servers[0].url}/identity/token")
+    endpoints = [
+        Endpoint(f"region-{position + 1}", f"{server.url}/ml/v1",
+                 RateLimiter(per_minute=10 ** 9, per_hour=10 ** 9),
+                 token_manager=token_manager, cooldown=cooldown)
+        for position, server in enumerate(servers)
+    ]
+    pool = EndpointPool(endpoints) if len(endpoints) > 1 else None
+    client = IBMWatsonMLClient(api_key="bench", rate_limiter=endpoints[0].rate_limiter,
+                               base_url=endpoints[0].base_url, token_manager=token_manager, pool=pool,
+                               adaptive=False)
+    # Keep backoff short so runs stay quick; the retry count is what matters
+    client.base_delay = 0.01
+    client.max_delay = 0.05
+    return client
+
+
+def run_load(client, requests, concurrency):
+    """Latencies of successful requests and the number that failed outright"""
+    def one(i):
+        start = time.perf_counter()
+        try:
+            client.chat_completion("bench", [{"role": "user", "content": f"request {i}"}])
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(seconds for seconds in results if seconds is not None)
+    return latencies, len(results) - len(latencies), elapsed
+
+
+def report(name, latencies, errors, elapsed):
+    def percentile(q):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000 if latencies else 0.0
+
+    row = {
+        "scenario": name,
+        "ok": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(0.50), 1),
+        "p95_ms": round(percentile(0.95), 1),
+        "p99_ms": round(percentile(0.99), 1),
+    }
+    print(f"{name:<18}{row['ok']:>6} ok{errors:>5} failed{row['rps']:>9.1f} req/s   "
+          f"p50 {row['p50_ms']:>7.1f}  p95 {row['p95_ms']:>7.1f}  p99 {row['p99_ms']:>7.1f} ms")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latencies", default="0.02,0.06,0.02",
+                        help="mock latency per endpoint in seconds; the last endpoint is the failing one")
+    parser.add_argument("--p500", type=float, default=0.5, help="share of 503s from the failing endpoint")
+    parser.add_argument("--cooldown", type=float, default=5.0, help="seconds a failing endpoint is left out")
+    args = parser.parse_args()
+    # Every injected 503 is logged by the client; only the summary matters here
+    logging.disable(logging.CRITICAL)
+
+    latencies = [float(value) for value in args.latencies.split(",")]
+    servers = [
+        MockServer(MockConfig(latency=latency, p500=args.p500 if position == len(latencies) - 1 else 0.0,
+                              seed=position)).start()
+        for position, latency in enumerate(latencies)
+    ]
+    single = MockServer(MockConfig(latency=latencies[-1], p500=args.p500)).start()
+    rows = []
+    try:
+        tracer.reset()
+        client = make_client(servers, args.cooldown)
+        rows.append(report("pool", *run_load(client, args.requests, args.concurrency)))
+        failovers = tracer.counters.get("watson_failover", 0)
+        endpoints = client.pool.stats()
+
+        tracer.reset()
+        rows.append(report("single endpoint", *run_load(make_client([single], args.cooldown),
+                                                         args.requests, args.concurrency)))
+        single_retries = tracer.counters.get("watson_retry", 0)
+    finally:
+        for server in servers + [single]:
+            server.stop()
+
+    print(f"\nFailovers: {failovers} (single endpoint: {single_retries} retries with backoff instead)")
+    print("\nPer endpoint:")
+    for stats, server in zip(endpoints, servers):
+        latency = f"{stats['ewma_latency_ms']:.1f} ms" if stats['ewma_latency_ms'] is not None else "-"
+        print(f"  {stats['name']:<10} {stats['requests']:>5} sent  {stats['successes']:>5} ok  "
+              f"{stats['failures']:>4} failed  {server.stats['injected_503']:>4} injected 503s  EWMA {latency}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"failover_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"args": vars(args), "scenarios": rows, "failovers": failovers, "endpoints": endpoints}, f, indent=2)
+    print(f"\nResults saved to {os.path.relpath(path)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Per-request latency of bare requests.post vs the pooled session in IBMWatsonMLClient
+
+Runs against a local HTTP stand-in for the IAM and Watson endpoints, so it
+measures connection setup and client overhead only (plain HTTP, no TLS; the
+saving against IBM Cloud is larger because every new connection also pays a
+TLS handshake).
+
+    python benchmarks/bench_http_session.py --requests 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import RateLimiter  # noqa: E402
+from watson_client import IBMWatsonMLClient  # noqa: E402
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers IAM token and text generation calls with canned JSON"""
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+
+        if self.path.startswith("/identity/token"):
+            body = {"access_token": "local-token", "expires_in": 3600}
+        else:
+            body = {"results": [{"generated_text": '{"summary": ["ok"]}'}]}
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def summarize(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<22} mean {statistics.mean(latencies) * 1000:7.3f} ms   "
+          f"p50 {statistics.median(latencies) * 1000:7.3f} ms   p95 {p95 * 1000:7.3f} ms")
+
+
+def bench_bare_requests(base_url, count):
+    """The old code path: a new connection for every call"""
+    latencies = []
+    url = f"{base_url}/ml/v1/deployments/bench/text/generation"
+    for i in range(count):
+        start = time.perf_counter()
+        response = requests.post(
+            url,
+            headers={"Authorization": "Bearer local-token"},
+            params={"version": "2021-05-01"},
+            json={"messages": [{"role": "user", "content": str(i)}]},
+        )
+        response.json()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_client(base_url, count):
+    """IBMWatsonMLClient with its pooled keep-alive session"""
+    client = IBMWatsonMLClient(
+        api_key="local",
+        rate_limiter=RateLimiter(per_minute=10 ** 9, per_hour=10 ** 9),
+        base_url=f"{base_url}/ml/v1",
+        iam_token_url=f"{base_url}/identity/token",
+        adaptive=False,
+    )
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        client.chat_completion("bench", [{"role": "user", "content": str(i)}])
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    server, base_url = start_server()
+    try:
+        # Warm up both paths so imports and the token fetch aren't measured
+        bench_bare_requests(base_url, 5)
+        bench_client(base_url, 5)
+
+        summarize("requests.post (before)", bench_bare_requests(base_url, args.requests))
+        summarize("pooled session (after)", bench_client(base_url, args.requests))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
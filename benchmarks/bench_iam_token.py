@@ -0,0 +1,109 @@
+"""IAM token fetching: per-session lazy auth vs the shared TokenManager
+
+Starts a local IAM stand-in with artificial latency, then compares
+  * IAM calls made when N sessions need a token at the same moment, and
+  * latency of the first request after the token reaches its refresh point
+    (lazy refresh pays an IAM round trip, proactive refresh doesn't).
+
+    python benchmarks/bench_iam_token.py --sessions 20 --latency 0.2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from iam_token import TokenManager  # noqa: E402
+
+
+class IAMStandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.2
+    expires_in = 3600
+    calls = 0
+    calls_lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with IAMStandIn.calls_lock:
+            IAMStandIn.calls += 1
+            token = f"token-{IAMStandIn.calls}"
+        time.sleep(IAMStandIn.latency)
+
+        data = json.dumps({"access_token": token, "expires_in": IAMStandIn.expires_in}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def lazy_fetch(url):
+    """What each session-scoped client used to do"""
+    response = requests.post(url, data={"grant_type": "urn:ibm:params:oauth:grant-type:apikey", "apikey": "k"})
+    return response.json()["access_token"]
+
+
+def concurrent_calls(target, sessions):
+    IAMStandIn.calls = 0
+    threads = [threading.Thread(target=target) for _ in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return IAMStandIn.calls, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="IAM response delay in seconds")
+    args = parser.parse_args()
+    IAMStandIn.latency = args.latency
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), IAMStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/identity/token"
+
+    try:
+        print(f"{args.sessions} sessions needing a token at once (IAM latency {args.latency * 1000:.0f} ms)")
+        calls, elapsed = concurrent_calls(lambda: lazy_fetch(url), args.sessions)
+        print(f"  per-session auth (before): {calls:3d} IAM calls, {elapsed * 1000:7.1f} ms")
+        manager = TokenManager("k", url)
+        calls, elapsed = concurrent_calls(manager.get_token, args.sessions)
+        print(f"  shared TokenManager (after): {calls:3d} IAM calls, {elapsed * 1000:7.1f} ms")
+
+        # Tokens that hit their refresh point 1 s after being issued
+        IAMStandIn.expires_in = 2
+        print("First request after the token reaches its refresh point")
+        lazy = TokenManager("k", url, refresh_margin=1)
+        lazy._start_refresher = lambda: None  # lazy refresh only
+        lazy.get_token()
+        time.sleep(1.2)
+        start = time.perf_counter()
+        lazy.get_token()
+        print(f"  lazy refresh (before):      {(time.perf_counter() - start) * 1000:7.1f} ms")
+
+        proactive = TokenManager("k", url, refresh_margin=1)
+        proactive.get_token()
+        time.sleep(1.2 + args.latency)  # the background refresh has finished by now
+        start = time.perf_counter()
+        proactive.get_token()
+        print(f"  proactive refresh (after):  {(time.perf_counter() - start) * 1000:7.1f} ms")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Cold start and rerun cost of app.py, with an import-time profile
+
+Each sample runs in a fresh interpreter: Streamlit is imported first (a real server has it
+loaded before the script runs), then app.py's first run is timed (time to first render) and
+the script is rerun to time the per-interaction overhead. Credentials are dummies and every
+cache/spool path points into a temporary directory, so nothing is sent anywhere.
+
+    python benchmarks/bench_startup.py --samples 5 --reruns 20
+    python benchmarks/bench_startup.py --save-baseline
+    python benchmarks/bench_startup.py --fail-on-regression
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BASELINE_PATH = os.path.join(RESULTS_DIR, "startup_baseline.json")
+# Written to stderr between the Streamlit import and the first run, to split the import profile
+FIRST_RUN_MARKER = "--- first run ---"
+
+
+def child(reruns):
+    """Runs inside the fresh interpreter; prints the timings as JSON"""
+    began = time.perf_counter()
+    import logging
+    from streamlit.testing.v1 import AppTest
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+    streamlit_ready = time.perf_counter()
+
+    sys.stderr.write(FIRST_RUN_MARKER + "\n")
+    sys.stderr.flush()
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+    at.run()
+    first_render = time.perf_counter()
+    if at.exception:
+        raise SystemExit(f"app.py raised on its first run: {at.exception[0].message}")
+
+    rerun_seconds = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        rerun_seconds.append(time.perf_counter() - start)
+
+    print(json.dumps({
+        "streamlit_import_s": streamlit_ready - began,
+        "first_run_s": first_render - streamlit_ready,
+        "time_to_first_render_s": first_render - began,
+        "rerun_s": rerun_seconds,
+        "modules": sorted(sys.modules),
+    }))
+
+
+def child_env(tmp):
+    env = dict(os.environ)
+    for name in ("API_KEY", "DEPLOYMENT_ID", "COS_API_KEY", "COS_INSTANCE_ID", "COS_BUCKET"):
+        env[name] = "bench"
+    env["COS_ENDPOINT"] = "http://127.0.0.1:9"  # never contacted on startup
+    env.update({
+        "CACHE_PATH": os.path.join(tmp, "cache.db"),
+        "RATE_LIMIT_PATH": os.path.join(tmp, "rate_limit.db"),
+        "OUTPUT_INDEX_PATH": os.path.join(tmp, "output_index.db"),
+        "COS_SPOOL_DIR": os.path.join(tmp, "spool"),
+        "BLOB_DIR": os.path.join(tmp, "blobs"),
+        "LIBRARY_OUTPUT_DIR": os.path.join(tmp, "library_imports"),
+    })
+    return env
+
+
+def run_child(reruns, importtime=False):
+    with tempfile.TemporaryDirectory() as tmp:
+        command = [sys.executable] + (["-X", "importtime"] if importtime else []) + \
+                  [os.path.abspath(__file__), "--child", "--reruns", str(reruns)]
+        proc = subprocess.run(command, cwd=ROOT, env=child_env(tmp), capture_output=True, text=True, timeout=600)
+    if proc.returncode != 0:
+        raise SystemExit(f"Benchmark child failed:\n{proc.stdout}\n{proc.stderr[-4000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+def import_profile(stderr, top):
+    """Top-level imports made by app.py's first run, slowest first: (module, cumulative ms)"""
+    _, _, after = stderr.partition(FIRST_RUN_MARKER)
+    rows = []
+    for line in after.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = (part for part in line[len("import time:"):].split("|"))
+        if name.startswith(" ") and not name.startswith("  "):  # not nested under another import
+            rows.append((name.strip(), int(cumulative) / 1000))
+    return sorted(rows, key=lambda row: row[1], reverse=True)[:top]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def summarize(samples):
+    reruns = sorted(seconds for sample in samples for seconds in sample["rerun_s"])
+    return {
+        "streamlit_import_ms": statistics.median(s["streamlit_import_s"] for s in samples) * 1000,
+        "first_run_ms": statistics.median(s["first_run_s"] for s in samples) * 1000,
+        "time_to_first_render_ms": statistics.median(s["time_to_first_render_s"] for s in samples) * 1000,
+        "rerun_p50_ms": reruns[len(reruns) // 2] * 1000 if reruns else 0.0,
+        "rerun_p95_ms": reruns[max(0, int(len(reruns) * 0.95) - 1)] * 1000 if reruns else 0.0,
+    }
+
+
+def compare(summary, baseline, tolerance):
+    """Print changes against the baseline; returns the metrics that got slower than tolerance"""
+    regressions = []
+    print(f"\nCompared with baseline {baseline['meta'].get('commit') or ''} "
+          f"({baseline['meta'].get('timestamp', '?')}), tolerance {tolerance:.0%}")
+    for name, value in summary.items():
+        old = baseline["summary"].get(name)
+        if not old:
+            continue
+        change = (value - old) / old
+        regressed = change > tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"  {name:<26}{old:>10.1f} -> {value:>8.1f} ms  {change:+7.1%}{'   REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--samples", type=int, default=3, help="cold starts, each in a fresh interpreter")
+    parser.add_argument("--reruns", type=int, default=10, help="reruns timed after each first render")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before flagging")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.reruns)
+        return
+
+    samples = [run_child(args.reruns)[0] for _ in range(args.samples)]
+    # Profiled separately: -X importtime itself slows imports down
+    profiled, stderr = run_child(0, importtime=True)
+    summary = summarize(samples)
+
+    for name, value in summary.items():
+        print(f"{name:<26}{value:>10.1f} ms")
+    print("\nSlowest imports during the first run of app.py:")
+    for module, ms in import_profile(stderr, args.top):
+        print(f"  {module:<40}{ms:>8.1f} ms")
+    heavy = [name for name in ("numpy", "pandas", "pyarrow", "ibm_boto3", "PyPDF2", "requests")
+             if name in profiled["modules"]]
+    print(f"\nHeavy modules loaded by the first render: {', '.join(heavy) or 'none'}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "samples": args.samples,
+            "reruns": args.reruns,
+        },
+        "summary": summary,
+        "heavy_modules": heavy,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = args.baseline if args.save_baseline else os.path.join(
+        RESULTS_DIR, f"startup_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {os.path.relpath(path)}")
+
+    if args.save_baseline or not os.path.exists(args.baseline):
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(summary, baseline, args.tolerance)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""Local stand-in for IAM, Watson ML text generation and the COS (S3) API
+
+Used by the benchmark suite so the client, streaming, parsing and upload paths can be
+measured offline and repeatably. Latency, error injection and the shape of the event
+stream are all configurable.
+
+    python benchmarks/mock_server.py --port 8099 --latency 0.05 --p429 0.1
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import escape
+
+GENERATION_PATH = re.compile(r"^/ml/v1/deployments/[^/]+/text/(generation|generation_stream)$")
+
+
+class MockConfig:
+    """Knobs for the stand-in; can be changed while the server is running"""
+
+    def __init__(self, latency: float = 0.02, jitter: float = 0.0, p429: float = 0.0,
+                 p401: float = 0.0, p500: float = 0.0, retry_after: str = "0", iam_latency: float = 0.01,
+                 expires_in: int = 3600, cos_latency: float = 0.005, stream_events: int = 20,
+                 chunk_bytes: int = 0, chunk_delay: float = 0.002, crlf: bool = False,
+                 output_kb: int = 2, quota: int = 0, quota_window: float = 1.0,
+                 quota_headers: bool = False, seed: int = 0):
+        self.latency = latency            # seconds before a generation response starts
+        self.jitter = jitter              # +/- uniform jitter added to latency
+        self.p429 = p429                  # probability a generation call gets a 429
+        self.p401 = p401                  # probability a generation call gets a 401
+        self.p500 = p500                  # probability a generation call gets a 503 (1.0: region down)
+        self.retry_after = retry_after    # Retry-After header on 429s ("" to omit)
+        self.iam_latency = iam_latency
+        self.expires_in = expires_in
+        self.cos_latency = cos_latency
+        self.stream_events = stream_events  # SSE events per streamed response
+        self.chunk_bytes = chunk_bytes    # split the stream into writes of this size (0: one write per event)
+        self.chunk_delay = chunk_delay    # pause between stream writes
+        self.crlf = crlf                  # CRLF line endings in the event stream
+        self.output_kb = output_kb        # approximate size of the generated JSON
+        self.quota = quota                # generation calls allowed per quota_window (0: unlimited)
+        self.quota_window = quota_window  # fixed window in seconds; over quota gets a 429 with Retry-After
+        self.quota_headers = quota_headers  # send X-RateLimit-Limit/Remaining/Reset on generation calls
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def roll(self, probability: float) -> bool:
+        if probability <= 0:
+            return False
+        with self.lock:
+            return self.random.random() < probability
+
+    def delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        with self.lock:
+            return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+
+def generated_output(size_kb: int) -> str:
+    """A research-output shaped JSON document of roughly size_kb kilobytes"""
+    sentence = "The proposed method improves retrieval quality on long documents. "
+    bullets = max(1, size_kb * 1024 // (len(sentence) * 2))
+    return json.dumps({
+        "summary": [sentence * 2] * bullets,
+        "references": ["Doe, J. (2023). A study. Journal of Examples, 1(2), 3-4."],
+    })
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, chunked streaming
+    disable_nagle_algorithm = True
+    server: "MockServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/json",
+              headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        self._send(status, json.dumps(payload).encode(), headers=headers)
+
+    # IAM and Watson
+
+    def do_POST(self):
+        self._body()
+        path = urlsplit(self.path).path
+        config = self.server.config
+
+        if path == "/identity/token":
+            self.server.count("iam_token")
+            time.sleep(config.iam_latency)
+            token = f"mock-token-{self.server.stats['iam_token']}"
+            self._send_json(200, {"access_token": token, "expires_in": config.expires_in})
+            return
+
+        match = GENERATION_PATH.match(path)
+        if not match:
+            self._send_json(404, {"error": "not found"})
+            return
+
+        stream = match.group(1) == "generation_stream"
+        self.server.count("generation_stream" if stream else "generation")
+        allowed, quota_headers = self.server.take_quota()
+        time.sleep(config.delay())
+
+        if not allowed:
+            self.server.count("quota_429")
+            self._send_json(429, {"error": "Too Many Requests"},
+                            headers=dict(quota_headers, **{"Retry-After": quota_headers["X-RateLimit-Reset"]}))
+        elif config.roll(config.p429):
+            self.server.count("injected_429")
+            headers = {"Retry-After": config.retry_after} if config.retry_after else None
+            self._send_json(429, {"error": "Too Many Requests"}, headers=headers)
+        elif config.roll(config.p401):
+            self.server.count("injected_401")
+            self._send_json(401, {"error": "Unauthorized"})
+        elif config.roll(config.p500):
+            self.server.count("injected_503")
+            self._send_json(503, {"error": "Service Unavailable"})
+        elif stream:
+            self._stream(config, quota_headers if config.quota_headers else None)
+        else:
+            self._send_json(200, {"results": [{"generated_text": self.server.output}]},
+                            headers=quota_headers if config.quota_headers else None)
+
+    def _stream(self, config: MockConfig, headers: dict = None):
+        """Send the generated text as a chunked text/event-stream"""
+        text = self.server.output
+        step = max(1, -(-len(text) // max(1, config.stream_events)))
+        newline = "\r\n" if config.crlf else "\n"
+        events = []
+        for i in range(0, len(text), step):
+            data = json.dumps({"results": [{"generated_text": text[i:i + step]}]})
+            events.append(f"id: {i // step}{newline}event: message{newline}data: {data}{newline}{newline}".encode())
+
+        if config.chunk_bytes:
+            stream = b"".join(events)
+            writes = [stream[i:i + config.chunk_bytes] for i in range(0, len(stream), config.chunk_bytes)]
+        else:
+            writes = events
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        for piece in writes:
+            self.wfile.write(f"{len(piece):x}\r\n".encode() + piece + b"\r\n")
+            self.wfile.flush()
+            if config.chunk_delay:
+                time.sleep(config.chunk_delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    # COS (path-style S3)
+
+    def _bucket_and_key(self):
+        parts = urlsplit(self.path)
+        bucket, _, key = parts.path.lstrip("/").partition("/")
+        return bucket, key, parse_qs(parts.query)
+
+    def do_PUT(self):
+        body = self._body()
+        bucket, key, _ = self._bucket_and_key()
+        time.sleep(self.server.config.cos_latency)
+        if key:
+            self.server.count("cos_put")
+            with self.server.lock:
+                self.server.objects[(bucket, key)] = (body, self.headers.get("Content-Encoding"))
+        else:
+            self.server.count("cos_create_bucket")
+        self._send(200, headers={"ETag": '"mock"'})
+
+    def do_HEAD(self):
+        bucket, key, _ = self._bucket_and_key()
+        self.server.count("cos_head")
+        if key and (bucket, key) not in self.server.objects:
+            self._send(404, content_type="application/xml")
+        else:
+            self._send(200, content_type="application/xml")
+
+    def do_GET(self):
+        bucket, key, query = self._bucket_and_key()
+        time.sleep(self.server.config.cos_latency)
+        if key:
+            self.server.count("cos_get")
+            stored = self.server.objects.get((bucket, key))
+            if stored is None:
+                self._send(404, b"<Error><Code>NoSuchKey</Code></Error>", "application/xml")
+                return
+            body, encoding = stored
+            headers = {"Content-Encoding": encoding} if encoding else None
+            self._send(200, body, "application/octet-stream", headers=headers)
+        else:
+            self.server.count("cos_list")
+            self._send(200, self._list_objects(bucket, query), "application/xml")
+
+    def _list_objects(self, bucket: str, query: dict) -> bytes:
+        """ListObjectsV2 with continuation tokens"""
+        prefix = query.get("prefix", [""])[0]
+        max_keys = int(query.get("max-keys", ["1000"])[0])
+        start_after = query.get("continuation-token", query.get("start-after", [""]))[0]
+        with self.server.lock:
+            keys = sorted(k for b, k in self.server.objects if b == bucket and k.startswith(prefix))
+            sizes = {k: len(self.server.objects[(bucket, k)][0]) for k in keys}
+        keys = [k for k in keys if k > start_after]
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+
+        modified = formatdate(usegmt=True)
+        contents = "".join(
+            f"<Contents><Key>{escape(k)}</Key><LastModified>{modified}</LastModified>"
+            f"<ETag>\"mock\"</ETag><Size>{sizes[k]}</Size><StorageClass>STANDARD</StorageClass></Contents>"
+            for k in page
+        )
+        token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ""
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+            f"<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{str(truncated).lower()}</IsTruncated>"
+            f"{contents}{token}</ListBucketResult>"
+        ).encode()
+
+
+class MockServer(ThreadingHTTPServer):
+    """Threaded stand-in server; `stats` counts calls per endpoint and injected errors"""
+    daemon_threads = True
+
+    def __init__(self, config: MockConfig = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), MockHandler)
+        self.config = config or MockConfig()
+        self.output = generated_output(self.config.output_kb)
+        self.stats = Counter()
+        self.objects = {}
+        self.lock = threading.Lock()
+        self._thread = None
+        self._window_start = 0.0
+        self._window_count = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def count(self, name: str):
+        with self.lock:
+            self.stats[name] += 1
+
+    def take_quota(self):
+        """Count a generation call against the fixed-window quota: (allowed, rate-limit headers)"""
+        config = self.config
+        if not config.quota:
+            return True, {}
+        with self.lock:
+            now = time.monotonic()
+            if now - self._window_start >= config.quota_window:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            reset = max(1, int(-(-(self._window_start + config.quota_window - now) // 1)))
+            remaining = max(0, config.quota - self._window_count)
+            allowed = self._window_count <= config.quota
+        return allowed, {"X-RateLimit-Limit": str(config.quota), "X-RateLimit-Remaining": str(remaining),
+                         "X-RateLimit-Reset": str(reset)}
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--p429", type=float, default=0.0)
+    parser.add_argument("--p401", type=float, default=0.0)
+    parser.add_argument("--p500", type=float, default=0.0)
+    parser.add_argument("--chunk-bytes", type=int, default=0)
+    args = parser.parse_args()
+
+    config = MockConfig(latency=args.latency, p429=args.p429, p401=args.p401, p500=args.p500, chunk_bytes=args.chunk_bytes)
+    server = MockServer(config, port=args.port)
+    print(f"Mock IAM/Watson/COS listening on {server.url}")
+    print(f"  IAM token URL:  {server.url}/identity/token")
+    print(f"  Watson base:    {server.url}/ml/v1")
+    print(f"  COS endpoint:   {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
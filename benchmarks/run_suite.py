@@ -0,0 +1,338 @@
+"""Offline benchmark suite: client, streaming, parsing and COS uploads against a local mock
+
+Every scenario runs at each concurrency level and reports throughput, tail latency,
+retries and peak Python memory. Results are saved as JSON under benchmarks/results/ and
+compared with a baseline so regressions show up before a change ships.
+
+    python benchmarks/run_suite.py                          # run and compare with the baseline
+    python benchmarks/run_suite.py --save-baseline          # record the current numbers as the baseline
+    python benchmarks/run_suite.py --p429 0.1 --p401 0.02   # with injected errors
+    python benchmarks/run_suite.py --scenarios streaming --chunk-bytes 7 --crlf
+"""
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_server import MockConfig, MockServer  # noqa: E402
+from rate_limiter import RateLimiter  # noqa: E402
+from iam_token import TokenManager  # noqa: E402
+from watson_client import IBMWatsonMLClient  # noqa: E402
+from response_handlers import handle_streaming_response, parse_response  # noqa: E402
+from cos_storage import upload_to_cos  # noqa: E402
+from upload_queue import UploadQueue  # noqa: E402
+from tracing import tracer  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BASELINE_PATH = os.path.join(RESULTS_DIR, "baseline.json")
+SCENARIOS = ["chat_completion", "streaming", "parse_response", "cos_upload", "cos_upload_queue"]
+BUCKET = "bench-bucket"
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def run_concurrently(task, count, concurrency):
+    """Run task(i) for i in range(count) on `concurrency` threads; returns (latencies, errors, seconds)"""
+    latencies, errors = [], 0
+
+    def timed(i):
+        start = time.perf_counter()
+        task(i)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(timed, i) for i in range(count)]:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    return latencies, errors, time.perf_counter() - start
+
+
+def measure(name, concurrency, count, server, body, track_memory):
+    """Run one scenario and collect the numbers that go into the results file"""
+    counters_before = dict(tracer.counters)
+    stats_before = dict(server.stats)
+    if track_memory:
+        tracemalloc.start()
+
+    latencies, errors, seconds = body()
+
+    peak = tracemalloc.get_traced_memory()[1] if track_memory else 0
+    if track_memory:
+        tracemalloc.stop()
+
+    def delta(counts, before, key):
+        return counts.get(key, 0) - before.get(key, 0)
+
+    ordered = sorted(latencies)
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": count,
+        "errors": errors,
+        "seconds": round(seconds, 4),
+        "rps": round(len(latencies) / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        "retries": delta(tracer.counters, counters_before, "watson_retry"),
+        "http_429": delta(server.stats, stats_before, "injected_429"),
+        "http_401": delta(server.stats, stats_before, "injected_401"),
+        "iam_calls": delta(server.stats, stats_before, "iam_token"),
+        "peak_mb": round(peak / 2 ** 20, 3),
+    }
+
+
+def make_client(server):
+    client = IBMWatsonMLClient(
+        api_key="bench",
+        rate_limiter=RateLimiter(per_minute=10 ** 9, per_hour=10 ** 9),
+        base_url=f"{server.url}/ml/v1",
+        iam_token_url=f"{server.url}/identity/token",
+        token_manager=TokenManager("bench", f"{server.url}/identity/token"),
+        adaptive=False,  # measure the client itself, not the learned limits
+    )
+    # Keep injected-error backoff short so runs stay quick; the retry count is what matters
+    client.base_delay = 0.01
+    client.max_delay = 0.05
+    return client
+
+
+def cos_available():
+    try:
+        import ibm_boto3  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def make_cos_client(server, concurrency):
+    # Imported here so the suite (and its helpers) load without ibm-cos-sdk installed
+    import ibm_boto3
+    from ibm_botocore.client import Config
+    return ibm_boto3.client(
+        "s3",
+        aws_access_key_id="bench",
+        aws_secret_access_key="bench",
+        region_name="us-south",
+        endpoint_url=server.url,
+        config=Config(s3={"addressing_style": "path"}, max_pool_connections=max(10, concurrency)),
+    )
+
+
+def messages_for(i):
+    payload = {"text": f"Benchmark abstract number {i}. " * 20, "section": {"type": "summary"}}
+    return [{"role": "user", "content": json.dumps(payload)}]
+
+
+def sample_responses(server):
+    """Response shapes parse_response sees in practice"""
+    text = server.output
+    return [
+        {"results": [{"generated_text": text}]},
+        {"results": [{"generated_text": f"Here you go:\n```json\n{text}\n```"}]},
+        {"results": [{"generated_text": "Plain prose answer without any JSON in it. " * 40}]},
+    ]
+
+
+def run_suite(args):
+    config = MockConfig(latency=args.latency, jitter=args.jitter, p429=args.p429, p401=args.p401,
+                        stream_events=args.stream_events, chunk_bytes=args.chunk_bytes,
+                        crlf=args.crlf, output_kb=args.output_kb, seed=args.seed)
+    server = MockServer(config).start()
+    client = make_client(server)
+    results = []
+
+    try:
+        # Warm up the token, connections and Streamlit's bare-mode setup
+        client.chat_completion("bench", messages_for(-1))
+        handle_streaming_response(client.chat_completion("bench", messages_for(-1), stream=True))
+
+        for concurrency in args.concurrency:
+            count = args.requests
+
+            if "chat_completion" in args.scenarios:
+                results.append(measure("chat_completion", concurrency, count, server, lambda: run_concurrently(
+                    lambda i: client.chat_completion("bench", messages_for(i)), count, concurrency,
+                ), args.memory))
+
+            if "streaming" in args.scenarios:
+                def stream_one(i):
+                    result = handle_streaming_response(client.chat_completion("bench", messages_for(i), stream=True))
+                    if "raw_content" in result:
+                        raise ValueError("stream did not reassemble into JSON")
+                results.append(measure("streaming", concurrency, count, server,
+                                       lambda: run_concurrently(stream_one, count, concurrency), args.memory))
+
+            if "parse_response" in args.scenarios:
+                samples = sample_responses(server)
+                parse_count = count * 10
+                results.append(measure("parse_response", concurrency, parse_count, server, lambda: run_concurrently(
+                    lambda i: parse_response(samples[i % len(samples)]), parse_count, concurrency,
+                ), args.memory))
+
+            if "cos_upload" in args.scenarios:
+                cos = make_cos_client(server, concurrency)
+
+                def upload_one(i):
+                    if not upload_to_cos(f"direct/{concurrency}_{i}.json", server.output, max_retries=1,
+                                         cos_client=cos, bucket=BUCKET):
+                        raise RuntimeError("upload failed")
+                results.append(measure("cos_upload", concurrency, count, server,
+                                       lambda: run_concurrently(upload_one, count, concurrency), args.memory))
+
+            if "cos_upload_queue" in args.scenarios:
+                results.append(measure("cos_upload_queue", concurrency, count, server,
+                                       lambda: drain_upload_queue(server, count, concurrency), args.memory))
+    finally:
+        server.stop()
+    return config, results
+
+
+def drain_upload_queue(server, count, concurrency):
+    """Enqueue from `concurrency` threads and wait for the background worker to finish
+
+    Latency here is enqueue-to-uploaded time per item, which is what a user never waits for
+    but what decides how far the spool falls behind.
+    """
+    cos = make_cos_client(server, concurrency)
+    with tempfile.TemporaryDirectory() as spool_dir:
+        uploads = UploadQueue(spool_dir=spool_dir, max_queue=count + 1, client_factory=lambda: cos, bucket=BUCKET)
+
+        def enqueue_one(i):
+            if not uploads.enqueue(f"queued/{concurrency}_{i}.json", server.output):
+                raise RuntimeError("could not spool")
+
+        start = time.perf_counter()
+        _, errors, _ = run_concurrently(enqueue_one, count, concurrency)
+        deadline = time.time() + 60
+        while uploads.uploaded + errors < count and time.time() < deadline:
+            time.sleep(0.005)
+        seconds = time.perf_counter() - start
+        latencies = list(uploads.latencies)
+        uploads.stop()
+    return latencies, errors + max(0, count - errors - uploads.uploaded), seconds
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def print_results(results):
+    header = f"{'scenario':<18}{'conc':>5}{'req':>7}{'err':>5}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}" \
+             f"{'p99 ms':>10}{'retries':>8}{'429':>5}{'401':>5}{'IAM':>5}{'peak MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        print(f"{row['scenario']:<18}{row['concurrency']:>5}{row['requests']:>7}{row['errors']:>5}"
+              f"{row['rps']:>10.1f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+              f"{row['retries']:>8}{row['http_429']:>5}{row['http_401']:>5}{row['iam_calls']:>5}{row['peak_mb']:>9.2f}")
+
+
+def compare(results, baseline, tolerance):
+    """Print throughput and p95 changes against the baseline; returns the regressed rows"""
+    previous = {(row["scenario"], row["concurrency"]): row for row in baseline["results"]}
+    regressions = []
+    print(f"\nCompared with baseline {baseline['meta'].get('commit') or ''} "
+          f"({baseline['meta'].get('timestamp', '?')}), tolerance {tolerance:.0%}")
+    for row in results:
+        old = previous.get((row["scenario"], row["concurrency"]))
+        if old is None:
+            continue
+        rps_change = (row["rps"] - old["rps"]) / old["rps"] if old["rps"] else 0.0
+        p95_change = (row["p95_ms"] - old["p95_ms"]) / old["p95_ms"] if old["p95_ms"] else 0.0
+        regressed = rps_change < -tolerance or p95_change > tolerance
+        if regressed:
+            regressions.append(row)
+        print(f"  {row['scenario']:<18} x{row['concurrency']:<4} req/s {rps_change:+7.1%}   "
+              f"p95 {p95_change:+7.1%}{'   REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 4, 16],
+                        help="comma-separated thread counts, e.g. 1,4,16")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario and concurrency level")
+    parser.add_argument("--latency", type=float, default=0.02, help="mock generation latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--p429", type=float, default=0.0, help="probability of an injected 429")
+    parser.add_argument("--p401", type=float, default=0.0, help="probability of an injected 401")
+    parser.add_argument("--stream-events", type=int, default=20)
+    parser.add_argument("--chunk-bytes", type=int, default=0, help="split the event stream into writes of N bytes")
+    parser.add_argument("--crlf", action="store_true", help="CRLF line endings in the event stream")
+    parser.add_argument("--output-kb", type=int, default=2, help="size of the generated JSON")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip tracemalloc (it slows CPU-bound scenarios down)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative change before flagging")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+    skipped = [name for name in args.scenarios if name.startswith("cos_")]
+    if skipped and not cos_available():
+        print(f"ibm_boto3 is not installed, skipping {', '.join(skipped)}")
+        args.scenarios = [name for name in args.scenarios if name not in skipped]
+
+    # Outside `streamlit run` every st call would log a missing-ScriptRunContext warning
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+    config, results = run_suite(args)
+    print_results(results)
+
+    settings = {k: v for k, v in vars(config).items() if k not in ("random", "lock")}
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "memory_tracked": args.memory,
+            "mock": settings,
+        },
+        "results": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = BASELINE_PATH if args.save_baseline else os.path.join(
+        RESULTS_DIR, f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {os.path.relpath(path)}")
+
+    if args.save_baseline or not os.path.exists(args.baseline):
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["meta"].get("mock") != settings or baseline["meta"].get("memory_tracked") != args.memory:
+        print("Note: baseline was recorded with different mock settings; numbers may not be comparable")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Token-aware chunking and map-reduce condensing of long input texts"""
+import os
+import re
+import zlib
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from batch import run_batch
+from jobs import JobCancelled
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4  # rough average for English prose with Llama-style tokenizers
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate; good enough for budgeting chunks"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _split_sentences(paragraph: str) -> List[str]:
+    return [s for s in re.split(r"(?<=[.!?])\s+", paragraph) if s]
+
+
+def _split_oversized(paragraph: str, max_tokens: int) -> List[str]:
+    """Break a paragraph longer than max_tokens at sentence (or, failing that, character) boundaries"""
+    max_tokens = max(1, max_tokens)
+    pieces, current = [], ""
+    for sentence in _split_sentences(paragraph):
+        while estimate_tokens(sentence) > max_tokens:
+            cut = max_tokens * CHARS_PER_TOKEN
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:]
+        candidate = f"{current} {sentence}".strip()
+        if current and estimate_tokens(candidate) > max_tokens:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _is_anchor(paragraph: str) -> bool:
+    """Content-defined boundary: depends only on the paragraph itself"""
+    return zlib.crc32(paragraph.encode("utf-8")) % 4 == 0
+
+
+def split_into_chunks(text: str, max_tokens: int = 1500, overlap_tokens: int = 100) -> List[str]:
+    """Split text into chunks of at most ~max_tokens, aligned to paragraphs
+
+    Once a chunk is half full it also ends after "anchor" paragraphs chosen by content hash,
+    so editing one paragraph only changes the chunks around it and the rest stay cache hits.
+    Each chunk after the first starts with the last ~overlap_tokens of the previous one.
+    """
+    if max_tokens <= overlap_tokens:
+        raise ValueError(f"max_tokens ({max_tokens}) must be greater than overlap_tokens ({overlap_tokens})")
+    paragraphs = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if paragraph:
+            paragraphs.extend(_split_oversized(paragraph, max_tokens - overlap_tokens))
+
+    chunks, current = [], []
+    current_tokens = 0
+    for paragraph in paragraphs:
+        tokens = estimate_tokens(paragraph)
+        if current and current_tokens + tokens > max_tokens - overlap_tokens:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += tokens
+        if current_tokens >= (max_tokens - overlap_tokens) // 2 and _is_anchor(paragraph):
+            chunks.append(current)
+            current, current_tokens = [], 0
+    if current:
+        chunks.append(current)
+
+    result = []
+    for index, chunk in enumerate(chunks):
+        body = "\n\n".join(chunk)
+        if index and overlap_tokens:
+            result.append(_tail(chunks[index - 1], overlap_tokens) + "\n\n" + body)
+        else:
+            result.append(body)
+    return result
+
+
+def _tail(paragraphs: List[str], overlap_tokens: int) -> str:
+    """Whole sentences from the end of a chunk, up to overlap_tokens"""
+    sentences = _split_sentences(paragraphs[-1])
+    tail = []
+    for sentence in reversed(sentences):
+        if estimate_tokens(" ".join([sentence] + tail)) > overlap_tokens:
+            break
+        tail.insert(0, sentence)
+    return " ".join(tail)
+
+
+def _condensed_points(output: Dict[str, Any]) -> List[str]:
+    """What a chunk contributes to the reduce step"""
+    if "raw_content" in output:
+        return [output["raw_content"].strip()]
+    summary = output.get("summary", [])
+    if isinstance(summary, str):
+        summary = [summary]
+    return [str(point) for point in summary]
+
+
+def condense_long_text(client, deployment_id: str, payload: Dict[str, Any],
+                       parse: Callable[[Any], Dict[str, Any]],
+                       max_tokens: Optional[int] = None, overlap_tokens: int = 100,
+                       on_progress: Optional[Callable[[int, int, Any], None]] = None,
+                       thread_initializer: Optional[Callable[[], None]] = None,
+                       max_rounds: int = 3) -> str:
+    """Map step of map-reduce: summarize chunks concurrently and return the condensed text
+
+    The caller sends the condensed text through its normal request, which acts as the reduce
+    step and returns the usual summary/citations/hypotheses/section_draft shape. Each chunk is
+    sent in the same payload shape as a normal request, so chunk results land in the response
+    cache and an edit only re-runs the chunks it touched. If every chunk of a round fails, the
+    first error is raised (JobCancelled takes precedence).
+    """
+    # Imported here: prompt_compaction imports this module for estimate_tokens
+    from prompt_compaction import payload_messages
+
+    if max_tokens is None:
+        max_tokens = int(os.getenv("CHUNK_MAX_TOKENS", "3000"))
+
+    text = payload["text"]
+    for round_number in range(max_rounds):
+        if estimate_tokens(text) <= max_tokens:
+            break
+
+        chunks = split_into_chunks(text, max_tokens, overlap_tokens)
+        logger.info("Condensing %d tokens in %d chunks (round %d)",
+                    estimate_tokens(text), len(chunks), round_number + 1)
+        messages_list = [payload_messages(dict(payload, text=chunk)) for chunk in chunks]
+        results = run_batch(client, deployment_id, messages_list,
+                            on_progress=on_progress, thread_initializer=thread_initializer)
+
+        # Nothing was condensed (service down, job cancelled): another round would only resend the same text
+        errors = [result.error for result in results if not result.ok]
+        if len(errors) == len(results):
+            raise next((error for error in errors if isinstance(error, JobCancelled)), errors[0])
+
+        sections = []
+        for index, (chunk, result) in enumerate(zip(chunks, results), 1):
+            if result.ok:
+                points = _condensed_points(parse(result.result))
+            else:
+                # Keep the original text rather than silently dropping part of the paper
+                logger.warning("Chunk %d failed (%s); keeping its text", index, result.error)
+                points = [chunk]
+            sections.append(f"Part {index}:\n" + "\n".join(f"- {point}" for point in points))
+        text = "\n\n".join(sections)
+
+    return text
@@ -0,0 +1,321 @@
+"""Deterministic APA / MLA / IEEE / BibTeX formatting of paper metadata, one entry or thousands"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+STYLES = ("APA", "MLA", "IEEE", "BibTeX")
+
+# One author as (family, given); given may be empty
+Author = Tuple[str, str]
+
+_INITIALS = re.compile(r"^(?:[A-Z]\.?(?:-[A-Z]\.?)?\s*)+$")
+_AUTHOR_SEPARATOR = re.compile(r"\s*(?:;|&|\band\b)\s*", re.IGNORECASE)
+_ET_AL = re.compile(r",?\s*et\.?\s+al\.?\s*$", re.IGNORECASE)
+_PARTICLES = {"van", "von", "der", "den", "de", "del", "della", "da", "di", "du", "la", "le", "bin", "al"}
+_DOI = re.compile(r"^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)?(10\.\d{4,9}/\S+)$", re.IGNORECASE)
+_BIBTEX_SPECIAL = re.compile(r"([&%$#_])")
+_STOPWORDS = {"a", "an", "the", "of", "on", "in", "for", "and", "to", "with", "at", "by"}
+
+
+def _split_given_family(name: str) -> Author:
+    """'John van Doe' -> ('van Doe', 'John'); 'Smith J' (family first, initials last) -> ('Smith', 'J')"""
+    words = name.split()
+    if not words:
+        return "", ""
+    if len(words) > 1 and _INITIALS.match(words[-1]) and not _INITIALS.match(words[0]):
+        return " ".join(words[:-1]), words[-1]
+    family_start = len(words) - 1
+    while family_start > 0 and words[family_start - 1].lower() in _PARTICLES:
+        family_start -= 1
+    return " ".join(words[family_start:]), " ".join(words[:family_start])
+
+
+@lru_cache(maxsize=8192)
+def parse_authors(authors: str) -> Tuple[Tuple[Author, ...], bool]:
+    """Parse an author string into ((family, given), ...) plus whether it ended in 'et al.'
+
+    Understands 'J. Smith, A. Doe', 'Smith, J., & Doe, A.', 'Smith, John; Doe, Alice',
+    'John Smith and Alice Doe' and 'Smith J, Doe A'. Cached, since bibliographies repeat authors.
+    """
+    text = authors.strip()
+    et_al = bool(_ET_AL.search(text))
+    text = _ET_AL.sub("", text)
+    if not text:
+        return (), et_al
+
+    if _AUTHOR_SEPARATOR.search(text):
+        people = []
+        for part in _AUTHOR_SEPARATOR.split(text):
+            part = part.strip(" ,")
+            if not part:
+                continue
+            if "," in part:
+                family, given = part.split(",", 1)
+                people.append((family.strip(), given.strip(" ,")))
+            else:
+                people.append(_split_given_family(part))
+        # 'Smith, J., Doe, A., & Roe, B.' leaves family-first pairs in the first part
+        if len(people) > 1 and "," in people[0][1]:
+            head, _ = parse_authors(f"{people[0][0]}, {people[0][1]}")
+            people = list(head) + people[1:]
+        return tuple(people), et_al
+
+    tokens = [token.strip() for token in text.split(",") if token.strip()]
+    family_first = len(tokens) % 2 == 0 and (
+        all(_INITIALS.match(given) for given in tokens[1::2])
+        or all(" " not in token for token in tokens)
+    )
+    if family_first:
+        return tuple((tokens[i], tokens[i + 1]) for i in range(0, len(tokens), 2)), et_al
+    return tuple(_split_given_family(token) for token in tokens), et_al
+
+
+def _initials(given: str) -> str:
+    """'John Ronald' -> 'J. R.', 'Jean-Paul' -> 'J.-P.', 'JR' -> 'J. R.'"""
+    parts = []
+    for word in given.replace(".", ". ").split():
+        if word.isupper() and len(word.rstrip(".")) > 1 and "-" not in word:
+            parts.extend(f"{letter}." for letter in word.rstrip("."))
+        else:
+            parts.append("-".join(f"{piece[0]}." for piece in word.split("-") if piece))
+    return " ".join(parts)
+
+
+def normalize_doi(value: str) -> Tuple[str, str]:
+    """(doi, url) from a DOI, a doi.org link or any other URL"""
+    value = (value or "").strip()
+    match = _DOI.match(value)
+    if match:
+        return match.group(1), f"https://doi.org/{match.group(1)}"
+    return "", value
+
+
+def _field(entry: Dict[str, Any], name: str) -> str:
+    value = entry.get(name)
+    return "" if value is None else str(value).strip()
+
+
+def _sentence_end(text: str) -> str:
+    return text if text[-1:] in ".?!" else f"{text}."
+
+
+def _italic(text: str, markdown: bool) -> str:
+    return f"*{text}*" if markdown and text else text
+
+
+def _apa_authors(people, et_al: bool) -> str:
+    names = [f"{family}, {_initials(given)}".rstrip(", ") for family, given in people]
+    if len(names) > 20:
+        return ", ".join(names[:19]) + ", . . . " + names[-1]
+    if et_al and names:
+        return ", ".join(names) + ", et al."
+    if len(names) <= 1:
+        return "".join(names)
+    return ", ".join(names[:-1]) + ", & " + names[-1]
+
+
+def format_apa(entry: Dict[str, Any], markdown: bool = True) -> str:
+    people, et_al = parse_authors(_field(entry, "authors"))
+    title, journal, year = _field(entry, "title"), _field(entry, "journal"), _field(entry, "year")
+    _, url = normalize_doi(_field(entry, "doi") or _field(entry, "url"))
+
+    parts = []
+    authors = _apa_authors(people, et_al)
+    date = f"({year or 'n.d.'})."
+    if authors:
+        parts += [_sentence_end(authors), date]
+        if title:
+            parts.append(_sentence_end(title))
+    elif title:
+        parts += [_sentence_end(title), date]
+    else:
+        parts.append(date)
+
+    if journal:
+        source = _italic(journal, markdown)
+        volume, issue, pages = _field(entry, "volume"), _field(entry, "issue"), _field(entry, "pages")
+        if volume:
+            source += f", {_italic(volume, markdown)}"
+            if issue:
+                source += f"({issue})"
+        if pages:
+            source += f", {pages}"
+        parts.append(f"{source}.")
+    if url:
+        parts.append(url)
+    return " ".join(parts)
+
+
+def format_mla(entry: Dict[str, Any], markdown: bool = True) -> str:
+    people, et_al = parse_authors(_field(entry, "authors"))
+    title, journal, year = _field(entry, "title"), _field(entry, "journal"), _field(entry, "year")
+    _, url = normalize_doi(_field(entry, "doi") or _field(entry, "url"))
+
+    if not people:
+        authors = ""
+    elif len(people) >= 3 or et_al:
+        authors = f"{', '.join(filter(None, people[0]))}, et al."
+    elif len(people) == 2:
+        authors = f"{', '.join(filter(None, people[0]))}, and {' '.join(filter(None, reversed(people[1])))}"
+    else:
+        authors = ", ".join(filter(None, people[0]))
+
+    parts = []
+    if authors:
+        parts.append(_sentence_end(authors))
+    if title:
+        parts.append(f"“{_sentence_end(title)}”")
+
+    container = []
+    if journal:
+        container.append(_italic(journal, markdown))
+    if _field(entry, "volume"):
+        container.append(f"vol. {_field(entry, 'volume')}")
+    if _field(entry, "issue"):
+        container.append(f"no. {_field(entry, 'issue')}")
+    if year:
+        container.append(year)
+    if _field(entry, "pages"):
+        container.append(f"pp. {_field(entry, 'pages')}")
+    if url:
+        container.append(url)
+    if container:
+        parts.append(", ".join(container) + ".")
+    return " ".join(parts)
+
+
+def format_ieee(entry: Dict[str, Any], markdown: bool = True) -> str:
+    people, et_al = parse_authors(_field(entry, "authors"))
+    title, journal, year = _field(entry, "title"), _field(entry, "journal"), _field(entry, "year")
+    doi, url = normalize_doi(_field(entry, "doi") or _field(entry, "url"))
+
+    names = [f"{_initials(given)} {family}".strip() for family, given in people]
+    if len(names) > 6 or (et_al and names):
+        authors = f"{names[0]} et al."
+    elif len(names) > 2:
+        authors = ", ".join(names[:-1]) + ", and " + names[-1]
+    else:
+        authors = " and ".join(names)
+
+    parts = []
+    if authors:
+        parts.append(authors)
+    if title:
+        parts.append(f"“{title},”")
+    if journal:
+        parts.append(_italic(journal, markdown))
+    if _field(entry, "volume"):
+        parts.append(f"vol. {_field(entry, 'volume')}")
+    if _field(entry, "issue"):
+        parts.append(f"no. {_field(entry, 'issue')}")
+    if _field(entry, "pages"):
+        parts.append(f"pp. {_field(entry, 'pages')}")
+    if year:
+        parts.append(year)
+    citation = ", ".join(parts).replace(",”,", ",”")
+    if doi:
+        citation += f", doi: {doi}"
+    elif url:
+        citation += f". [Online]. Available: {url}"
+    return _sentence_end(citation) if citation else ""
+
+
+def _ascii(text: str) -> str:
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def bibtex_key(entry: Dict[str, Any]) -> str:
+    """smith2024machine: first author's family name, year and first significant title word"""
+    people, _ = parse_authors(_field(entry, "authors"))
+    family = re.sub(r"[^a-z]", "", _ascii(people[0][0]).lower()) if people else ""
+    words = [re.sub(r"[^a-z0-9]", "", _ascii(word).lower()) for word in _field(entry, "title").split()]
+    word = next((w for w in words if w and w not in _STOPWORDS), "")
+    return f"{family or 'anon'}{_field(entry, 'year')}{word}"
+
+
+def format_bibtex(entry: Dict[str, Any], key: Optional[str] = None) -> str:
+    people, et_al = parse_authors(_field(entry, "authors"))
+    doi, url = normalize_doi(_field(entry, "doi") or _field(entry, "url"))
+
+    def escape(value: str) -> str:
+        return _BIBTEX_SPECIAL.sub(r"\\\1", value)
+
+    authors = " and ".join(f"{family}, {given}".rstrip(", ") for family, given in people)
+    if et_al and authors:
+        authors += " and others"
+    fields = [
+        ("author", escape(authors)),
+        ("title", "{" + escape(_field(entry, "title")) + "}"),  # double braces keep the capitalization
+        ("journal", escape(_field(entry, "journal"))),
+        ("year", _field(entry, "year")),
+        ("volume", _field(entry, "volume")),
+        ("number", _field(entry, "issue")),
+        ("pages", _field(entry, "pages").replace("-", "--").replace("----", "--")),
+        ("doi", doi),
+        ("url", "" if doi else url),
+    ]
+    body = ",\n".join(f"  {name} = {{{value}}}" for name, value in fields if value and value != "{}")
+    kind = "article" if _field(entry, "journal") else "misc"
+    return f"@{kind}{{{key or bibtex_key(entry)},\n{body}\n}}"
+
+
+_FORMATTERS = {"APA": format_apa, "MLA": format_mla, "IEEE": format_ieee}
+
+
+def format_citation(entry: Dict[str, Any], style: str = "APA", markdown: bool = True) -> str:
+    """One citation; entry has title, authors, journal, year, doi (and optionally url/volume/issue/pages)"""
+    style = style.upper() if style.upper() != "BIBTEX" else "BibTeX"
+    if style == "BibTeX":
+        return format_bibtex(entry)
+    if style not in _FORMATTERS:
+        raise ValueError(f"Unknown citation style {style!r}; expected one of {', '.join(STYLES)}")
+    return _FORMATTERS[style](entry, markdown)
+
+
+def format_citations(metadata: Dict[str, Any], styles: Iterable[str] = STYLES,
+                     markdown: bool = True) -> Dict[str, str]:
+    """The paper's citation in every style, as the app's citations dict (style -> citation)"""
+    return {style: format_citation(metadata, style, markdown) for style in styles}
+
+
+def has_citation_metadata(metadata: Dict[str, Any]) -> bool:
+    return bool(_field(metadata, "title") and (_field(metadata, "authors") or _field(metadata, "journal")))
+
+
+def format_bibliography(entries: List[Dict[str, Any]], style: str = "APA", markdown: bool = True,
+                        sort: Optional[bool] = None) -> List[str]:
+    """Format many entries at once
+
+    APA and MLA lists are sorted by first author (then year) unless sort=False; IEEE keeps
+    the given order, since entries are numbered by first citation. BibTeX keys are made
+    unique with a/b/c suffixes.
+    """
+    style = style.upper() if style.upper() != "BIBTEX" else "BibTeX"
+    if sort is None:
+        sort = style in ("APA", "MLA")
+    if sort:
+        def sort_key(entry):
+            people, _ = parse_authors(_field(entry, "authors"))
+            first = people[0][0] if people else _field(entry, "title")
+            return _ascii(first).lower(), _field(entry, "year")
+        entries = sorted(entries, key=sort_key)
+
+    if style != "BibTeX":
+        formatter = _FORMATTERS.get(style)
+        if formatter is None:
+            raise ValueError(f"Unknown citation style {style!r}; expected one of {', '.join(STYLES)}")
+        return [formatter(entry, markdown) for entry in entries]
+
+    keys = [bibtex_key(entry) for entry in entries]
+    counts: Dict[str, int] = {}
+    for key in keys:
+        counts[key] = counts.get(key, 0) + 1
+    seen: Dict[str, int] = {}
+    formatted = []
+    for entry, key in zip(entries, keys):
+        if counts[key] > 1:
+            seen[key] = seen.get(key, 0) + 1
+            key += "abcdefghijklmnopqrstuvwxyz"[(seen[key] - 1) % 26]
+        formatted.append(format_bibtex(entry, key))
+    return formatted
@@ -0,0 +1,106 @@
+"""Command line entry point: run JSONL payload batches or the HTTP service without the Streamlit UI
+
+    python cli.py run payloads.jsonl -o results.jsonl --workers 4
+    cat payloads.jsonl | python cli.py run - > results.jsonl
+    python cli.py serve --port 8080
+
+Each input line has the app's payload shape:
+    {"id": "p1", "text": "...", "metadata": {"title": "...", "authors": "...", "year": 2024},
+     "research_question": "...", "section": {"type": "Introduction", "topic": "..."}}
+"""
+import sys
+import json
+import logging
+import argparse
+import threading
+
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+def check_settings(settings, store: bool) -> bool:
+    needed = ["API_KEY", "DEPLOYMENT_ID"] + (["COS_API_KEY", "COS_INSTANCE_ID", "COS_ENDPOINT", "COS_BUCKET"]
+                                             if store else [])
+    missing = [name for name in settings.missing() if name in needed]
+    if missing:
+        print(f"Missing environment variables: {', '.join(missing)} (set them or add them to .env)", file=sys.stderr)
+    return not missing
+
+
+def run(args, settings) -> int:
+    # Imported here so `cli.py --help` stays fast
+    from pipeline import process_payloads
+    from service import build_client
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    cancel_event = threading.Event()
+
+    def show_progress(stats):
+        finished = stats.done + stats.failed
+        if finished % args.progress_every == 0:
+            print(f"{finished} processed ({stats.failed} failed, {stats.invalid} invalid)", file=sys.stderr)
+
+    try:
+        stats = process_payloads(build_client(settings), str(settings.deployment_id), source, out,
+                                 max_workers=args.workers, store=args.store, cancel_event=cancel_event,
+                                 on_progress=show_progress)
+    except KeyboardInterrupt:
+        cancel_event.set()
+        print("Cancelled; results written so far are complete lines", file=sys.stderr)
+        return 130
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+
+    if args.store:
+        from upload_queue import get_upload_queue
+        if not get_upload_queue().drain(timeout=args.upload_timeout):
+            print("Some outputs are still spooled; they are uploaded on the next start", file=sys.stderr)
+    print(json.dumps(stats.as_dict()), file=sys.stderr)
+    return 1 if stats.failed or stats.invalid else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="process a JSONL file of payloads")
+    run_parser.add_argument("input", help="JSONL payloads, or - for stdin")
+    run_parser.add_argument("-o", "--output", default="-", help="JSONL results (default: stdout)")
+    run_parser.add_argument("--workers", type=int, default=None,
+                            help="requests in flight (default: BATCH_MAX_WORKERS or 3)")
+    run_parser.add_argument("--store", action="store_true",
+                            help="also index results for search and upload them to Cloud Object Storage")
+    run_parser.add_argument("--upload-timeout", type=float, default=120.0,
+                            help="seconds to wait for uploads at the end with --store")
+    run_parser.add_argument("--progress-every", type=int, default=10)
+
+    serve_parser = commands.add_parser("serve", help="run the HTTP service")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--store", action="store_true",
+                              help="also index results for search and upload them to Cloud Object Storage")
+
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    # The service logs each request; batch runs only report problems unless -v is given
+    logging.basicConfig(level=logging.INFO if args.verbose or args.command == "serve" else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+    settings = get_settings()
+    if not check_settings(settings, args.store):
+        return 2
+    if args.command == "run":
+        return run(args, settings)
+
+    from service import serve
+    serve(settings, args.host, args.port, store=args.store)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
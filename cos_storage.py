@@ -0,0 +1,112 @@
+"""IBM Cloud Object Storage helpers (no Streamlit dependency, safe to call from worker threads)"""
+import os
+import time
+import threading
+import logging
+
+# ibm_boto3 is imported on first use: it is slow to import and most app runs never upload
+
+logger = logging.getLogger(__name__)
+
+_cos_client = None
+_cos_client_lock = threading.Lock()
+
+# Buckets we've already seen (or created) in this process
+_known_buckets = set()
+
+
+def get_cos_bucket() -> str:
+    return os.getenv("COS_BUCKET")
+
+
+def get_cos_client():
+    """Get IBM COS client, built once per process (boto clients are thread-safe)"""
+    global _cos_client
+    with _cos_client_lock:
+        if _cos_client is not None:
+            return _cos_client
+
+        api_key = os.getenv("COS_API_KEY")
+        instance_id = os.getenv("COS_INSTANCE_ID")
+        if not api_key or not instance_id:
+            return None
+
+        try:
+            import ibm_boto3
+            from ibm_botocore.client import Config
+            _cos_client = ibm_boto3.client("s3",
+                ibm_api_key_id=api_key,
+                ibm_service_instance_id=instance_id,
+                config=Config(signature_version="oauth", max_pool_connections=10),
+                endpoint_url=os.getenv("COS_ENDPOINT")
+            )
+        except Exception as e:
+            logger.error(f"Error creating COS client: {str(e)}")
+            return None
+        return _cos_client
+
+
+def ensure_bucket_exists(cos_client, bucket_name):
+    """Create bucket if it doesn't exist; checked once per process"""
+    if bucket_name in _known_buckets:
+        return True
+    from ibm_botocore.exceptions import ClientError
+
+    try:
+        # Check if the bucket exists
+        cos_client.head_bucket(Bucket=bucket_name)
+        _known_buckets.add(bucket_name)
+        return True
+    except ClientError as e:
+        # If a client error is thrown, check if it's a 404 error.
+        if e.response.get('Error', {}).get('Code') == '404':
+            try:
+                # Create the bucket
+                location_constraint = 'us-south-standard'
+                cos_client.create_bucket(
+                    Bucket=bucket_name,
+                    CreateBucketConfiguration={
+                        'LocationConstraint': location_constraint
+                    }
+                )
+                _known_buckets.add(bucket_name)
+                return True
+            except Exception as create_e:
+                logger.error(f"Error creating bucket: {str(create_e)}")
+                return False
+        else:
+            logger.error(f"Error checking bucket: {str(e)}")
+            return False
+    except Exception as e:
+        logger.error(f"Unexpected error with bucket {bucket_name}: {str(e)}")
+        return False
+
+
+def upload_to_cos(filename: str, data, max_retries=3, cos_client=None, bucket=None, **put_kwargs):
+    """Upload data (str or bytes) to IBM Cloud Object Storage with retries"""
+    cos_client = cos_client or get_cos_client()
+    bucket = bucket or get_cos_bucket()
+    if not cos_client:
+        return False
+
+    body = data.encode('utf-8') if isinstance(data, str) else data
+    for attempt in range(max_retries):
+        try:
+            # Ensure bucket exists
+            if not ensure_bucket_exists(cos_client, bucket):
+                return False
+
+            # Upload the file
+            cos_client.put_object(
+                Bucket=bucket,
+                Key=filename,
+                Body=body,
+                **put_kwargs
+            )
+            return True
+        except Exception as e:
+            if attempt < max_retries - 1:
+                time.sleep(2 ** attempt)  # Exponential backoff
+            else:
+                logger.error(f"COS upload error after {max_retries} attempts: {str(e)}")
+                return False
@@ -0,0 +1,254 @@
+"""Pool of watsonx.ai endpoints (region, deployment, API key) with health- and latency-aware routing"""
+import os
+import json
+import time
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from rate_limiter import RateLimiter, create_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+REGION_URL = "https://{region}.ml.cloud.ibm.com/ml/v1"
+DEFAULT_REGION = "us-south"
+
+# Weight of the newest sample in the latency average
+EWMA_ALPHA = 0.3
+# Consecutive failures (5xx, timeouts, connection errors) before an endpoint is taken out of rotation
+FAILURES_TO_EJECT = 3
+
+
+def region_url(region: str) -> str:
+    return REGION_URL.format(region=region)
+
+
+def default_base_url() -> str:
+    """The API base URL when no pool is configured: WATSONX_URL, else the WATSONX_REGION endpoint"""
+    return os.getenv("WATSONX_URL") or region_url(os.getenv("WATSONX_REGION", DEFAULT_REGION))
+
+
+class Endpoint:
+    """One place requests can go, with its own quota, token and health/latency stats"""
+
+    def __init__(self, name: str, base_url: str, rate_limiter: RateLimiter,
+                 deployment_id: Optional[str] = None, api_key: Optional[str] = None,
+                 token_manager=None, cooldown: float = 30.0):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.deployment_id = deployment_id  # None: use the deployment the caller asked for
+        self.api_key = api_key              # None: use the client's key
+        self.rate_limiter = rate_limiter
+        self.token_manager = token_manager  # set by the client on first use when None
+        self.adaptive = None                # AdaptiveLimiter, attached by the client when enabled
+        self.cooldown = cooldown
+
+        self._lock = threading.Lock()
+        self.ewma_latency: Optional[float] = None
+        self.in_flight = 0
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.throttled = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0  # time.monotonic(); out of rotation until then
+        self.last_error: Optional[str] = None
+
+    def url(self, deployment_id: str, path: str) -> str:
+        return f"{self.base_url}/deployments/{self.deployment_id or deployment_id}/{path}"
+
+    def ready_in(self, now: Optional[float] = None) -> float:
+        """Seconds until this endpoint can take a request (cooldown and quota)"""
+        now = time.monotonic() if now is None else now
+        return max(self.cooldown_until - now, self.rate_limiter.wait_time(), 0.0)
+
+    def available(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        return self.cooldown_until <= now
+
+    def score(self) -> float:
+        """Expected wait for a new request: lower is better; untried endpoints go first"""
+        return (self.ewma_latency or 0.0) * (1 + self.in_flight)
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+
+    def succeeded(self, seconds: float):
+        with self._lock:
+            self.in_flight -= 1
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.ewma_latency = seconds if self.ewma_latency is None else \
+                EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.ewma_latency
+
+    def failed(self, error: str):
+        """A 5xx, timeout or connection error; repeated failures take the endpoint out for `cooldown`"""
+        with self._lock:
+            self.in_flight -= 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+            if self.cooldown > 0 and self.consecutive_failures >= FAILURES_TO_EJECT:
+                self.cooldown_until = time.monotonic() + self.cooldown
+                logger.warning("Endpoint %s failed %d times in a row, out of rotation for %.0fs",
+                               self.name, self.consecutive_failures, self.cooldown)
+
+    def throttle(self, seconds: float):
+        """A 429: the quota is used up here for `seconds`, the endpoint itself is fine"""
+        with self._lock:
+            self.in_flight -= 1
+            self.throttled += 1
+        self.pause(seconds)
+
+    def pause(self, seconds: float):
+        """Send nothing here for `seconds` (Retry-After, or rate-limit headers saying the quota is gone)"""
+        with self._lock:
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+
+    def release(self):
+        """The attempt ended without telling us anything about the endpoint (e.g. a 401)"""
+        with self._lock:
+            self.in_flight -= 1
+
+    @property
+    def key(self) -> str:
+        """Identifies the endpoint across restarts (learned limits are saved under it)"""
+        return f"{self.name}@{self.base_url}"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "deployment_id": self.deployment_id,
+            "healthy": self.available(),
+            "ready_in_s": round(self.ready_in(), 1),
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "requests_last_minute": self.rate_limiter.requests_last_minute(),
+            "last_error": self.last_error,
+            "adaptive": self.adaptive.as_dict() if self.adaptive is not None else None,
+        }
+
+
+class EndpointPool:
+    """Routes each attempt to the endpoint with headroom and the lowest expected latency
+
+    Endpoints in cooldown (repeated failures or a 429) and those that already failed the
+    current request are only used when nothing else is left.
+    """
+
+    def __init__(self, endpoints: Sequence[Endpoint]):
+        if not endpoints:
+            raise ValueError("An endpoint pool needs at least one endpoint")
+        self.endpoints = list(endpoints)
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def ranked(self, avoid: Sequence[Endpoint] = ()) -> List[Endpoint]:
+        now = time.monotonic()
+        return sorted(self.endpoints, key=lambda e: (e in avoid, not e.available(now), e.score()))
+
+    def has_alternative(self, avoid: Sequence[Endpoint]) -> bool:
+        """Is there a healthy endpoint this request hasn't failed on yet?"""
+        now = time.monotonic()
+        return any(e not in avoid and e.available(now) for e in self.endpoints)
+
+    def acquire(self, avoid: Sequence[Endpoint] = (), on_wait: Optional[Callable[[float, int], None]] = None,
+                cancel_event: Optional[threading.Event] = None) -> Optional[Endpoint]:
+        """Pick an endpoint and take a rate-limit token from it; None if cancelled while waiting"""
+        ranked = self.ranked(avoid)
+        now = time.monotonic()
+        for endpoint in ranked:
+            if endpoint not in avoid and endpoint.available(now) and endpoint.rate_limiter.acquire(timeout=0):
+                return endpoint
+
+        # Nothing can send right now: queue on whichever endpoint frees up first
+        endpoint = min(ranked, key=lambda e: (e in avoid, e.ready_in(now)))
+        cooldown = endpoint.cooldown_until - now
+        if cooldown > 0:
+            if on_wait:
+                on_wait(cooldown, 0)
+            if cancel_event is None:
+                time.sleep(cooldown)
+            elif cancel_event.wait(cooldown):
+                return None
+        if not endpoint.rate_limiter.acquire(on_wait=on_wait, cancel_event=cancel_event):
+            return None
+        return endpoint
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [endpoint.as_dict() for endpoint in self.endpoints]
+
+
+def pool_from_config(config: List[Dict[str, Any]], default_api_key: Optional[str] = None,
+                     default_deployment_id: Optional[str] = None) -> EndpointPool:
+    """Build a pool from WATSONX_ENDPOINTS-style entries
+
+    Each entry has "region" or "url", and optionally "name", "deployment_id", "api_key",
+    "requests_per_minute" and "requests_per_hour"; missing keys and deployments fall back to
+    API_KEY/DEPLOYMENT_ID, missing limits to REQUESTS_PER_MINUTE/REQUESTS_PER_HOUR. With
+    RATE_LIMIT_BACKEND=sqlite each endpoint's quota is shared between processes too.
+    """
+    cooldown = float(os.getenv("ENDPOINT_COOLDOWN", "30"))
+    endpoints = []
+    for position, entry in enumerate(config):
+        base_url = entry.get("url") or region_url(entry.get("region", DEFAULT_REGION))
+        name = entry.get("name") or entry.get("region") or f"endpoint-{position + 1}"
+        limiter = create_rate_limiter(
+            int(entry.get("requests_per_minute", os.getenv("REQUESTS_PER_MINUTE", "5"))),
+            int(entry.get("requests_per_hour", os.getenv("REQUESTS_PER_HOUR", "100"))),
+            prefix=f"{name}@{base_url.rstrip('/')}:",
+        )
+        endpoints.append(Endpoint(
+            name, base_url, limiter,
+            deployment_id=entry.get("deployment_id") or default_deployment_id,
+            api_key=entry.get("api_key") or default_api_key,
+            cooldown=cooldown,
+        ))
+    return EndpointPool(endpoints)
+
+
+_pool = None
+_pool_created = False
+_pool_lock = threading.Lock()
+_default_pools: Dict[tuple, EndpointPool] = {}
+
+
+def get_default_pool(base_url: str, rate_limiter: RateLimiter, token_manager=None) -> EndpointPool:
+    """Process-wide one-endpoint pool for clients without WATSONX_ENDPOINTS, so a 429's cooldown holds for every session
+
+    A lone endpoint never cools down after failures, since there is nowhere else to send them.
+    """
+    # The pool keeps the limiter and token manager alive, so their ids stay unique
+    key = (base_url.rstrip("/"), id(rate_limiter), id(token_manager))
+    with _pool_lock:
+        pool = _default_pools.get(key)
+        if pool is None:
+            pool = _default_pools[key] = EndpointPool([
+                Endpoint("default", base_url, rate_limiter, token_manager=token_manager, cooldown=0)
+            ])
+        return pool
+
+
+def get_endpoint_pool() -> Optional[EndpointPool]:
+    """Process-wide pool from WATSONX_ENDPOINTS (a JSON list); None when it isn't set"""
+    global _pool, _pool_created
+    with _pool_lock:
+        if not _pool_created:
+            raw = os.getenv("WATSONX_ENDPOINTS")
+            if raw:
+                try:
+                    _pool = pool_from_config(json.loads(raw), os.getenv("API_KEY"), os.getenv("DEPLOYMENT_ID"))
+                    logger.info("Routing across %d endpoints: %s", len(_pool),
+                                ", ".join(e.name for e in _pool.endpoints))
+                except (ValueError, TypeError, AttributeError) as e:
+                    logger.error(f"Ignoring invalid WATSONX_ENDPOINTS: {str(e)}")
+            _pool_created = True
+        return _pool
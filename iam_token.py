@@ -0,0 +1,197 @@
+"""Process-wide IAM token manager: proactive background refresh and single-flight fetches"""
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from typing import Dict, Optional, Tuple
+
+import requests
+
+from tracing import traced
+
+logger = logging.getLogger(__name__)
+
+IAM_TOKEN_URL = "https://iam.cloud.ibm.com/identity/token"
+
+
+class TokenManager:
+    """Keeps one valid IAM token per API key for every session in the process
+
+    Only one thread talks to IAM at a time; others wait for its result. A daemon thread
+    refreshes the token `refresh_margin` seconds before it expires, so requests normally
+    never pay for an IAM round trip. Optionally the token is cached in a file so a restarted
+    server can reuse it.
+    """
+
+    def __init__(self, api_key: str, iam_token_url: str = IAM_TOKEN_URL,
+                 session: Optional[requests.Session] = None, refresh_margin: float = 300,
+                 cache_path: Optional[str] = None, timeout: Tuple[float, float] = (5, 30)):
+        self.api_key = api_key
+        self.iam_token_url = iam_token_url
+        self.session = session or requests.Session()
+        self.refresh_margin = refresh_margin
+        self.cache_path = cache_path
+        self.timeout = timeout
+
+        self.access_token: Optional[str] = None
+        self.expires_at = 0.0
+        self.refresh_count = 0
+
+        self._key_id = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._refreshed = threading.Condition(self._lock)
+        self._last_error: Optional[Exception] = None
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._load_cached_token()
+
+    def is_valid(self) -> bool:
+        return bool(self.access_token) and time.time() < self.expires_at - self.refresh_margin
+
+    def get_token(self) -> str:
+        """Return a valid token, fetching one only if none is available"""
+        self._start_refresher()
+        if self.is_valid():
+            return self.access_token
+        return self.refresh()
+
+    def invalidate(self, token: Optional[str]) -> str:
+        """Called after a 401; refreshes unless another thread already replaced that token"""
+        with self._lock:
+            if token is not None and token != self.access_token and self.is_valid():
+                return self.access_token
+            self.expires_at = 0.0
+        return self.refresh()
+
+    def refresh(self) -> str:
+        """Fetch a new token; concurrent callers share a single IAM request"""
+        with self._lock:
+            if self._refreshing:
+                # Someone else is already talking to IAM; wait for their result
+                while self._refreshing:
+                    self._refreshed.wait()
+                if self.access_token and time.time() < self.expires_at:
+                    return self.access_token
+                raise self._last_error or Exception("IAM token refresh failed")
+            self._refreshing = True
+
+        try:
+            token, expires_at = self._fetch()
+        except Exception as e:
+            with self._lock:
+                self._last_error = e
+                self._refreshing = False
+                self._refreshed.notify_all()
+            raise
+
+        with self._lock:
+            self.access_token = token
+            self.expires_at = expires_at
+            self.refresh_count += 1
+            self._last_error = None
+            self._refreshing = False
+            self._refreshed.notify_all()
+        self._save_cached_token()
+        self._wake.set()  # reschedule the background refresh
+        return token
+
+    @traced("iam_authenticate")
+    def _fetch(self) -> Tuple[str, float]:
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        data = {
+            "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
+            "apikey": self.api_key
+        }
+        response = self.session.post(self.iam_token_url, headers=headers, data=data, timeout=self.timeout)
+        response.raise_for_status()
+
+        auth_data = response.json()
+        expires_in = auth_data.get('expires_in', 3600)
+        return auth_data.get('access_token'), time.time() + expires_in
+
+    def _start_refresher(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refresh_loop, name="iam-token-refresher",
+                                                daemon=True)
+                self._thread.start()
+
+    def _refresh_loop(self):
+        retry_delay = 5.0
+        while True:
+            if self.access_token:
+                delay = max(0.0, self.expires_at - self.refresh_margin - time.time())
+            else:
+                delay = None  # nothing to refresh until someone fetches a first token
+            self._wake.wait(delay)
+            self._wake.clear()
+
+            if not self.access_token or time.time() < self.expires_at - self.refresh_margin:
+                continue
+            try:
+                self.refresh()
+                retry_delay = 5.0
+            except Exception as e:
+                logger.warning(f"Background IAM token refresh failed: {str(e)}")
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60.0)
+
+    def _load_cached_token(self):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                cached = json.load(f).get(self._key_id)
+        except (OSError, ValueError):
+            return
+        if cached and cached["expires_at"] - self.refresh_margin > time.time():
+            self.access_token = cached["access_token"]
+            self.expires_at = cached["expires_at"]
+            logger.info("Reusing cached IAM token")
+
+    def _save_cached_token(self):
+        if not self.cache_path:
+            return
+        try:
+            directory = os.path.dirname(self.cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            try:
+                with open(self.cache_path, encoding="utf-8") as f:
+                    tokens = json.load(f)
+            except (OSError, ValueError):
+                tokens = {}
+            tokens[self._key_id] = {"access_token": self.access_token, "expires_at": self.expires_at}
+
+            # Write privately, then swap in atomically
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(tokens, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Could not cache IAM token: {str(e)}")
+
+
+_managers: Dict[Tuple[str, str], TokenManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_token_manager(api_key: str, iam_token_url: str = IAM_TOKEN_URL,
+                      session: Optional[requests.Session] = None) -> TokenManager:
+    """Return the process-wide token manager for this API key"""
+    with _managers_lock:
+        key = (api_key, iam_token_url)
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = TokenManager(
+                api_key, iam_token_url, session=session,
+                cache_path=os.getenv("IAM_TOKEN_CACHE") or None,
+            )
+        return manager
@@ -0,0 +1,159 @@
+"""Background generation jobs, so rate-limit waits and backoff never block a Streamlit script thread"""
+import os
+import time
+import uuid
+import threading
+import traceback
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+WAITING = "waiting"      # on the rate limiter or in retry backoff
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it has been cancelled"""
+
+
+class Job:
+    """State of one background job; read by the UI, written by the worker"""
+
+    def __init__(self, label: str, cancel_event: Optional[threading.Event] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.state = QUEUED
+        self.message = "Waiting for a free worker"
+        self.progress: Optional[float] = None  # 0..1 when known
+        self.partial_text = ""                 # streamed output so far
+        self.partial_result: Any = None        # result parsed from partial_text
+        self.warnings: List[str] = []
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        # Shared with other jobs when a whole batch is cancelled at once
+        self.cancel_event = cancel_event or threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def update(self, state: Optional[str] = None, message: Optional[str] = None,
+               progress: Optional[float] = None):
+        """Status callback for the client and batch helpers"""
+        if self.finished:
+            return
+        if state is not None:
+            self.state = state
+        if message is not None:
+            self.message = message
+        if progress is not None:
+            self.progress = progress
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.state == QUEUED:
+            self._finish(CANCELLED, "Cancelled before it started")
+
+    def _finish(self, state: str, message: str):
+        self.state = state
+        self.message = message
+        self.finished_at = time.time()
+        # Only shown while the job runs; the result replaces them
+        self.partial_text = ""
+        self.partial_result = None
+
+
+class JobManager:
+    """Runs jobs on a bounded thread pool and keeps their state for polling"""
+
+    def __init__(self, max_workers: int = 4, keep_seconds: float = 3600):
+        self.keep_seconds = keep_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[[Job], Any], label: str) -> Job:
+        """Queue fn(job); its return value becomes job.result"""
+        job = Job(label)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]):
+        if job.cancelled:
+            job._finish(CANCELLED, "Cancelled before it started")
+            return
+        job.update(RUNNING, "Starting")
+        try:
+            job.result = fn(job)
+        except JobCancelled:
+            job._finish(CANCELLED, "Cancelled")
+            return
+        except Exception as e:
+            if job.cancelled:
+                job._finish(CANCELLED, "Cancelled")
+                return
+            logger.error(traceback.format_exc())
+            job.error = str(e)
+            job._finish(FAILED, str(e))
+            return
+        if job.cancelled:
+            job._finish(CANCELLED, "Cancelled")
+        else:
+            job._finish(DONE, job.message)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel()
+        return True
+
+    def list_jobs(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    def active_count(self) -> int:
+        return sum(1 for job in list(self._jobs.values()) if not job.finished)
+
+    def _prune(self):
+        """Forget finished jobs nobody has collected for keep_seconds"""
+        cutoff = time.time() - self.keep_seconds
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished_at < cutoff:
+                del self._jobs[job_id]
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Return the process-wide job manager; JOB_WORKERS bounds concurrent jobs"""
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager(max_workers=int(os.getenv("JOB_WORKERS", "4")))
+        return _job_manager
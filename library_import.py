@@ -0,0 +1,466 @@
+"""Bulk import of reference libraries (BibTeX / RIS / CSV) and per-paper generation into JSONL"""
+import io
+import os
+import re
+import csv
+import json
+import logging
+import difflib
+import itertools
+import unicodedata
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from batch import imap_bounded
+from citations import format_citations, normalize_doi
+from prompt_compaction import compact_payload, payload_messages
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_FIELDS = ("title", "authors", "journal", "year", "doi", "url", "volume", "issue", "pages", "abstract")
+METADATA_FIELDS = ("title", "authors", "journal", "year", "doi")
+
+# BibTeX
+_BIBTEX_FIELDS = {
+    "title": "title", "author": "authors", "journal": "journal", "journaltitle": "journal",
+    "booktitle": "journal", "year": "year", "date": "year", "doi": "doi", "url": "url",
+    "volume": "volume", "number": "issue", "pages": "pages", "abstract": "abstract",
+}
+_BIBTEX_ACCENTS = {'"': "\u0308", "'": "\u0301", "`": "\u0300", "^": "\u0302", "~": "\u0303",
+                   "=": "\u0304", ".": "\u0307", "c": "\u0327", "v": "\u030c", "u": "\u0306", "H": "\u030b"}
+_BIBTEX_ACCENT = re.compile(r"\\([\"'`^~=.]|[cvuH](?=[\s{]))\s*\{?\s*([A-Za-z])\}?")
+_BIBTEX_ESCAPE = re.compile(r"\\([&%$#_{}])")
+_BIBTEX_FIELD_NAME = re.compile(r"\s*,?\s*([A-Za-z][\w\-:]*)\s*=\s*")
+_BIBTEX_AND = re.compile(r"\s+and\s+", re.IGNORECASE)
+_BIBTEX_START = re.compile(r"@\s*(\w+)\s*[{(]")
+_BIBTEX_BARE = re.compile(r"[^\s,#})]+")
+
+# RIS
+_RIS_LINE = re.compile(r"^([A-Z][A-Z0-9])  -(?: (.*))?$")
+_RIS_FIELDS = {
+    "TI": "title", "T1": "title", "CT": "title", "AU": "authors", "A1": "authors",
+    "JO": "journal", "JF": "journal", "T2": "journal", "JA": "journal", "BT": "journal",
+    "PY": "year", "Y1": "year", "DA": "year", "DO": "doi", "UR": "url", "VL": "volume",
+    "IS": "issue", "SP": "pages", "EP": "end_page", "AB": "abstract", "N2": "abstract",
+}
+
+# CSV headers, as exported by Zotero, Mendeley, Scopus and Web of Science
+_CSV_FIELDS = {
+    "title": "title", "article title": "title", "document title": "title",
+    "author": "authors", "authors": "authors", "author full names": "authors",
+    "journal": "journal", "publication title": "journal", "source title": "journal",
+    "source": "journal", "publication": "journal",
+    "year": "year", "publication year": "year", "date": "year",
+    "doi": "doi", "url": "url", "link": "url", "volume": "volume", "issue": "issue",
+    "number": "issue", "pages": "pages", "abstract": "abstract", "abstract note": "abstract",
+}
+
+_YEAR = re.compile(r"\b(1[5-9]\d\d|20\d\d)\b")
+_WORD = re.compile(r"[a-z0-9]+")
+_NUMBER = re.compile(r"\b\d+\b")
+
+
+def _clean_latex(value: str) -> str:
+    """{\\\"o}ber \\& {DNA} -> über & DNA"""
+    value = _BIBTEX_ACCENT.sub(lambda m: unicodedata.normalize("NFC", m.group(2) + _BIBTEX_ACCENTS[m.group(1)]), value)
+    value = _BIBTEX_ESCAPE.sub(r"\1", value.replace("\\{", "\x00").replace("\\}", "\x01"))
+    value = value.replace("{", "").replace("}", "").replace("\x00", "{").replace("\x01", "}")
+    return value.replace("---", "—").replace("--", "-").replace("~", " ")
+
+
+def _bibtex_value(text: str, i: int, strings: Dict[str, str]):
+    """Read one field value (braced, quoted, bare or #-concatenated) starting at text[i]"""
+    parts = []
+    length = len(text)
+    while i < length:
+        while i < length and text[i].isspace():
+            i += 1
+        if i >= length:
+            break
+        char = text[i]
+        if char in "{\"":
+            closing = "}" if char == "{" else '"'
+            depth, j = 0, i + 1
+            while j < length:
+                c = text[j]
+                if c == "\\":
+                    j += 2
+                    continue
+                if c == "{":
+                    depth += 1
+                elif c == "}" and depth:
+                    depth -= 1
+                elif c == closing and depth == 0:
+                    break
+                j += 1
+            parts.append(text[i + 1:j])
+            i = j + 1
+        else:
+            match = _BIBTEX_BARE.match(text, i)
+            if match is None:
+                break
+            word = match.group()
+            parts.append(strings.get(word.lower(), word))
+            i = match.end()
+        while i < length and text[i].isspace():
+            i += 1
+        if i < length and text[i] == "#":
+            i += 1
+            continue
+        break
+    return "".join(parts), i
+
+
+def _parse_bibtex_entry(kind: str, body: str, strings: Dict[str, str]) -> Optional[Dict[str, str]]:
+    if kind == "string":
+        match = _BIBTEX_FIELD_NAME.match(body)
+        if match:
+            value, _ = _bibtex_value(body, match.end(), strings)
+            strings[match.group(1).lower()] = value
+        return None
+    if kind in ("comment", "preamble"):
+        return None
+
+    comma = body.find(",")
+    if comma < 0:
+        return None
+    fields: Dict[str, str] = {"key": body[:comma].strip()}
+    i = comma
+    while True:
+        match = _BIBTEX_FIELD_NAME.match(body, i)
+        if match is None:
+            break
+        value, i = _bibtex_value(body, match.end(), strings)
+        field = _BIBTEX_FIELDS.get(match.group(1).lower())
+        if field and field not in fields:
+            fields[field] = _clean_latex(value)
+
+    authors = fields.get("authors")
+    if authors:
+        names = [name.strip() for name in _BIBTEX_AND.split(authors) if name.strip()]
+        et_al = bool(names) and names[-1].lower() == "others"
+        fields["authors"] = "; ".join(names[:-1] if et_al else names) + (" et al." if et_al else "")
+    return fields
+
+
+def iter_bibtex(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """Entries of a .bib file, one at a time; only the current entry is held in memory"""
+    strings: Dict[str, str] = {}
+    buffer: List[str] = []
+    kind = None
+    depth = 0
+    for line in lines:
+        position = 0
+        while position < len(line):
+            if kind is None:
+                match = _BIBTEX_START.search(line, position)
+                if match is None:
+                    break
+                kind = match.group(1).lower()
+                depth = 1
+                position = match.end()
+                buffer = []
+            # Track brace depth to find the end of the entry, which may span many lines
+            i = position
+            end = None
+            while i < len(line):
+                char = line[i]
+                if char == "\\":
+                    i += 2
+                    continue
+                if char in "{(":
+                    depth += 1
+                elif char in "})":
+                    depth -= 1
+                    if depth == 0:
+                        end = i
+                        break
+                i += 1
+            if end is None:
+                buffer.append(line[position:])
+                break
+            buffer.append(line[position:end])
+            entry = _parse_bibtex_entry(kind, "".join(buffer), strings)
+            kind = None
+            position = end + 1
+            if entry:
+                yield entry
+
+
+def iter_ris(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """Records of a .ris file, one at a time"""
+    record: Dict[str, Any] = {}
+    authors: List[str] = []
+    last = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        match = _RIS_LINE.match(line)
+        if match is None:
+            # Continuation of a wrapped value, usually an abstract
+            if last and line.strip() and last in record:
+                record[last] += " " + line.strip()
+            continue
+        tag, value = match.group(1), (match.group(2) or "").strip()
+        if tag == "ER":
+            if authors:
+                record["authors"] = "; ".join(authors)
+            if "end_page" in record:
+                end_page = record.pop("end_page")
+                record["pages"] = f"{record['pages']}-{end_page}" if record.get("pages") else end_page
+            if record:
+                yield record
+            record, authors, last = {}, [], None
+            continue
+        field = _RIS_FIELDS.get(tag)
+        if field == "authors":
+            authors.append(value)
+            last = None
+        elif field and field not in record:
+            record[field] = value
+            last = field
+        else:
+            last = None
+
+
+def iter_csv(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """Rows of a reference-manager CSV export, mapped onto reference fields"""
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if not header:
+        return
+    columns = [_CSV_FIELDS.get(name.strip().lstrip("\ufeff").lower()) for name in header]
+    for row in reader:
+        record: Dict[str, str] = {}
+        for field, value in zip(columns, row):
+            if field and value.strip() and field not in record:
+                record[field] = value
+        if record:
+            yield record
+
+
+_READERS = {"bibtex": iter_bibtex, "ris": iter_ris, "csv": iter_csv}
+_EXTENSIONS = {".bib": "bibtex", ".bibtex": "bibtex", ".ris": "ris", ".csv": "csv"}
+
+
+def detect_format(filename: Optional[str], first_line: str) -> str:
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension in _EXTENSIONS:
+        return _EXTENSIONS[extension]
+    stripped = first_line.lstrip("\ufeff").strip()
+    if stripped.startswith("@") or stripped.startswith("%"):
+        return "bibtex"
+    if _RIS_LINE.match(stripped):
+        return "ris"
+    return "csv"
+
+
+def iter_references(source: Any, filename: Optional[str] = None, fmt: Optional[str] = None,
+                    encoding: str = "utf-8-sig") -> Iterator[Dict[str, str]]:
+    """Raw references from a path, a binary file (e.g. a Streamlit upload) or a text file
+
+    The file is read line by line, so libraries far larger than memory can be imported.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        filename = filename or os.fspath(source)
+        with open(source, encoding=encoding, errors="replace", newline="") as f:
+            yield from iter_references(f, filename, fmt)
+        return
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    if not isinstance(source, io.TextIOBase):
+        source = io.TextIOWrapper(source, encoding=encoding, errors="replace", newline="")
+
+    lines = iter(source)
+    first_lines = list(itertools.islice((line for line in lines if line.strip()), 1))
+    fmt = fmt or detect_format(filename, first_lines[0] if first_lines else "")
+    yield from _READERS[fmt](itertools.chain(first_lines, lines))
+
+
+def normalize_reference(raw: Dict[str, Any]) -> Dict[str, str]:
+    """Trimmed reference fields with a bare lowercase DOI and a four-digit year"""
+    reference = {}
+    for field in REFERENCE_FIELDS:
+        value = raw.get(field)
+        reference[field] = " ".join(str(value).split()) if value is not None else ""
+
+    doi, url = normalize_doi(reference["doi"] or reference["url"])
+    reference["doi"] = doi.lower()
+    if not reference["url"] and not doi:
+        reference["url"] = url
+    year = _YEAR.search(reference["year"])
+    reference["year"] = year.group(1) if year else ""
+    reference["title"] = reference["title"].rstrip(" .")
+    return reference
+
+
+def _title_key(title: str) -> str:
+    ascii_title = unicodedata.normalize("NFKD", title).encode("ascii", "ignore").decode("ascii")
+    return " ".join(_WORD.findall(ascii_title.lower()))
+
+
+class ReferenceIndex:
+    """Finds duplicates by DOI, or by a normalized title that is identical or nearly so
+
+    Fuzzy candidates come from an inverted index on each title's two longest words, so a
+    lookup compares against a handful of titles rather than the whole library.
+    """
+
+    def __init__(self, threshold: float = 0.92):
+        self.threshold = threshold
+        self._dois: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        self._entries: List[tuple] = []  # (title key, year, doi, index)
+
+    @staticmethod
+    def _anchor_words(key: str) -> List[str]:
+        words = sorted(set(key.split()), key=len, reverse=True)
+        return words[:2]
+
+    def find(self, reference: Dict[str, str]) -> Optional[int]:
+        """Index of an earlier duplicate of `reference`, or None"""
+        doi = reference.get("doi")
+        if doi and doi in self._dois:
+            return self._dois[doi]
+        key = _title_key(reference.get("title", ""))
+        if not key:
+            return None
+
+        # Different DOIs, years or numbers ("Part 2", "GPT-4") mean different works however close the titles
+        year = reference.get("year")
+        numbers = _NUMBER.findall(key)
+        candidates = {position for word in self._anchor_words(key) for position in self._postings[word]}
+        matcher = difflib.SequenceMatcher(None, b=key, autojunk=False)
+        for position in sorted(candidates):
+            other_key, other_year, other_doi, index = self._entries[position]
+            if (doi and other_doi and doi != other_doi) or (year and other_year and year != other_year):
+                continue
+            if other_key == key:
+                return index
+            if _NUMBER.findall(other_key) != numbers:
+                continue
+            matcher.set_seq1(other_key)
+            if (matcher.real_quick_ratio() >= self.threshold and matcher.quick_ratio() >= self.threshold
+                    and matcher.ratio() >= self.threshold):
+                return index
+        return None
+
+    def add(self, reference: Dict[str, str], index: int):
+        if reference.get("doi"):
+            self._dois.setdefault(reference["doi"], index)
+        key = _title_key(reference.get("title", ""))
+        if not key:
+            return
+        position = len(self._entries)
+        self._entries.append((key, reference.get("year", ""), reference.get("doi", ""), index))
+        for word in self._anchor_words(key):
+            self._postings[word].append(position)
+
+
+def iter_unique_references(references: Iterable[Dict[str, Any]], index: Optional[ReferenceIndex] = None
+                           ) -> Iterator[tuple]:
+    """(position, normalized reference, duplicate_of) for each reference, in input order"""
+    index = index or ReferenceIndex()
+    for position, raw in enumerate(references):
+        reference = normalize_reference(raw)
+        duplicate_of = index.find(reference)
+        if duplicate_of is None:
+            index.add(reference, position)
+        yield position, reference, duplicate_of
+
+
+class ImportStats:
+    """Running totals of a library import"""
+
+    def __init__(self, output_path: Optional[str] = None):
+        self.output_path = output_path
+        self.read = 0
+        self.duplicates = 0
+        self.skipped = 0  # no title to work from
+        self.done = 0
+        self.failed = 0
+
+    @property
+    def submitted(self) -> int:
+        return self.read - self.duplicates - self.skipped
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"read": self.read, "duplicates": self.duplicates, "skipped": self.skipped,
+                "done": self.done, "failed": self.failed}
+
+
+def reference_payload(reference: Dict[str, str], research_question: str = "",
+                      section_type: str = "Introduction") -> Dict[str, Any]:
+    """The app's request payload for one paper; the abstract (or title) stands in for the text"""
+    payload, _ = compact_payload({
+        "text": reference["abstract"] or reference["title"],
+        "metadata": {field: reference[field] for field in METADATA_FIELDS},
+        "research_question": research_question,
+        "section": {"type": section_type, "topic": reference["title"]},
+    })
+    return payload
+
+
+def process_references(client, deployment_id: str, references: Iterable[Dict[str, Any]], out: TextIO,
+                       parse: Callable[[Any], Dict[str, Any]], research_question: str = "",
+                       section_type: str = "Introduction", max_workers: Optional[int] = None,
+                       on_progress: Optional[Callable[[ImportStats], None]] = None,
+                       cancel_event=None, stats: Optional[ImportStats] = None,
+                       on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> ImportStats:
+    """Generate summary/hypotheses/citations per unique paper, writing one JSON line per reference
+
+    References are pulled lazily and at most 2 * max_workers are in flight, so memory stays
+    flat however large the library is. Requests go through client.chat_completion, so they
+    share the response cache, the rate limiter and in-flight coalescing with the app. Lines are
+    written in completion order as results arrive; each carries the reference's input position.
+    Duplicates get a line pointing at the first occurrence instead of a second request.
+    on_result(record) is called from the calling thread for every successful paper.
+    """
+    if max_workers is None:
+        max_workers = int(os.getenv("BATCH_MAX_WORKERS", "3"))
+    stats = stats or ImportStats()
+
+    def write(record):
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+    def generate(reference):
+        payload = reference_payload(reference, research_question, section_type)
+        messages = payload_messages(payload)
+        return parse(client.chat_completion(deployment_id=deployment_id, messages=messages))
+
+    def submittable():
+        """Unique references with a title; duplicates and untitled ones only get a line"""
+        for position, reference, duplicate_of in iter_unique_references(references):
+            stats.read += 1
+            if duplicate_of is not None:
+                stats.duplicates += 1
+                write({"index": position, "duplicate_of": duplicate_of, "title": reference["title"]})
+            elif not reference["title"]:
+                stats.skipped += 1
+                write({"index": position, "error": "Reference has no title"})
+            else:
+                yield position, reference
+
+    for (position, reference), future in imap_bounded(
+            lambda item: generate(item[1]), submittable(), max_workers,
+            cancel_event=cancel_event, thread_name_prefix="library"):
+        metadata = {field: reference[field] for field in METADATA_FIELDS}
+        try:
+            output = future.result()
+        except Exception as e:
+            if cancel_event is not None and cancel_event.is_set():
+                continue
+            logger.error("Reference %d failed: %s", position, e)
+            stats.failed += 1
+            write({"index": position, "metadata": metadata, "error": str(e)})
+        else:
+            stats.done += 1
+            record = dict(output, index=position, metadata=metadata,
+                          citations=format_citations(reference, markdown=False))
+            write(record)
+            if on_result:
+                on_result(record)
+        if on_progress:
+            on_progress(stats)
+
+    return stats
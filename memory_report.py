@@ -0,0 +1,49 @@
+"""Approximate memory accounting for session state and the process-wide caches"""
+import sys
+from typing import Any, Iterable, List, Mapping, Optional, Set, Tuple
+
+_CONTAINERS = (dict, list, tuple, set, frozenset)
+
+
+def deep_sizeof(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    """Bytes held by obj, following containers and __slots__ objects
+
+    Objects with a __dict__ (clients, caches, locks) are counted shallowly: session state
+    only holds references to those shared services, it doesn't own them.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, _CONTAINERS):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(type(obj), "__slots__") and not hasattr(obj, "__dict__"):
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if hasattr(obj, name):
+                    size += deep_sizeof(getattr(obj, name), seen)
+    return size
+
+
+def session_breakdown(state: Mapping[str, Any]) -> List[Tuple[str, int]]:
+    """(key, bytes) for every session state entry, largest first"""
+    sizes = [(str(key), deep_sizeof(value)) for key, value in state.items()]
+    return sorted(sizes, key=lambda item: item[1], reverse=True)
+
+
+def total_size(values: Iterable[Any]) -> int:
+    seen: Set[int] = set()
+    return sum(deep_sizeof(value, seen) for value in values)
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
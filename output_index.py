@@ -0,0 +1,313 @@
+"""Local full-text index of generated research outputs (SQLite FTS5), with backfill from COS"""
+import os
+import re
+import gzip
+import json
+import time
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from citations import normalize_doi
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = os.path.join(".cache", "output_index.db")
+
+# Column weights for ranking: a hit in the title counts most, the generated text least
+_RANK_WEIGHTS = (10.0, 5.0, 2.0, 8.0, 1.0)
+_WORD = re.compile(r"\w+", re.UNICODE)
+_KEY_TIMESTAMP = re.compile(r"^(\d{8}_\d{6})_(.*)$")
+_OUTPUT_SUFFIXES = (".json", ".json.gz", ".jsonl", ".jsonl.gz")
+
+
+class SearchHit:
+    """One indexed output matching a search"""
+
+    def __init__(self, key: str, title: str, authors: str, year: str, doi: str,
+                 created_at: float, snippet: str):
+        self.key = key
+        self.title = title
+        self.authors = authors
+        self.year = year
+        self.doi = doi
+        self.created_at = created_at
+        self.snippet = snippet
+
+
+def _flatten(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return "\n".join(_flatten(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return "\n".join(_flatten(item) for item in value)
+    return "" if value is None else str(value)
+
+
+def _title_from_key(key: str) -> Tuple[str, Optional[float]]:
+    """('My Paper', created_at) from '20250101_120000_My_Paper.json'"""
+    name = os.path.basename(key)
+    for suffix in _OUTPUT_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    match = _KEY_TIMESTAMP.match(name)
+    if not match:
+        return name.replace("_", " "), None
+    created_at = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp()
+    return match.group(2).replace("_", " "), created_at
+
+
+def _doi_key(value: Any) -> str:
+    """Bare lowercase DOI, whether it was entered as a DOI or a doi.org link"""
+    value = str(value or "").strip()
+    return (normalize_doi(value)[0] or value).lower()
+
+
+def fts_query(text: str) -> str:
+    """User input as an FTS5 query: every word must match, the last one as a prefix"""
+    words = _WORD.findall(text)
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+class OutputIndex:
+    """Generated outputs plus a full-text index over their metadata and text
+
+    Outputs are keyed by their Cloud Object Storage file name, so an output indexed when it
+    was generated and the same output found again by a COS backfill are one entry.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS outputs (
+                    id INTEGER PRIMARY KEY,
+                    key TEXT UNIQUE NOT NULL,
+                    title TEXT NOT NULL,
+                    authors TEXT NOT NULL,
+                    year TEXT NOT NULL,
+                    doi TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    content TEXT NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outputs_doi ON outputs(doi)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outputs_title ON outputs(title COLLATE NOCASE)")
+            self._conn.execute(
+                """CREATE VIRTUAL TABLE IF NOT EXISTS outputs_fts USING fts5(
+                    title, authors, journal, doi, body,
+                    tokenize = 'porter unicode61 remove_diacritics 2'
+                )"""
+            )
+            # COS objects already read by a backfill, so the next one only downloads new objects
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cos_objects (key TEXT PRIMARY KEY, etag TEXT NOT NULL)"
+            )
+
+    def add(self, key: str, content: Dict[str, Any], metadata: Optional[Dict[str, Any]] = None,
+            created_at: Optional[float] = None):
+        self.add_many([(key, content, metadata, created_at)])
+
+    def add_many(self, entries: Iterable[Tuple[str, Dict[str, Any], Optional[Dict[str, Any]], Optional[float]]]):
+        """Insert or replace (key, content, metadata, created_at) entries in one transaction"""
+        rows = []
+        for key, content, metadata, created_at in entries:
+            if not isinstance(content, dict):
+                content = {"raw_content": _flatten(content)}
+            metadata = metadata or content.get("metadata") or {}
+            key_title, key_time = _title_from_key(key)
+            title = str(metadata.get("title") or key_title)
+            body = _flatten([content.get(field) for field in
+                             ("summary", "hypotheses", "section_draft", "section_drafts", "raw_content")])
+            rows.append((key, title, str(metadata.get("authors") or ""), str(metadata.get("journal") or ""),
+                         str(metadata.get("year") or ""), _doi_key(metadata.get("doi")),
+                         created_at or key_time or time.time(), json.dumps(content, ensure_ascii=False), body))
+
+        with self._lock, self._conn:
+            for key, title, authors, journal, year, doi, created_at, content, body in rows:
+                row = self._conn.execute("SELECT id FROM outputs WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._conn.execute("DELETE FROM outputs_fts WHERE rowid = ?", row)
+                    self._conn.execute(
+                        "UPDATE outputs SET title = ?, authors = ?, year = ?, doi = ?, created_at = ?, content = ? "
+                        "WHERE id = ?", (title, authors, year, doi, created_at, content, row[0]))
+                    output_id = row[0]
+                else:
+                    output_id = self._conn.execute(
+                        "INSERT INTO outputs (key, title, authors, year, doi, created_at, content) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", (key, title, authors, year, doi, created_at, content)
+                    ).lastrowid
+                self._conn.execute(
+                    "INSERT INTO outputs_fts (rowid, title, authors, journal, doi, body) VALUES (?, ?, ?, ?, ?, ?)",
+                    (output_id, title, authors, journal, doi, body))
+
+    def search(self, text: str, limit: int = 20) -> List[SearchHit]:
+        """Best matches first (BM25, title and DOI hits weighted up)"""
+        query = fts_query(text)
+        if not query:
+            return []
+        weights = ", ".join(str(weight) for weight in _RANK_WEIGHTS)
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT o.key, o.title, o.authors, o.year, o.doi, o.created_at,
+                           snippet(outputs_fts, 4, '**', '**', '…', 16)
+                    FROM outputs_fts JOIN outputs o ON o.id = outputs_fts.rowid
+                    WHERE outputs_fts MATCH ?
+                    ORDER BY bm25(outputs_fts, {weights})
+                    LIMIT ?""", (query, limit)).fetchall()
+        return [SearchHit(*row) for row in rows]
+
+    def find(self, doi: str = "", title: str = "") -> Optional[str]:
+        """Key of the newest output for this DOI, or else for this exact title"""
+        with self._lock:
+            row = None
+            if doi:
+                row = self._conn.execute("SELECT key FROM outputs WHERE doi = ? ORDER BY created_at DESC LIMIT 1",
+                                         (_doi_key(doi),)).fetchone()
+            if row is None and title.strip():
+                row = self._conn.execute(
+                    "SELECT key FROM outputs WHERE title = ? COLLATE NOCASE ORDER BY created_at DESC LIMIT 1",
+                    (title.strip(),)).fetchone()
+        return row[0] if row else None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT content FROM outputs WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def new_objects(self, objects: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """The (key, etag) pairs not yet read, or changed since they were"""
+        if not objects:
+            return []
+        with self._lock:
+            placeholders = ", ".join("?" for _ in objects)
+            seen = dict(self._conn.execute(f"SELECT key, etag FROM cos_objects WHERE key IN ({placeholders})",
+                                           [key for key, _ in objects]).fetchall())
+        return [(key, etag) for key, etag in objects if seen.get(key) != etag]
+
+    def mark_objects(self, objects: List[Tuple[str, str]]):
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO cos_objects (key, etag) VALUES (?, ?)", objects)
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM outputs")
+            self._conn.execute("DELETE FROM outputs_fts")
+            self._conn.execute("DELETE FROM cos_objects")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outputs").fetchone()[0]
+
+
+class BackfillStats:
+    """Progress of a COS backfill"""
+
+    def __init__(self):
+        self.listed = 0
+        self.skipped = 0     # already indexed and unchanged
+        self.downloaded = 0
+        self.indexed = 0     # outputs; a bundle holds several
+        self.failed = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"listed": self.listed, "skipped": self.skipped, "downloaded": self.downloaded,
+                "indexed": self.indexed, "failed": self.failed}
+
+
+def _read_object(cos_client, bucket: str, key: str) -> List[Tuple[str, Any]]:
+    """(output key, content) pairs in one COS object: a single output or a JSONL bundle"""
+    body = cos_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+    if body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+    text = body.decode("utf-8")
+
+    name = key[:-3] if key.endswith(".gz") else key
+    if not name.endswith(".jsonl"):
+        return [(name, json.loads(text))]
+    outputs = []
+    for line in text.splitlines():
+        if line.strip():
+            item = json.loads(line)
+            outputs.append((item["filename"], item["content"]))
+    return outputs
+
+
+def backfill_from_cos(index: OutputIndex, cos_client, bucket: str, prefix: str = "",
+                      max_workers: int = 8, page_size: int = 1000,
+                      on_progress=None, cancel_event=None) -> BackfillStats:
+    """Index every output in the bucket that isn't indexed yet
+
+    The bucket is listed a page at a time; each page's new objects are downloaded in
+    parallel and indexed in a single transaction before the next page is listed, so memory
+    use is bounded by one page whatever the bucket size.
+    """
+    stats = BackfillStats()
+    paginator = cos_client.get_paginator("list_objects_v2")
+    pages = paginator.paginate(Bucket=bucket, Prefix=prefix, PaginationConfig={"PageSize": page_size})
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="backfill") as executor:
+        for page in pages:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            objects = [(item["Key"], item.get("ETag", "")) for item in page.get("Contents", [])
+                       if item["Key"].endswith(_OUTPUT_SUFFIXES)]
+            stats.listed += len(objects)
+            new = index.new_objects(objects)
+            stats.skipped += len(objects) - len(new)
+
+            futures = {executor.submit(_read_object, cos_client, bucket, key): (key, etag) for key, etag in new}
+            entries, done = [], []
+            for future in as_completed(futures):
+                key, etag = futures[future]
+                try:
+                    outputs = future.result()
+                except Exception as e:
+                    logger.warning("Could not read %s from COS: %s", key, e)
+                    stats.failed += 1
+                    continue
+                stats.downloaded += 1
+                entries.extend((name, content, None, None) for name, content in outputs)
+                done.append((key, etag))
+
+            index.add_many(entries)
+            index.mark_objects(done)
+            stats.indexed += len(entries)
+            if on_progress:
+                on_progress(stats)
+    return stats
+
+
+_index = None
+_index_created = False
+_index_lock = threading.Lock()
+
+
+def get_output_index() -> Optional[OutputIndex]:
+    """Return the process-wide output index (None if it can't be opened, e.g. no FTS5)"""
+    global _index, _index_created
+    with _index_lock:
+        if not _index_created:
+            path = os.getenv("OUTPUT_INDEX_PATH", DEFAULT_INDEX_PATH)
+            try:
+                _index = OutputIndex(path)
+            except sqlite3.Error as e:
+                logger.warning("Could not open the output index at %s: %s", path, e)
+            _index_created = True
+        return _index
@@ -0,0 +1,344 @@
+"""Structured-output extraction: find, repair and validate the JSON object in model output"""
+import re
+import json
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fields the Summary / Hypotheses / Section Draft tabs render
+EXPECTED_FIELDS = ("summary", "citations", "hypotheses", "section_draft")
+
+# Characters that can change the scanner's state; everything in between is skipped by the regex
+_SPECIAL = re.compile(r"[{}\[\]\"']")
+_STRING_END = {'"': re.compile(r'["\\]'), "'": re.compile(r"['\\\n]")}
+_TOKEN = re.compile(r"[A-Za-z0-9_+\-.]+")
+_WHITESPACE = re.compile(r"\s+")
+# Characters inside a string that need rewriting; the rest is copied a slice at a time
+_STRING_SPECIAL = {
+    '"': re.compile(r'["\\\x00-\x1f]'),
+    "'": re.compile(r"['\"\\\x00-\x1f]"),
+}
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_CLOSERS = {"{": "}", "[": "]"}
+_decoder = json.JSONDecoder()
+_LITERALS = {"True": "true", "False": "false", "None": "null", "NaN": "null",
+             "Infinity": "null", "-Infinity": "null", "undefined": "null"}
+
+
+def iter_json_objects(text: str, position: int = 0) -> Iterator[Tuple[int, int, bool]]:
+    """Spans (start, end, complete) of top-level {...} blocks, in one pass over the text
+
+    Brackets inside strings are ignored. Prose between blocks, markdown fences and several
+    blocks in one response are all fine. An object still open at the end of the text
+    (e.g. output cut off at the token limit) is yielded last with complete=False.
+    """
+    length = len(text)
+    while True:
+        start = text.find("{", position)
+        if start < 0:
+            return
+        depth = 1
+        quote = None
+        match = _SPECIAL.search(text, start + 1)
+        while match is not None:
+            i = match.start()
+            char = text[i]
+            next_position = i + 1
+            if quote is not None:
+                if char == "\\":
+                    next_position = i + 2  # skip the escaped character
+                elif char == quote or (char == "\n" and quote == "'"):
+                    quote = None
+            elif char == '"':
+                quote = char
+            elif char == "'":
+                # Single-quoted strings only where JSON expects a key or value; elsewhere it's an apostrophe
+                j = i - 1
+                while text[j].isspace():
+                    j -= 1
+                if text[j] in "{[,:":
+                    quote = char
+            elif char in "{[":
+                depth += 1
+            elif char in "}]":
+                depth -= 1
+                if depth == 0:
+                    yield start, i + 1, True
+                    break
+            pattern = _SPECIAL if quote is None else _STRING_END[quote]
+            match = pattern.search(text, next_position) if next_position < length else None
+        else:
+            yield start, length, False
+            return
+        position = i + 1
+
+
+def _strip_trailing_comma(out: List[str]):
+    j = len(out) - 1
+    while j >= 0 and out[j].isspace():
+        j -= 1
+    if j >= 0 and out[j] == ",":
+        del out[j]
+
+
+def _read_string(text: str, i: int, quote: str) -> Tuple[str, int, bool]:
+    """JSON-encode the string starting at text[i] (a quote); returns (encoded, next_index, closed)"""
+    special = _STRING_SPECIAL[quote]
+    chars = ['"']
+    i += 1
+    length = len(text)
+    while True:
+        match = special.search(text, i)
+        if match is None:
+            chars.append(text[i:])
+            chars.append('"')
+            return "".join(chars), length, False
+        chars.append(text[i:match.start()])
+        i = match.start()
+        char = text[i]
+        if char == quote:
+            chars.append('"')
+            return "".join(chars), i + 1, True
+        if char == "\\":
+            escaped = text[i + 1:i + 2]
+            if escaped == "'":
+                chars.append("'")
+            elif escaped and escaped in '"\\/bfnrtu':
+                chars.append(char + escaped)
+            else:
+                chars.append("\\\\")
+                i += 1
+                continue
+            i += 2
+        elif char == '"':
+            chars.append('\\"')
+            i += 1
+        else:
+            chars.append(_CONTROL_ESCAPES.get(char) or f"\\u{ord(char):04x}")
+            i += 1
+
+
+def repair_json(text: str) -> str:
+    """Rewrite almost-JSON as JSON
+
+    Handles what LLMs typically get wrong: trailing commas, // and /* */ comments,
+    single-quoted strings, raw newlines in strings, unquoted keys, Python literals
+    (True/False/None) and mismatched closing brackets. If the text ends mid-object (a
+    truncated or still-streaming response) it is cut back to the last complete value and
+    closed, so the result is always loadable when the input starts with an object or array.
+    """
+    out: List[str] = []
+    stack: List[List[Any]] = []  # [bracket, expecting_key]
+    safe_length, safe_stack = 0, []
+    i = 0
+    length = len(text)
+
+    def mark_safe():
+        nonlocal safe_length, safe_stack
+        safe_length, safe_stack = len(out), [entry[0] for entry in stack]
+
+    # Skip anything before the first bracket
+    while i < length and text[i] not in "{[":
+        i += 1
+
+    while i < length:
+        char = text[i]
+        if char.isspace():
+            match = _WHITESPACE.match(text, i)
+            out.append(match.group())
+            i = match.end()
+        elif char in "\"'":
+            encoded, i, closed = _read_string(text, i, char)
+            out.append(encoded)
+            if stack and stack[-1][0] == "{" and stack[-1][1]:
+                stack[-1][1] = False  # that was a key
+            elif closed or i >= length:
+                mark_safe()  # a value (possibly still streaming in)
+        elif char in "{[":
+            stack.append([char, char == "{"])
+            out.append(char)
+            mark_safe()
+            i += 1
+        elif char in "}]":
+            if not stack:
+                break
+            _strip_trailing_comma(out)
+            # Close anything the model forgot to close before this bracket
+            while len(stack) > 1 and _CLOSERS[stack[-1][0]] != char:
+                out.append(_CLOSERS[stack.pop()[0]])
+            out.append(_CLOSERS[stack.pop()[0]])
+            i += 1
+            mark_safe()
+            if not stack:
+                break
+        elif char == ":":
+            out.append(char)
+            i += 1
+        elif char == ",":
+            if stack and stack[-1][0] == "{":
+                stack[-1][1] = True
+            out.append(char)
+            i += 1
+        elif char == "/" and text[i + 1:i + 2] == "/":
+            newline = text.find("\n", i)
+            i = length if newline < 0 else newline
+        elif char == "/" and text[i + 1:i + 2] == "*":
+            end = text.find("*/", i + 2)
+            i = length if end < 0 else end + 2
+        else:
+            match = _TOKEN.match(text, i)
+            if match is None:
+                i += 1  # stray character
+                continue
+            token = match.group()
+            i = match.end()
+            if stack and stack[-1][0] == "{" and stack[-1][1]:
+                out.append(json.dumps(token))  # unquoted key
+                stack[-1][1] = False
+            else:
+                out.append(_LITERALS.get(token, token))
+                if i < length:
+                    mark_safe()
+
+    if not stack:
+        return "".join(out)
+
+    # Truncated: close at the last complete value
+    del out[safe_length:]
+    _strip_trailing_comma(out)
+    return "".join(out) + "".join(_CLOSERS[bracket] for bracket in reversed(safe_stack))
+
+
+def _as_text(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "\n\n".join(_as_text(item) for item in value)
+    if isinstance(value, dict):
+        return "\n\n".join(f"**{key}**: {_as_text(item)}" for key, item in value.items())
+    return "" if value is None else str(value)
+
+
+def normalize_output(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Coerce the expected fields into the shapes the tabs render; other keys pass through
+
+    summary: list of strings; citations: dict of style -> string (or a string);
+    hypotheses and section_draft: markdown strings.
+    """
+    output = dict(data)
+    problems = []
+
+    summary = output.get("summary")
+    if isinstance(summary, str):
+        output["summary"] = [line.strip().lstrip("-•*").strip() for line in summary.splitlines() if line.strip()]
+        problems.append("summary was a string")
+    elif isinstance(summary, list):
+        output["summary"] = [_as_text(point) for point in summary]
+    elif summary is not None:
+        output["summary"] = [_as_text(summary)]
+        problems.append(f"summary was {type(summary).__name__}")
+
+    citations = output.get("citations")
+    if isinstance(citations, dict):
+        output["citations"] = {str(style): _as_text(citation) for style, citation in citations.items()}
+    elif isinstance(citations, list):
+        output["citations"] = "\n\n".join(_as_text(citation) for citation in citations)
+    elif citations is not None and not isinstance(citations, str):
+        output["citations"] = _as_text(citations)
+        problems.append(f"citations was {type(citations).__name__}")
+
+    hypotheses = output.get("hypotheses")
+    if isinstance(hypotheses, list):
+        output["hypotheses"] = "\n".join(f"{n}. {_as_text(h)}" for n, h in enumerate(hypotheses, 1))
+    elif hypotheses is not None and not isinstance(hypotheses, str):
+        output["hypotheses"] = _as_text(hypotheses)
+
+    draft = output.get("section_draft")
+    if draft is not None and not isinstance(draft, str):
+        output["section_draft"] = _as_text(draft)
+
+    if problems:
+        logger.info("Normalized model output: %s", "; ".join(problems))
+    return output
+
+
+def is_research_output(data: Any) -> bool:
+    return isinstance(data, dict) and any(field in data for field in EXPECTED_FIELDS)
+
+
+def parse_model_output(text: str) -> Dict[str, Any]:
+    """The research output in `text`, or {"raw_content": text} if there is none
+
+    Every top-level object is tried in order: valid JSON is decoded at C speed where it
+    starts, anything else is delimited by the scanner and repaired. Objects with expected
+    fields are merged, so output split across several fenced blocks still fills every tab.
+    """
+    merged: Dict[str, Any] = {}
+    fallback = None
+    position = 0
+    while True:
+        start = text.find("{", position)
+        if start < 0:
+            break
+        try:
+            data, position = _decoder.raw_decode(text, start)
+        except ValueError:
+            _, position, _ = next(iter_json_objects(text, start))
+            try:
+                data = json.loads(repair_json(text[start:position]))
+            except ValueError:
+                position = start + 1
+                continue
+        if is_research_output(data):
+            for key, value in data.items():
+                merged.setdefault(key, value)
+        elif isinstance(data, dict) and fallback is None:
+            fallback = data
+
+    if merged:
+        return normalize_output(merged)
+    if fallback is not None:
+        return normalize_output(fallback)
+    return {"raw_content": text}
+
+
+class PartialJSONParser:
+    """Best-effort view of a JSON object that is still streaming in
+
+    Feed text as it arrives and call parse() whenever the page is redrawn; it repairs and
+    closes the text received so far, so fields appear as soon as they have started.
+    """
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._start: Optional[int] = None
+        self._scanned = 0
+        self._parsed_length = -1
+        self.result: Optional[Dict[str, Any]] = None
+
+    def feed(self, text: str):
+        self._parts.append(text)
+
+    def parse(self) -> Optional[Dict[str, Any]]:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        text = self._parts[0] if self._parts else ""
+        if len(text) == self._parsed_length:
+            return self.result
+        self._parsed_length = len(text)
+
+        if self._start is None:
+            start = text.find("{", self._scanned)
+            self._scanned = len(text)
+            if start < 0:
+                return None
+            self._start = start
+
+        try:
+            data = json.loads(repair_json(text[self._start:]))
+        except ValueError:
+            return self.result
+        if isinstance(data, dict):
+            self.result = normalize_output(data)
+        return self.result
@@ -0,0 +1,140 @@
+"""PDF text extraction with memoization, page ranges and a process pool for large papers"""
+import os
+import io
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+from tracing import span
+from prompt_compaction import clean_extracted_text
+
+logger = logging.getLogger(__name__)
+
+# Pages per worker task; big enough that pickling the PDF bytes is amortized
+PAGES_PER_TASK = 16
+
+
+class PdfExtraction:
+    """Extracted text plus per-page timings (page numbers are 1-based)"""
+
+    __slots__ = ("digest", "page_count", "pages", "_clean_text")
+
+    def __init__(self, digest: str, page_count: int, pages: List[Tuple[int, str, float]]):
+        self.digest = digest
+        self.page_count = page_count
+        self.pages = pages
+        self._clean_text: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        return "\n".join(text for _, text, _ in self.pages)
+
+    @property
+    def clean_text(self) -> str:
+        """Text without running headers, page numbers or the reference list; computed once"""
+        if self._clean_text is None:
+            self._clean_text = clean_extracted_text([text for _, text, _ in self.pages])
+        return self._clean_text
+
+    @property
+    def timings(self) -> List[Tuple[int, float]]:
+        return [(page_no, seconds) for page_no, _, seconds in self.pages]
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(seconds for _, _, seconds in self.pages)
+
+
+def _extract_page_range(data: bytes, start: int, stop: int) -> List[Tuple[int, str, float]]:
+    """Extract pages [start, stop) in this process; runs inside pool workers too"""
+    return list(iter_pdf_pages(data, start + 1, stop))
+
+
+def iter_pdf_pages(data: bytes, first_page: int = 1,
+                   last_page: Optional[int] = None) -> Iterator[Tuple[int, str, float]]:
+    """Lazily yield (page_no, text, seconds) for pages first_page..last_page (inclusive)"""
+    from PyPDF2 import PdfReader  # imported when the first PDF is uploaded, not at app start
+    reader = PdfReader(io.BytesIO(data))
+    start, stop = _page_bounds(len(reader.pages), first_page, last_page)
+    for index in range(start, stop):
+        began = time.perf_counter()
+        text = reader.pages[index].extract_text() or ""
+        yield index + 1, text, time.perf_counter() - began
+
+
+def _page_bounds(page_count: int, first_page: int, last_page: Optional[int]) -> Tuple[int, int]:
+    start = max(0, first_page - 1)
+    stop = page_count if last_page is None else min(page_count, last_page)
+    return start, max(start, stop)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        return _pool
+
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+MEMO_SIZE = 32
+
+
+def memo_size_bytes() -> int:
+    """Approximate bytes of extracted text held by the memo"""
+    with _memo_lock:
+        extractions = list(_memo.values())
+    return sum(sum(len(text) for _, text, _ in extraction.pages) + len(extraction._clean_text or "")
+               for extraction in extractions)
+
+
+def extract_pdf_text(data: bytes, first_page: int = 1, last_page: Optional[int] = None,
+                     parallel_threshold: Optional[int] = None) -> PdfExtraction:
+    """Extract text from a page range, memoized on the PDF's hash
+
+    Ranges with at least `parallel_threshold` pages are split across a process pool.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    key = (digest, first_page, last_page)
+    with _memo_lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return _memo[key]
+
+    if parallel_threshold is None:
+        parallel_threshold = int(os.getenv("PDF_PARALLEL_THRESHOLD", "40"))
+
+    from PyPDF2 import PdfReader
+
+    with span("pdf_extract"):
+        page_count = len(PdfReader(io.BytesIO(data)).pages)
+        start, stop = _page_bounds(page_count, first_page, last_page)
+
+        if stop - start >= parallel_threshold:
+            pool = _get_pool()
+            futures = [
+                pool.submit(_extract_page_range, data, task_start, min(stop, task_start + PAGES_PER_TASK))
+                for task_start in range(start, stop, PAGES_PER_TASK)
+            ]
+            pages = [page for future in futures for page in future.result()]
+        else:
+            pages = _extract_page_range(data, start, stop)
+
+    extraction = PdfExtraction(digest, page_count, pages)
+    logger.info("Extracted %d/%d pages in %.2fs", len(pages), page_count, extraction.total_seconds)
+
+    with _memo_lock:
+        _memo[key] = extraction
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return extraction
@@ -0,0 +1,255 @@
+"""Headless generation: research payload -> parsed output, shared by the app, the CLI and the service"""
+import os
+import json
+import time
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Optional, TextIO
+
+from batch import imap_bounded, run_batch
+from chunking import condense_long_text, estimate_tokens
+from citations import format_citations, has_citation_metadata
+from jobs import Job, JobCancelled
+from output_index import get_output_index
+from prompt_compaction import compact_payload, payload_messages
+from response_handlers import handle_streaming_response, parse_response
+from tracing import tracer
+from upload_queue import get_upload_queue
+
+logger = logging.getLogger(__name__)
+
+SECTION_TYPES = ["Introduction", "Related Work", "Methodology"]
+# Optional payload fields that must be objects when given
+PAYLOAD_OBJECT_FIELDS = ["metadata", "section"]
+
+
+def local_citations(metadata: Dict[str, Any], markdown: bool = True) -> Optional[Dict[str, str]]:
+    """Citations formatted here instead of by the model; None without enough metadata"""
+    return format_citations(metadata, markdown=markdown) if has_citation_metadata(metadata) else None
+
+
+def with_citations(content, citations):
+    """Model output with the locally formatted citations in place of the model's"""
+    if citations and isinstance(content, dict):
+        content = dict(content, citations=citations)
+    return content
+
+
+def condense_payload_text(client, deployment_id: str, payload: Dict[str, Any], job: Job,
+                          max_tokens: int) -> str:
+    """Summarize a long input chunk by chunk so the final request fits the context window"""
+    def show_progress(done, total, result):
+        state = "done" if result.ok else "failed"
+        job.update(message=f"📦 Summarizing long input: {done}/{total} chunks finished "
+                           f"(chunk {result.index + 1} {state})", progress=done / total)
+
+    return condense_long_text(
+        client, deployment_id, payload, parse_response,
+        max_tokens=max_tokens,
+        on_progress=show_progress
+    )
+
+
+def generate_all_sections(client, deployment_id: str, payload: Dict[str, Any], selected_section: str,
+                          job: Job) -> Dict[str, Any]:
+    """Draft every section type in one concurrent batch and return the selected section's output"""
+    messages_list = []
+    for section in SECTION_TYPES:
+        section_payload = dict(payload, section=dict(payload.get("section", {}), type=section))
+        messages_list.append(payload_messages(section_payload))
+
+    def show_progress(done, total, result):
+        state = "done" if result.ok else "failed"
+        job.update(message=f"📦 {done}/{total} sections finished ({SECTION_TYPES[result.index]} {state})",
+                   progress=done / total)
+
+    results = run_batch(client, deployment_id, messages_list, on_progress=show_progress)
+    job.check_cancelled()
+
+    outputs = {}
+    for section, result in zip(SECTION_TYPES, results):
+        if result.ok:
+            outputs[section] = parse_response(result.result)
+        else:
+            job.warnings.append(f"❌ {section} draft failed: {str(result.error)}")
+
+    if not outputs:
+        raise Exception("All section drafts failed")
+
+    content = dict(outputs.get(selected_section) or next(iter(outputs.values())))
+    content["section_drafts"] = {
+        section: output.get("section_draft", output.get("raw_content", ""))
+        for section, output in outputs.items()
+    }
+    return content
+
+
+def generate_output(job: Job, client, deployment_id: str, payload: Dict[str, Any],
+                    selected_section: str = "Introduction", draft_all_sections: bool = False,
+                    use_streaming: bool = False, citations: Optional[Dict[str, str]] = None,
+                    max_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """Generate one research output; progress, warnings and partial output are reported on `job`
+
+    `client` should already be bound to the job (client.bind) so rate-limit waits and retries
+    report there and stop when the job is cancelled.
+    """
+    if max_tokens is None:
+        max_tokens = int(os.getenv("CHUNK_MAX_TOKENS", "3000"))
+    started = time.perf_counter()
+    messages = payload_messages(payload)
+
+    try:
+        # Long papers are summarized in chunks first so they fit the context window
+        input_tokens = estimate_tokens(payload.get("text", ""))
+        if input_tokens > max_tokens:
+            job.warnings.append(f"📄 Input was ~{input_tokens:,} tokens, so it was summarized in chunks first.")
+            payload = dict(payload, text=condense_payload_text(client, deployment_id, payload, job, max_tokens))
+            job.check_cancelled()
+            messages = payload_messages(payload)
+
+        if draft_all_sections:
+            content = generate_all_sections(client, deployment_id, payload, selected_section, job)
+        elif use_streaming:
+            try:
+                response = client.chat_completion(deployment_id=deployment_id, messages=messages, stream=True)
+                content = handle_streaming_response(
+                    response,
+                    on_update=lambda text: setattr(job, "partial_text", text),
+                    cancel_event=job.cancel_event,
+                    on_partial=lambda output: setattr(job, "partial_result", with_citations(output, citations))
+                )
+            except JobCancelled:
+                raise
+            except Exception as e:
+                job.warnings.append(f"Streaming API failed: {str(e)}. Fell back to the regular API.")
+                response = client.chat_completion(deployment_id=deployment_id, messages=messages, stream=False)
+                content = parse_response(response)
+        else:
+            response = client.chat_completion(deployment_id=deployment_id, messages=messages, stream=False)
+            content = parse_response(response)
+        job.check_cancelled()
+        return with_citations(content, citations)
+    finally:
+        tracer.record("generate_output", time.perf_counter() - started)
+
+
+def index_output(key, content):
+    """Add an output to the local search index; a failure here never fails the generation"""
+    output_index = get_output_index()
+    if output_index is None:
+        return
+    try:
+        output_index.add(key, content)
+    except Exception as e:
+        logger.warning(f"Could not index output {key}: {str(e)}")
+
+
+def output_filename(title: str) -> str:
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{(title or 'output').replace(' ', '_')[:30]}.json"
+
+
+def store_output(filename: str, payload: Dict[str, Any], content) -> bool:
+    """Index an output locally and queue it for Cloud Object Storage; False if it couldn't be spooled"""
+    stored = dict(content, metadata=payload.get("metadata", {})) if isinstance(content, dict) else content
+    index_output(filename, stored)
+    return get_upload_queue().enqueue(filename, json.dumps(stored, indent=2))
+
+
+class PayloadStats:
+    """Counters for one headless run, updated as results are written"""
+
+    def __init__(self):
+        self.read = 0
+        self.invalid = 0
+        self.done = 0
+        self.failed = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"read": self.read, "invalid": self.invalid, "done": self.done, "failed": self.failed}
+
+
+def process_payloads(client, deployment_id: str, records: Iterable[Any], out: TextIO,
+                     max_workers: Optional[int] = None, store: bool = False, cancel_event=None,
+                     on_progress: Optional[Callable[[PayloadStats], None]] = None,
+                     stats: Optional[PayloadStats] = None) -> PayloadStats:
+    """Generate outputs for JSONL payloads, writing one result line per input line
+
+    Each record has the app's payload shape (text, metadata, research_question, section) and
+    may carry an "id" that is copied to its result. Records can be dicts or raw JSON lines
+    (blank lines are skipped); they are read lazily with at most 2 * max_workers in flight and
+    results are written in completion order, each with its 0-based input line as "index". Payloads are
+    compacted and citations formatted locally, as in the app. With store=True results are also
+    indexed for search and queued for Cloud Object Storage.
+    """
+    if max_workers is None:
+        max_workers = int(os.getenv("BATCH_MAX_WORKERS", "3"))
+    stats = stats or PayloadStats()
+
+    def write(record):
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+    def parsed():
+        """Valid payloads with their position; malformed lines get an error line right away"""
+        for position, record in enumerate(records):
+            if isinstance(record, (str, bytes)):
+                if not record.strip():
+                    continue
+                try:
+                    record = json.loads(record)
+                except ValueError as e:
+                    record = e
+            stats.read += 1
+            if isinstance(record, ValueError):
+                error = f"Invalid JSON: {record}"
+            elif not isinstance(record, dict):
+                error = "Not a payload object"
+            else:
+                # Checked here so a bad field fails its own line instead of the generation
+                wrong = [] if isinstance(record.get("text", ""), str) else ["text must be a string"]
+                wrong += [f"{field} must be an object" for field in PAYLOAD_OBJECT_FIELDS
+                          if record.get(field) is not None and not isinstance(record[field], dict)]
+                error = f"Invalid payload: {', '.join(wrong)}" if wrong else None
+            if error:
+                stats.invalid += 1
+                write({"index": position, "error": error})
+                continue
+            yield position, record
+
+    def generate(item):
+        _, record = item
+        payload = {key: value for key, value in record.items() if key != "id"}
+        citations = local_citations(payload.get("metadata") or {}, markdown=False)
+        payload, _ = compact_payload(payload)
+        metadata = payload.get("metadata") or {}
+        job = Job(record.get("id") or metadata.get("title") or "payload", cancel_event=cancel_event)
+        content = generate_output(job, client.bind(cancel_event=job.cancel_event), deployment_id, payload,
+                                  selected_section=(payload.get("section") or {}).get("type", "Introduction"),
+                                  citations=citations)
+        if store:
+            store_output(output_filename(metadata.get("title", "")), payload, content)
+        return content, job.warnings
+
+    for (position, record), future in imap_bounded(generate, parsed(), max_workers,
+                                                   cancel_event=cancel_event, thread_name_prefix="payload"):
+        result = {"index": position}
+        if "id" in record:
+            result["id"] = record["id"]
+        try:
+            content, warnings = future.result()
+        except JobCancelled:
+            continue
+        except Exception as e:
+            logger.error("Payload %d failed: %s", position, e)
+            stats.failed += 1
+            result["error"] = str(e)
+        else:
+            stats.done += 1
+            result.update(content if isinstance(content, dict) else {"raw_content": content})
+            if warnings:
+                result["warnings"] = warnings
+        write(result)
+        if on_progress:
+            on_progress(stats)
+
+    return stats
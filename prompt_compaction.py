@@ -0,0 +1,179 @@
+"""Prompt-payload compaction: clean extracted text, drop empty fields, serialize tightly"""
+import os
+import re
+import json
+import logging
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Sequence, Tuple
+
+from chunking import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Lines that are only a page number: "12", "- 12 -", "Page 3", "3 of 10", "3/10"
+_PAGE_NUMBER = re.compile(r"^\s*[-–—]?\s*(?:page\s*)?\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?\s*[-–—]?\s*$", re.IGNORECASE)
+_REFERENCES_HEADING = re.compile(
+    r"^\s*(?:\d+\.?\s*|[IVX]+\.\s*)?(?:references|bibliography|works cited|literature cited|reference list)\s*:?\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# Appendices after the reference list are kept
+_APPENDIX_HEADING = re.compile(r"^\s*(?:appendix|appendices|supplementary material)\b.*$", re.IGNORECASE | re.MULTILINE)
+_LINE_BREAK_HYPHEN = re.compile(r"(\w)[-\u00ad]\n[ \t]*([a-z])")
+_INVISIBLE = re.compile("[\u00ad\u200b\u200c\u200d\u2060\ufeff]")
+_SPACES = re.compile("[ \t\u00a0\u2000-\u200a\u202f\u205f\u3000]+")
+_SPACED_NEWLINE = re.compile(r" *\n *")
+_PARAGRAPH_BREAK = re.compile(r"\n{2,}")
+_DIGITS = re.compile(r"\d+")
+
+# A line at the top or bottom of this share of pages is a running header/footer
+BOILERPLATE_PAGE_SHARE = 0.5
+EDGE_LINES = 2
+# Shorter lines are not treated as hard-wrapped
+WRAPPED_LINE_LENGTH = 40
+
+
+def compaction_enabled() -> bool:
+    return os.getenv("PROMPT_COMPACTION", "true").lower() == "true"
+
+
+def normalize_text(text: str) -> str:
+    """Undo PDF-extraction artifacts without changing the wording
+
+    Folds ligatures and full-width forms (NFKC), removes soft hyphens and zero-width
+    characters, rejoins words hyphenated across line breaks, unwraps hard-wrapped lines
+    inside paragraphs and collapses runs of whitespace. Paragraph breaks are kept.
+    """
+    text = unicodedata.normalize("NFKC", text.replace("\r\n", "\n").replace("\r", "\n"))
+    text = _LINE_BREAK_HYPHEN.sub(r"\1\2", text)
+    text = _INVISIBLE.sub("", text)
+    text = _SPACES.sub(" ", text)
+    text = _SPACED_NEWLINE.sub("\n", text)
+
+    paragraphs = []
+    for paragraph in _PARAGRAPH_BREAK.split(text.strip()):
+        lines = [line for line in paragraph.split("\n") if line]
+        if not lines:
+            continue
+        # Hard-wrapped lines run close to the full width; a short line before a capital
+        # is a heading or the end of a paragraph, and bullets start their own line
+        merged = [lines[0]]
+        for previous, line in zip(lines, lines[1:]):
+            if line.startswith(("•", "- ", "* ")) or (len(previous) < WRAPPED_LINE_LENGTH and not line[0].islower()):
+                merged.append(line)
+            else:
+                merged[-1] = f"{merged[-1]} {line}"
+        paragraphs.append("\n".join(merged))
+    return "\n\n".join(paragraphs)
+
+
+def _line_signature(line: str) -> str:
+    """Header/footer identity, ignoring page numbers that change from page to page"""
+    return _DIGITS.sub("#", line.strip().lower())
+
+
+def strip_boilerplate(pages: Sequence[str]) -> List[str]:
+    """Remove running headers/footers and page-number lines from per-page text
+
+    A line counts as a header or footer when (digits aside) it appears within the first or
+    last EDGE_LINES lines of at least half the pages, which needs three or more pages. A line
+    that is only a number is a page number when it sits within those edge lines; elsewhere it
+    is content (a table cell, a year).
+    """
+    split_pages = [[line for line in page.splitlines() if line.strip()] for page in pages]
+    repeated = set()
+    if len(split_pages) >= 3:
+        counts = Counter()
+        for lines in split_pages:
+            if len(lines) > 2 * EDGE_LINES:  # on shorter pages every line is at an edge
+                counts.update({_line_signature(line) for line in lines[:EDGE_LINES] + lines[-EDGE_LINES:]})
+        threshold = max(2, int(len(split_pages) * BOILERPLATE_PAGE_SHARE))
+        repeated = {signature for signature, count in counts.items() if count >= threshold}
+
+    cleaned = []
+    for lines in split_pages:
+        kept = []
+        for position, line in enumerate(lines):
+            edge = position < EDGE_LINES or position >= len(lines) - EDGE_LINES
+            at_edge = len(lines) > 2 * EDGE_LINES and edge
+            if (edge and _PAGE_NUMBER.match(line)) or (at_edge and _line_signature(line) in repeated):
+                continue
+            kept.append(line)
+        cleaned.append("\n".join(kept))
+    return cleaned
+
+
+def strip_reference_list(text: str) -> str:
+    """Cut the bibliography at the end of a paper (kept if the heading shows up early on)"""
+    matches = list(_REFERENCES_HEADING.finditer(text))
+    if not matches or matches[-1].start() < len(text) * 0.4:
+        return text
+    start = matches[-1].start()
+    appendix = _APPENDIX_HEADING.search(text, matches[-1].end())
+    return text[:start].rstrip() + ("\n\n" + text[appendix.start():] if appendix else "")
+
+
+def clean_extracted_text(pages: Sequence[str]) -> str:
+    """Per-page PDF text -> compact paper text"""
+    return normalize_text(strip_reference_list("\n".join(strip_boilerplate(pages))))
+
+
+def drop_empty(value: Any) -> Any:
+    """Recursively remove None, empty strings and empty containers from dicts and lists"""
+    if isinstance(value, dict):
+        compacted = {key: drop_empty(item) for key, item in value.items()}
+        return {key: item for key, item in compacted.items() if item not in (None, "", [], {})}
+    if isinstance(value, list):
+        compacted = [drop_empty(item) for item in value]
+        return [item for item in compacted if item not in (None, "", [], {})]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def serialize_payload(payload: Dict[str, Any]) -> str:
+    """The request body as sent: no indentation or spaces after separators, non-ASCII kept as-is"""
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+def payload_messages(payload: Dict[str, Any]) -> List[Dict[str, str]]:
+    return [{"role": "user", "content": serialize_payload(payload)}]
+
+
+class CompactionReport:
+    """Estimated input tokens before and after compacting one payload"""
+
+    def __init__(self, tokens_before: int, tokens_after: int):
+        self.tokens_before = tokens_before
+        self.tokens_after = tokens_after
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    @property
+    def ratio_saved(self) -> float:
+        return self.tokens_saved / self.tokens_before if self.tokens_before else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"tokens_before": self.tokens_before, "tokens_after": self.tokens_after,
+                "tokens_saved": self.tokens_saved}
+
+
+def compact_payload(payload: Dict[str, Any]) -> Tuple[Dict[str, Any], CompactionReport]:
+    """Normalized text, no empty fields; the report compares against the plain json.dumps body
+
+    The text field is only normalized here; boilerplate needs page boundaries, so PDFs go
+    through clean_extracted_text at extraction time.
+    """
+    tokens_before = estimate_tokens(json.dumps(payload))
+    if not compaction_enabled():
+        return payload, CompactionReport(tokens_before, tokens_before)
+
+    compacted = dict(payload)
+    if isinstance(compacted.get("text"), str):
+        compacted["text"] = normalize_text(strip_reference_list(compacted["text"]))
+    compacted = drop_empty(compacted)
+    report = CompactionReport(tokens_before, estimate_tokens(serialize_payload(compacted)))
+    logger.info("Compacted payload: ~%d -> ~%d tokens", report.tokens_before, report.tokens_after)
+    return compacted, report
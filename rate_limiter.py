@@ -0,0 +1,287 @@
+"""Process-wide token-bucket rate limiter shared by all Streamlit sessions"""
+import os
+import time
+import sqlite3
+import threading
+import logging
+from collections import deque
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE_LIMIT_PATH = os.path.join(".cache", "rate_limit.db")
+
+
+class TokenBucket:
+    """Bucket holding up to `capacity` tokens, refilled evenly over `period` seconds"""
+
+    def __init__(self, capacity: float, period: float, tokens: Optional[float] = None,
+                 updated: Optional[float] = None):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity if tokens is None else tokens
+        self.updated = time.time() if updated is None else updated
+
+    def refill(self, now: float):
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until one token is available (after refill)"""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class MemoryBucketStore:
+    """Bucket state kept in this process"""
+
+    def __init__(self, limits: List[Tuple[str, float, float]]):
+        self.names = [name for name, _, _ in limits]
+        self.buckets = [TokenBucket(capacity, period) for _, capacity, period in limits]
+        self._lock = threading.Lock()
+
+    def set_limits(self, limits: List[Tuple[str, float, float]]):
+        with self._lock:
+            now = time.time()
+            current = dict(zip(self.names, self.buckets))
+            buckets = []
+            for name, capacity, period in limits:
+                bucket = current.get(name)
+                if bucket is None:
+                    bucket = TokenBucket(capacity, period, updated=now)
+                else:
+                    bucket.refill(now)
+                    bucket.capacity = capacity
+                    bucket.rate = capacity / period
+                    bucket.tokens = min(bucket.tokens, capacity)
+                buckets.append(bucket)
+            self.names = [name for name, _, _ in limits]
+            self.buckets = buckets
+
+    def try_acquire(self, consume: bool = True) -> float:
+        """Take one token from every bucket, or return how long to wait"""
+        with self._lock:
+            now = time.time()
+            for bucket in self.buckets:
+                bucket.refill(now)
+            wait = max(bucket.wait_time() for bucket in self.buckets)
+            if wait <= 0 and consume:
+                for bucket in self.buckets:
+                    bucket.tokens -= 1
+            return wait
+
+
+class SQLiteBucketStore:
+    """Bucket state kept in a SQLite file so several server processes share one quota
+
+    Rows are stored under `prefix` + bucket name, so several limiters (one per endpoint) can
+    share a file.
+    """
+
+    def __init__(self, limits: List[Tuple[str, float, float]], path: str = DEFAULT_RATE_LIMIT_PATH,
+                 prefix: str = ""):
+        self.limits = limits
+        self.path = path
+        self.prefix = prefix
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # isolation_level=None lets us issue BEGIN IMMEDIATE ourselves
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )"""
+        )
+
+    def set_limits(self, limits: List[Tuple[str, float, float]]):
+        # Stored token counts are clamped to the new capacity on the next refill
+        with self._lock:
+            self.limits = limits
+
+    def try_acquire(self, consume: bool = True) -> float:
+        """Take one token from every bucket, or return how long to wait"""
+        with self._lock:
+            now = time.time()
+            # BEGIN IMMEDIATE takes the write lock so other processes can't interleave
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                buckets = []
+                for name, capacity, period in self.limits:
+                    name = self.prefix + name
+                    row = self._conn.execute(
+                        "SELECT tokens, updated FROM buckets WHERE name = ?", (name,)
+                    ).fetchone()
+                    if row is None:
+                        bucket = TokenBucket(capacity, period, updated=now)
+                    else:
+                        bucket = TokenBucket(capacity, period, tokens=row[0], updated=row[1])
+                    bucket.refill(now)
+                    buckets.append((name, bucket))
+
+                wait = max(bucket.wait_time() for _, bucket in buckets)
+                if wait <= 0 and consume:
+                    for _, bucket in buckets:
+                        bucket.tokens -= 1
+
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                    [(name, bucket.tokens, bucket.updated) for name, bucket in buckets],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return wait
+
+
+class RateLimiter:
+    """Per-minute and per-hour token buckets with first-come, first-served waiting"""
+
+    def __init__(self, per_minute: int = 5, per_hour: int = 100, store=None):
+        self.per_minute = per_minute
+        self.per_hour = per_hour
+        limits = [("minute", per_minute, 60), ("hour", per_hour, 3600)]
+        self.store = store or MemoryBucketStore(limits)
+
+        # Recent request times, for display only; oldest on the left
+        self.recent_requests = deque()
+        self._waiters = deque()
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: Optional[float] = None,
+                on_wait: Optional[Callable[[float, int], None]] = None,
+                cancel_event: Optional[threading.Event] = None) -> bool:
+        """Block until a request may be sent; waiters are served in arrival order
+
+        on_wait(seconds_remaining, queue_position) is called roughly once a second while waiting.
+        Returns False if `timeout` seconds pass or `cancel_event` is set first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waiter = object()
+        with self._cond:
+            self._waiters.append(waiter)
+
+        try:
+            while True:
+                with self._cond:
+                    position = self._waiters.index(waiter)
+                    if position == 0:
+                        wait = self.store.try_acquire()
+                        if wait <= 0:
+                            self._waiters.popleft()
+                            self._record()
+                            self._cond.notify_all()
+                            return True
+                    else:
+                        # Not our turn yet; estimate from the head of the queue
+                        wait = self.store.try_acquire(consume=False)
+
+                if cancel_event is not None and cancel_event.is_set():
+                    return False
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    wait = min(wait, remaining)
+
+                if on_wait:
+                    on_wait(wait, position)
+
+                with self._cond:
+                    # Wake up at least once a second to refresh on_wait, catch our turn or a cancel
+                    self._cond.wait(min(max(wait, 0.05), 1.0))
+        finally:
+            with self._cond:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    self._cond.notify_all()
+
+    def set_limits(self, per_minute: float, per_hour: float, spread: bool = False):
+        """Change the quota on the fly (adaptive limits); tokens above the new capacity are dropped
+
+        spread adds a one-token bucket refilled every 60 / per_minute seconds, so requests go
+        out evenly spaced instead of a minute's worth at once (for quotas enforced per second).
+        """
+        self.per_minute = per_minute
+        self.per_hour = per_hour
+        limits = [("minute", per_minute, 60), ("hour", per_hour, 3600)]
+        if spread:
+            limits.append(("spacing", 1, 60 / per_minute))
+        self.store.set_limits(limits)
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait_time(self) -> float:
+        """Seconds until the next request could be sent"""
+        return self.store.try_acquire(consume=False)
+
+    def queue_length(self) -> int:
+        return len(self._waiters)
+
+    def _record(self):
+        now = time.time()
+        self.recent_requests.append(now)
+        self._trim(now)
+
+    def _trim(self, now: float):
+        hour_ago = now - 3600
+        while self.recent_requests and self.recent_requests[0] <= hour_ago:
+            self.recent_requests.popleft()
+
+    def requests_last_minute(self) -> int:
+        """Requests this process sent in the last minute"""
+        with self._cond:
+            now = time.time()
+            self._trim(now)
+            minute_ago = now - 60
+            count = 0
+            # Newest entries are on the right, so stop at the first one outside the window
+            for timestamp in reversed(self.recent_requests):
+                if timestamp <= minute_ago:
+                    break
+                count += 1
+            return count
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def create_rate_limiter(per_minute: int, per_hour: int, prefix: str = "") -> RateLimiter:
+    """Build a limiter on the RATE_LIMIT_BACKEND store; `prefix` keeps its buckets apart in a shared file"""
+    backend = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+
+    store = None
+    if backend == "sqlite":
+        path = os.getenv("RATE_LIMIT_PATH", DEFAULT_RATE_LIMIT_PATH)
+        try:
+            store = SQLiteBucketStore(
+                [("minute", per_minute, 60), ("hour", per_hour, 3600)], path, prefix=prefix
+            )
+        except sqlite3.Error as e:
+            logger.warning("Could not open rate limit store at %s (%s), using in-process limiter", path, e)
+
+    return RateLimiter(per_minute=per_minute, per_hour=per_hour, store=store)
+
+
+def create_rate_limiter_from_env() -> RateLimiter:
+    """Build a limiter from REQUESTS_PER_MINUTE / REQUESTS_PER_HOUR / RATE_LIMIT_BACKEND"""
+    return create_rate_limiter(int(os.getenv("REQUESTS_PER_MINUTE", "5")), int(os.getenv("REQUESTS_PER_HOUR", "100")))
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide rate limiter"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = create_rate_limiter_from_env()
+        return _limiter
@@ -0,0 +1,253 @@
+"""Response cache backends for IBMWatsonMLClient.chat_completion"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "response_cache.db")
+
+
+def make_cache_key(messages: List[Dict[str, str]], deployment_id: str, version: str) -> str:
+    """Build the cache key for a chat request"""
+    messages_hash = hashlib.md5(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+    return f"{deployment_id}:{version}:{messages_hash}"
+
+
+class CacheStats:
+    """Hit/miss/eviction counters shared by all cache backends"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class MemoryCache:
+    """In-memory LRU cache with entry/byte caps and TTL"""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024,
+                 ttl: Optional[float] = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+
+            expires_at, size, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+
+            # Mark as most recently used
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        size = len(json.dumps(value).encode("utf-8"))
+        if size > self.max_bytes:
+            logger.info("Response too large to cache (%d bytes)", size)
+            return
+
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, value)
+            self._bytes += size
+
+            # Evict least recently used entries until we're within both caps
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.stats.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """On-disk LRU cache backed by SQLite, shared by every process using the same file"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 2000,
+                 max_bytes: int = 256 * 1024 * 1024, ttl: Optional[float] = 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # timeout makes writers from other processes wait for the lock instead of failing
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)"
+            )
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.stats.hits += 1
+            return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        encoded = json.dumps(value)
+        size = len(encoded.encode("utf-8"))
+        if size > self.max_bytes:
+            logger.info("Response too large to cache (%d bytes)", size)
+            return
+
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl else None
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, size, expires_at, now),
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+            )
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used rows until we're within both caps"""
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access ASC"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            count -= 1
+            total -= size
+
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.stats.evictions += len(evicted)
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+_cache = None
+_cache_created = False
+_cache_lock = threading.Lock()
+
+
+def create_cache_from_env():
+    """Build a cache backend from CACHE_* environment variables"""
+    if os.getenv("ENABLE_CACHING", "true").lower() in ("false", "0", "no"):
+        return None
+
+    ttl = float(os.getenv("CACHE_TTL", "3600")) or None
+    max_entries = int(os.getenv("CACHE_MAX_ENTRIES", "2000"))
+    max_bytes = int(os.getenv("CACHE_MAX_MB", "256")) * 1024 * 1024
+    backend = os.getenv("CACHE_BACKEND", "sqlite").lower()
+
+    if backend == "sqlite":
+        path = os.getenv("CACHE_PATH", DEFAULT_CACHE_PATH)
+        try:
+            return SQLiteCache(path, max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+        except sqlite3.Error as e:
+            logger.warning("Could not open cache at %s (%s), using in-memory cache", path, e)
+
+    return MemoryCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+
+
+def get_response_cache():
+    """Return the process-wide response cache (None when caching is disabled)"""
+    global _cache, _cache_created
+    with _cache_lock:
+        if not _cache_created:
+            _cache = create_cache_from_env()
+            _cache_created = True
+        return _cache
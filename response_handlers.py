@@ -0,0 +1,88 @@
+"""Reading streamed Watson responses and parsing of the generated JSON (no UI dependency)"""
+import time
+import logging
+import traceback
+
+from sse import SSEDecoder, generated_text_from_event
+from output_parser import PartialJSONParser, parse_model_output
+from tracing import traced, tracer
+
+logger = logging.getLogger(__name__)
+
+# Response handlers
+STREAM_RENDER_INTERVAL = 0.15  # seconds between markdown re-renders while streaming
+
+def handle_streaming_response(response, on_update=None, cancel_event=None, on_partial=None):
+    """Process a streaming response from the API
+
+    on_update(text_so_far) is called as text arrives (throttled to STREAM_RENDER_INTERVAL), and
+    reading stops early once cancel_event is set. on_partial(output) receives the research
+    output parsed from the text so far, so tabs can fill in before the stream ends.
+    """
+    render = on_update or (lambda text: None)
+    decoder = SSEDecoder()
+    partial_parser = PartialJSONParser() if on_partial else None
+    parts = []
+    last_render = 0.0
+    rendered_parts = 0
+    started = time.perf_counter()
+    # Time until response headers arrived, measured by requests
+    header_seconds = response.elapsed.total_seconds() if getattr(response, "elapsed", None) else 0.0
+
+    def add_events(events):
+        for event in events:
+            text_chunk = generated_text_from_event(event["data"])
+            if text_chunk:
+                if not parts:
+                    tracer.record("stream_time_to_first_token", header_seconds + time.perf_counter() - started)
+                parts.append(text_chunk)
+                if partial_parser is not None:
+                    partial_parser.feed(text_chunk)
+    
+    try:
+        for chunk in response.iter_content(chunk_size=1024):
+            if cancel_event is not None and cancel_event.is_set():
+                response.close()
+                break
+            if chunk:
+                add_events(decoder.feed(chunk))
+
+                # Re-render at most every STREAM_RENDER_INTERVAL instead of on every chunk
+                now = time.monotonic()
+                if len(parts) > rendered_parts and now - last_render >= STREAM_RENDER_INTERVAL:
+                    render("".join(parts))
+                    last_render = now
+                    rendered_parts = len(parts)
+                    if partial_parser is not None:
+                        partial = partial_parser.parse()
+                        if partial:
+                            on_partial(partial)
+        add_events(decoder.flush())
+    except Exception as e:
+        logger.error(f"Error processing streaming response: {str(e)}")
+        logger.error(traceback.format_exc())
+    tracer.record("stream_total", header_seconds + time.perf_counter() - started)
+
+    if decoder.saw_fields:
+        full_content = "".join(parts)
+    else:
+        # Not an event stream: the whole body is a single JSON response
+        full_content = generated_text_from_event(decoder.non_sse_text())
+    render(full_content)
+    return parse_model_output(full_content)
+
+@traced("parse_response")
+def parse_response(response):
+    """Parse the non-streaming response"""
+    try:
+        # Extract the generated text from the response
+        if 'results' in response and len(response['results']) > 0:
+            content = response['results'][0].get('generated_text', '')
+        else:
+            content = str(response)
+
+        # Finds the JSON object even with surrounding prose or fences and fixes common defects
+        return parse_model_output(content)
+    except Exception as e:
+        logger.error(f"Error parsing response: {str(e)}")
+        return {"error": str(e)}
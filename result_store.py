@@ -0,0 +1,211 @@
+"""Compact research results for session state, with large fields offloaded to a disk blob store"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+import logging
+from typing import Any, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOB_DIR = os.path.join(".cache", "blobs")
+
+# The fields the output tabs render; everything else in a model response is dropped
+OUTPUT_FIELDS = ("summary", "citations", "hypotheses", "section_draft", "section_drafts", "raw_content")
+
+
+class BlobRef:
+    """Pointer to a blob on disk, kept in session state instead of the value itself"""
+
+    __slots__ = ("digest", "size")
+
+    def __init__(self, digest: str, size: int):
+        self.digest = digest
+        self.size = size
+
+
+class BlobStore:
+    """Content-addressed files on disk, shared by every session and server process
+
+    Identical values (the same output opened in several sessions) are stored once. When
+    the store grows past max_bytes the least recently read blobs are deleted; a session
+    still pointing at one gets None back and shows the field as empty.
+    """
+
+    def __init__(self, directory: str = DEFAULT_BLOB_DIR, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._bytes = sum(entry.stat().st_size for entry in self._entries())
+
+    def _entries(self):
+        for shard in os.scandir(self.directory):
+            if shard.is_dir():
+                yield from (entry for entry in os.scandir(shard.path) if entry.is_file())
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put(self, data: bytes) -> BlobRef:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if os.path.exists(path):
+            os.utime(path)
+            return BlobRef(digest, len(data))
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # readers never see a half-written blob
+        with self._lock:
+            self._bytes += len(data)
+            over_limit = self._bytes > self.max_bytes
+        if over_limit:
+            self.prune()
+        return BlobRef(digest, len(data))
+
+    def get(self, ref: BlobRef) -> Optional[bytes]:
+        path = self._path(ref.digest)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mtime doubles as last access for pruning
+            return data
+        except OSError:
+            logger.warning("Blob %s is gone (pruned?)", ref.digest[:12])
+            return None
+
+    def prune(self):
+        """Delete least recently used blobs until the store is at 80% of max_bytes"""
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+            total = sum(entry.stat().st_size for entry in entries)
+            target = self.max_bytes * 0.8
+            for entry in entries:
+                if total <= target:
+                    break
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                    total -= size
+                except OSError:
+                    pass
+            self._bytes = total
+
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide blob store (BLOB_DIR, BLOB_MAX_MB)"""
+    global _blob_store
+    with _blob_store_lock:
+        if _blob_store is None:
+            _blob_store = BlobStore(os.getenv("BLOB_DIR", DEFAULT_BLOB_DIR),
+                                    max_bytes=int(os.getenv("BLOB_MAX_MB", "512")) * 1024 * 1024)
+        return _blob_store
+
+
+def offload_min_bytes() -> int:
+    return int(os.getenv("OFFLOAD_MIN_BYTES", "8192"))
+
+
+def _offload(value: Any) -> Any:
+    """The value itself when small, else a BlobRef to its JSON on disk"""
+    if value is None or (isinstance(value, str) and len(value) < offload_min_bytes() // 4):
+        return value
+    data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+    if len(data) < offload_min_bytes():
+        return value
+    try:
+        return get_blob_store().put(data)
+    except OSError as e:
+        logger.warning(f"Could not offload a {len(data)} byte field: {str(e)}")
+        return value
+
+
+def _load(value: Any) -> Any:
+    if not isinstance(value, BlobRef):
+        return value
+    data = get_blob_store().get(value)
+    return json.loads(data) if data is not None else None
+
+
+class ResearchOutput:
+    """One result as kept in session state: only the rendered fields, big ones on disk
+
+    Built from the parsed model output with from_dict; fields other than OUTPUT_FIELDS
+    (model metadata, references the model invented, ...) are not kept.
+    """
+
+    __slots__ = ("_summary", "_citations", "_hypotheses", "_section_draft", "_section_drafts",
+                 "_raw_content", "created_at")
+
+    def __init__(self, summary: Optional[List[str]] = None,
+                 citations: Union[Dict[str, str], str, None] = None,
+                 hypotheses: Optional[str] = None, section_draft: Optional[str] = None,
+                 section_drafts: Optional[Dict[str, str]] = None, raw_content: Optional[str] = None):
+        self._summary = _offload(summary)
+        self._citations = citations  # always small
+        self._hypotheses = _offload(hypotheses)
+        self._section_draft = _offload(section_draft)
+        self._section_drafts = _offload(section_drafts)
+        self._raw_content = _offload(raw_content)
+        self.created_at = time.time()
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "ResearchOutput":
+        if isinstance(data, ResearchOutput):
+            return data
+        data = data if isinstance(data, dict) else {}
+        return cls(**{field: data.get(field) for field in OUTPUT_FIELDS})
+
+    @property
+    def summary(self) -> List[str]:
+        return _load(self._summary) or []
+
+    @property
+    def citations(self) -> Union[Dict[str, str], str, None]:
+        return self._citations
+
+    @property
+    def hypotheses(self) -> Optional[str]:
+        return _load(self._hypotheses)
+
+    @property
+    def section_draft(self) -> Optional[str]:
+        return _load(self._section_draft)
+
+    @property
+    def section_drafts(self) -> Optional[Dict[str, str]]:
+        return _load(self._section_drafts)
+
+    @property
+    def raw_content(self) -> Optional[str]:
+        return _load(self._raw_content)
+
+    @property
+    def is_raw(self) -> bool:
+        return self._raw_content is not None
+
+    def filled_fields(self) -> int:
+        return sum(1 for field in OUTPUT_FIELDS if getattr(self, f"_{field}"))
+
+    def offloaded_bytes(self) -> int:
+        return sum(value.size for value in (getattr(self, f"_{field}") for field in OUTPUT_FIELDS)
+                   if isinstance(value, BlobRef))
+
+    def to_dict(self) -> Dict[str, Any]:
+        output = {field: getattr(self, field) for field in OUTPUT_FIELDS}
+        return {field: value for field, value in output.items() if value}
+
+    def __bool__(self) -> bool:
+        return self.filled_fields() > 0
@@ -0,0 +1,205 @@
+"""Near-duplicate request cache: hashed n-gram vectors + NumPy cosine similarity"""
+import os
+import re
+import json
+import zlib
+import threading
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# How each payload field takes part in matching:
+#   "exact"  - must be identical (after normalization) for a hit
+#   "ignore" - not compared at all
+#   anything not listed is "fuzzy" and compared by cosine similarity
+DEFAULT_FIELD_RULES = {
+    "metadata.doi": "exact",
+    "section.type": "exact",
+    "metadata.year": "ignore",
+}
+
+FUZZY_FIELDS = [
+    "text",
+    "metadata.title",
+    "metadata.authors",
+    "metadata.journal",
+    "research_question",
+    "section.topic",
+]
+
+
+def normalize_text(value: Any) -> str:
+    """Lowercase and collapse whitespace so formatting-only edits don't matter"""
+    return re.sub(r"\s+", " ", str(value or "")).strip().lower()
+
+
+def payload_fields(messages: List[Dict[str, str]]) -> Optional[Dict[str, str]]:
+    """Flatten the research payload in the last user message into normalized dotted fields"""
+    if not messages:
+        return None
+    try:
+        payload = json.loads(messages[-1]["content"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not isinstance(payload, dict):
+        return None
+
+    fields = {}
+    for key, value in payload.items():
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                fields[f"{key}.{sub_key}"] = normalize_text(sub_value)
+        else:
+            fields[key] = normalize_text(value)
+    return fields
+
+
+def vectorize(text: str, dim: int) -> np.ndarray:
+    """Unit vector of hashed word unigrams and character trigrams"""
+    vector = np.zeros(dim, dtype=np.float32)
+    if not text:
+        return vector
+    features = text.split()
+    padded = f" {text} "
+    features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    for feature in features:
+        vector[zlib.crc32(feature.encode("utf-8")) % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _Partition:
+    """Entries that share every exact field; one matrix per fuzzy field"""
+
+    def __init__(self, fields: List[str], dim: int):
+        self.cache_keys: List[str] = []
+        self.matrices = {field: np.zeros((0, dim), dtype=np.float32) for field in fields}
+        self.empty = {field: np.zeros(0, dtype=bool) for field in fields}
+
+
+class SemanticCache:
+    """Finds a prior response whose payload is near-identical, field by field
+
+    Only vectors and pointers are kept here; responses stay in the exact response cache,
+    so TTL and eviction there apply to semantic hits as well.
+    """
+
+    def __init__(self, cache, threshold: float = 0.95, field_rules: Optional[Dict[str, str]] = None,
+                 dim: int = 1024, max_entries: int = 5000):
+        self.cache = cache
+        self.threshold = threshold
+        self.field_rules = dict(DEFAULT_FIELD_RULES if field_rules is None else field_rules)
+        self.dim = dim
+        self.max_entries = max_entries
+        self.fuzzy_fields = [f for f in FUZZY_FIELDS if self.field_rules.get(f, "fuzzy") == "fuzzy"]
+        self.hits = 0
+        self.misses = 0
+        self._partitions: Dict[str, _Partition] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _partition_key(self, fields: Dict[str, str], deployment_id: str, version: str) -> str:
+        exact = sorted((name, fields.get(name, "")) for name, rule in self.field_rules.items() if rule == "exact")
+        return json.dumps([deployment_id, version, exact])
+
+    def _vectors(self, fields: Dict[str, str]) -> Dict[str, np.ndarray]:
+        return {field: vectorize(fields.get(field, ""), self.dim) for field in self.fuzzy_fields}
+
+    def lookup(self, messages: List[Dict[str, str]], deployment_id: str, version: str) -> Optional[Any]:
+        """Return a cached response for a near-duplicate payload, or None"""
+        fields = payload_fields(messages)
+        if fields is None:
+            return None
+
+        vectors = self._vectors(fields)
+        with self._lock:
+            partition = self._partitions.get(self._partition_key(fields, deployment_id, version))
+            if partition is None or not partition.cache_keys:
+                self.misses += 1
+                return None
+
+            # A candidate must clear the threshold on every fuzzy field, so a changed research
+            # question can't be hidden behind a long, unchanged abstract
+            scores = np.ones(len(partition.cache_keys), dtype=np.float32)
+            for field, vector in vectors.items():
+                similarity = partition.matrices[field] @ vector
+                query_empty = not vector.any()
+                similarity = np.where(partition.empty[field] & query_empty, 1.0, similarity)
+                scores = np.minimum(scores, similarity)
+
+            order = np.argsort(-scores)
+            candidates = [partition.cache_keys[i] for i in order if scores[i] >= self.threshold]
+
+        for cache_key in candidates:
+            response = self.cache.get(cache_key)
+            if response is not None:
+                logger.info("Semantic cache hit")
+                self.hits += 1
+                return response
+
+        self.misses += 1
+        return None
+
+    def add(self, messages: List[Dict[str, str]], deployment_id: str, version: str, cache_key: str):
+        """Remember that cache_key holds the response for this payload"""
+        fields = payload_fields(messages)
+        if fields is None:
+            return
+
+        vectors = self._vectors(fields)
+        key = self._partition_key(fields, deployment_id, version)
+        with self._lock:
+            partition = self._partitions.setdefault(key, _Partition(self.fuzzy_fields, self.dim))
+            if cache_key in partition.cache_keys:
+                return
+            partition.cache_keys.append(cache_key)
+            for field, vector in vectors.items():
+                partition.matrices[field] = np.vstack([partition.matrices[field], vector])
+                partition.empty[field] = np.append(partition.empty[field], not vector.any())
+            self._count += 1
+            if self._count > self.max_entries:
+                self._drop_oldest()
+
+    def _drop_oldest(self):
+        """Drop the oldest entry of the largest partition"""
+        partition = max(self._partitions.values(), key=lambda p: len(p.cache_keys))
+        partition.cache_keys.pop(0)
+        for field in self.fuzzy_fields:
+            partition.matrices[field] = partition.matrices[field][1:]
+            partition.empty[field] = partition.empty[field][1:]
+        self._count -= 1
+
+    def clear(self):
+        with self._lock:
+            self._partitions.clear()
+            self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+
+_semantic_cache = None
+_semantic_cache_created = False
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache(cache) -> Optional[SemanticCache]:
+    """Process-wide semantic cache over `cache`; None unless SEMANTIC_CACHE is enabled"""
+    global _semantic_cache, _semantic_cache_created
+    with _semantic_cache_lock:
+        if not _semantic_cache_created:
+            enabled = os.getenv("SEMANTIC_CACHE", "false").lower() in ("true", "1", "yes")
+            if enabled and cache is not None:
+                rules = dict(DEFAULT_FIELD_RULES)
+                # e.g. SEMANTIC_CACHE_FIELD_RULES={"metadata.year": "exact"}
+                rules.update(json.loads(os.getenv("SEMANTIC_CACHE_FIELD_RULES", "{}")))
+                _semantic_cache = SemanticCache(
+                    cache,
+                    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+                    field_rules=rules,
+                )
+            _semantic_cache_created = True
+        return _semantic_cache
@@ -0,0 +1,220 @@
+"""HTTP entry point for headless generation: POST JSONL payloads, get JSONL results streamed back
+
+    POST /v1/generate?workers=4      body: one payload per line (text/metadata/research_question/section)
+    GET  /health
+
+Results are sent with chunked transfer encoding as they complete, so large batches stream
+instead of buffering. SERVICE_MAX_BATCHES bounds how many batches run at once (further
+requests get 503), each with up to SERVICE_MAX_WORKERS requests in flight; every request
+still goes through the shared rate limiter and response cache. If SERVICE_TOKEN is set,
+requests need an "Authorization: Bearer <token>" header.
+"""
+import os
+import json
+import hmac
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Optional
+from urllib.parse import parse_qs, urlparse
+
+from adaptive_limit import adaptive_limiters
+from endpoint_pool import get_endpoint_pool
+from pipeline import PayloadStats, process_payloads
+from rate_limiter import get_rate_limiter
+from response_cache import get_response_cache
+from settings import Settings
+from watson_client import IBMWatsonMLClient
+
+logger = logging.getLogger(__name__)
+
+
+def build_client(settings: Settings) -> IBMWatsonMLClient:
+    """A client outside Streamlit: same response cache, rate limiter, endpoints and token manager as the app"""
+    semantic_cache = None
+    if settings.semantic_cache:
+        from semantic_cache import get_semantic_cache
+        semantic_cache = get_semantic_cache(get_response_cache())
+    return IBMWatsonMLClient(api_key=settings.api_key, cache=get_response_cache(), semantic_cache=semantic_cache,
+                             pool=get_endpoint_pool())
+
+
+def iter_body_lines(rfile, length: int) -> Iterator[str]:
+    """Lines of a request body, read from the socket as they are needed"""
+    remaining = length
+    while remaining > 0:
+        line = rfile.readline(remaining)
+        if not line:
+            break
+        remaining -= len(line)
+        yield line.decode("utf-8", errors="replace")
+
+
+class ChunkedWriter:
+    """File-like wrapper sending every flushed write as one HTTP/1.1 chunk"""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.buffer = []
+
+    def write(self, text: str):
+        self.buffer.append(text)
+
+    def flush(self):
+        data = "".join(self.buffer).encode("utf-8")
+        self.buffer = []
+        if data:
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    def close(self):
+        self.flush()
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class GenerationService:
+    """Shared state behind the HTTP handler"""
+
+    def __init__(self, client, deployment_id: str, max_workers: int = 4, max_batches: int = 4,
+                 token: Optional[str] = None, store: bool = False):
+        self.client = client
+        self.deployment_id = deployment_id
+        self.max_workers = max_workers
+        self.token = token
+        self.store = store
+        self._batches = threading.BoundedSemaphore(max_batches)
+        self._lock = threading.Lock()
+        self.active_batches = 0
+        self.totals = PayloadStats()
+
+    def started(self):
+        with self._lock:
+            self.active_batches += 1
+
+    def finished(self, stats: PayloadStats):
+        with self._lock:
+            self.active_batches -= 1
+            for field, value in stats.as_dict().items():
+                setattr(self.totals, field, getattr(self.totals, field) + value)
+
+
+class GenerationHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service: GenerationService = None  # set by make_server
+
+    def _send_json(self, status: int, body, headers=None):
+        if status >= 400:
+            self.close_connection = True  # the request body may not have been read
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self) -> bool:
+        if not self.service.token:
+            return True
+        expected = f"Bearer {self.service.token}"
+        return hmac.compare_digest(self.headers.get("Authorization", ""), expected)
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self._send_json(404, {"error": "Not found"})
+            return
+        limiter = get_rate_limiter()
+        health = {
+            "status": "ok",
+            "active_batches": self.service.active_batches,
+            "requests_last_minute": limiter.requests_last_minute(),
+            "rate_limit_wait_seconds": round(limiter.wait_time(), 1),
+            "totals": self.service.totals.as_dict(),
+        }
+        if len(self.service.client.pool) > 1:
+            health["endpoints"] = self.service.client.pool.stats()
+        learned = adaptive_limiters()
+        if learned:
+            health["adaptive_limits"] = {key: adaptive.as_dict() for key, adaptive in learned.items()}
+        self._send_json(200, health)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/v1/generate":
+            self._send_json(404, {"error": "Not found"})
+            return
+        if not self._authorized():
+            self._send_json(401, {"error": "Missing or wrong bearer token"})
+            return
+        if "Content-Length" not in self.headers:
+            self._send_json(411, {"error": "Content-Length is required"})
+            return
+        try:
+            length = int(self.headers["Content-Length"])
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            self._send_json(400, {"error": "Content-Length must be a non-negative integer"})
+            return
+        try:
+            workers = int(parse_qs(url.query).get("workers", [self.service.max_workers])[0])
+        except ValueError:
+            self._send_json(400, {"error": "workers must be an integer"})
+            return
+        if not self.service._batches.acquire(blocking=False):
+            self._send_json(503, {"error": "Too many batches running"}, headers={"Retry-After": "30"})
+            return
+
+        cancel_event = threading.Event()
+        stats = PayloadStats()
+        self.service.started()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            out = ChunkedWriter(self.wfile)
+            process_payloads(self.service.client, self.service.deployment_id,
+                             iter_body_lines(self.rfile, length), out,
+                             max_workers=max(1, min(workers, self.service.max_workers)),
+                             store=self.service.store, cancel_event=cancel_event, stats=stats)
+            out.close()
+        except OSError as e:
+            # Client went away; stop sending its remaining payloads
+            cancel_event.set()
+            self.close_connection = True
+            logger.warning(f"Batch aborted, client disconnected: {str(e)}")
+        finally:
+            self.service.finished(stats)
+            self.service._batches.release()
+        logger.info("Batch finished: %s", stats.as_dict())
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+def make_server(service: GenerationService, host: str = "127.0.0.1", port: int = 8080) -> ThreadingHTTPServer:
+    handler = type("BoundGenerationHandler", (GenerationHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(settings: Settings, host: str = "127.0.0.1", port: int = 8080, store: bool = False):
+    service = GenerationService(
+        build_client(settings), str(settings.deployment_id),
+        max_workers=int(os.getenv("SERVICE_MAX_WORKERS", "4")),
+        max_batches=int(os.getenv("SERVICE_MAX_BATCHES", "4")),
+        token=os.getenv("SERVICE_TOKEN") or None,
+        store=store,
+    )
+    server = make_server(service, host, port)
+    logger.info("Serving on http://%s:%d", host, server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
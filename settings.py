@@ -0,0 +1,42 @@
+"""App configuration, read from .env and the environment once per process"""
+import os
+import threading
+from typing import List, Mapping, Optional
+
+from dotenv import load_dotenv
+
+# The app stops with instructions when any of these is unset
+REQUIRED_VARS = ("API_KEY", "DEPLOYMENT_ID", "COS_API_KEY", "COS_INSTANCE_ID", "COS_ENDPOINT", "COS_BUCKET")
+
+
+class Settings:
+    """Settings app.py reads; Streamlit reruns reuse this instead of re-reading .env"""
+
+    def __init__(self, env: Optional[Mapping[str, str]] = None):
+        env = os.environ if env is None else env
+        self.api_key = env.get("API_KEY")
+        self.deployment_id = env.get("DEPLOYMENT_ID")
+        self.cos_api_key = env.get("COS_API_KEY")
+        self.cos_instance_id = env.get("COS_INSTANCE_ID")
+        self.cos_endpoint = env.get("COS_ENDPOINT")
+        self.cos_bucket = env.get("COS_BUCKET")
+        self.chunk_max_tokens = int(env.get("CHUNK_MAX_TOKENS", "3000"))
+        self.library_output_dir = env.get("LIBRARY_OUTPUT_DIR", ".cache/library_imports")
+        self.semantic_cache = env.get("SEMANTIC_CACHE", "false").lower() in ("true", "1", "yes")
+
+    def missing(self) -> List[str]:
+        return [name for name in REQUIRED_VARS if not getattr(self, name.lower())]
+
+
+_settings = None
+_settings_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    """Load .env and parse the settings on first call; changes need a server restart"""
+    global _settings
+    with _settings_lock:
+        if _settings is None:
+            load_dotenv()
+            _settings = Settings()
+        return _settings
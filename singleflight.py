@@ -0,0 +1,149 @@
+"""Coalesce identical concurrent calls into a single execution"""
+import threading
+from concurrent.futures import CancelledError, Future, TimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class SingleFlight:
+    """Runs fn once per key at a time; callers arriving meanwhile share the leader's result"""
+
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any],
+           cancel_event: Optional[threading.Event] = None) -> Tuple[Any, bool]:
+        """Return (result, shared); shared is True when another caller did the work
+
+        A caller waiting on someone else's result raises CancelledError once cancel_event is set.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = Future()
+                self._calls[key] = future
+                leader = True
+
+        if not leader:
+            if cancel_event is None:
+                return future.result(), True
+            while True:
+                try:
+                    return future.result(timeout=0.25), True
+                except TimeoutError:
+                    if cancel_event.is_set():
+                        raise CancelledError()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+class StreamFanout:
+    """Reads one streaming HTTP response in the background and replays it to every subscriber
+
+    Chunks are buffered, so a subscriber that joins late first gets everything sent so far and
+    then follows along live. The upstream response is closed once every subscriber has gone.
+    """
+
+    def __init__(self, response, on_done: Optional[Callable[["StreamFanout"], None]] = None,
+                 chunk_size: int = 1024):
+        self.response = response
+        self.chunk_size = chunk_size
+        self.on_done = on_done
+        self.chunks: List[bytes] = []
+        self.error: Optional[Exception] = None
+        self.done = False
+        self.abandoned = False  # stopped early because nobody was reading
+        self.subscribers = 0
+        self.readers = 0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._pump, name="stream-fanout", daemon=True)
+        self._thread.start()
+
+    def subscribe(self) -> Optional["ReplayResponse"]:
+        """A new reader, or None if the stream was abandoned and can't be replayed in full"""
+        with self._cond:
+            if self.abandoned:
+                return None
+            self.subscribers += 1
+            self.readers += 1
+            return ReplayResponse(self)
+
+    def _release(self):
+        with self._cond:
+            self.readers -= 1
+            self._cond.notify_all()
+
+    def _pump(self):
+        try:
+            for chunk in self.response.iter_content(chunk_size=self.chunk_size):
+                with self._cond:
+                    if chunk:
+                        self.chunks.append(chunk)
+                    self._cond.notify_all()
+                    if self.subscribers and not self.readers:
+                        self.abandoned = True
+                        break
+        except Exception as e:
+            self.error = e
+        finally:
+            self.response.close()
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+            if self.on_done:
+                self.on_done(self)
+
+
+class ReplayResponse:
+    """The parts of requests.Response that stream consumers use, fed from a StreamFanout"""
+
+    def __init__(self, fanout: StreamFanout):
+        self._fanout = fanout
+        self._closed = False
+        self.status_code = fanout.response.status_code
+        self.headers = fanout.response.headers
+        self.elapsed = fanout.response.elapsed
+        self.url = fanout.response.url
+
+    def iter_content(self, chunk_size: int = 1024, decode_unicode: bool = False):
+        """Yields the upstream chunks as they were received (chunk_size is not re-applied)"""
+        fanout = self._fanout
+        position = 0
+        try:
+            while True:
+                with fanout._cond:
+                    while position >= len(fanout.chunks) and not fanout.done and not self._closed:
+                        fanout._cond.wait()
+                    if self._closed:
+                        return
+                    pending = fanout.chunks[position:]
+                    position += len(pending)
+                    if not pending:
+                        if fanout.error is not None:
+                            raise fanout.error
+                        return
+                yield from pending
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._fanout._release()
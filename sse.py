@@ -0,0 +1,103 @@
+"""Incremental decoder for server-sent event (text/event-stream) bodies"""
+import json
+import codecs
+from typing import Dict, List, Optional
+
+
+class SSEDecoder:
+    """Feed raw byte chunks in any split; get back complete events
+
+    Handles events split across chunks, several events in one chunk, CRLF/CR/LF line
+    endings and multi-byte UTF-8 characters cut between chunks.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._buffer = ""
+        self._pending_cr = False
+        self._non_sse: List[str] = []
+        self._reset_event()
+        self.saw_fields = False  # False means the body wasn't SSE at all
+
+    def _reset_event(self):
+        self._event = None
+        self._id = None
+        self._data: List[str] = []
+
+    def feed(self, chunk: bytes) -> List[Dict[str, Optional[str]]]:
+        """Add a chunk of the body and return the events it completed"""
+        return self._process(self._decoder.decode(chunk))
+
+    def flush(self) -> List[Dict[str, Optional[str]]]:
+        """Finish the stream, dispatching a trailing event that had no blank line after it"""
+        events = self._process(self._decoder.decode(b"", final=True))
+        if self._buffer:
+            self._handle_line(self._buffer, events)
+            self._buffer = ""
+        if self._data:
+            self._dispatch(events)
+        return events
+
+    def _process(self, text: str) -> List[Dict[str, Optional[str]]]:
+        events = []
+        if not text:
+            return events
+
+        # A CR at the end of the previous chunk may be the first half of CRLF
+        if self._pending_cr and text.startswith("\n"):
+            text = text[1:]
+        self._pending_cr = text.endswith("\r")
+
+        self._buffer += text
+        lines = self._buffer.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        # The last piece has no line ending yet; keep it for the next chunk
+        self._buffer = lines.pop()
+        for line in lines:
+            self._handle_line(line, events)
+        return events
+
+    def _handle_line(self, line: str, events: List[Dict[str, Optional[str]]]):
+        if line == "":
+            if self._data:
+                self._dispatch(events)
+            else:
+                self._reset_event()
+            return
+        if line.startswith(":"):
+            return  # comment / keep-alive
+
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+
+        if field == "data":
+            self._data.append(value)
+        elif field == "event":
+            self._event = value
+        elif field == "id":
+            self._id = value
+        else:
+            # Not an SSE field: keep it so plain JSON bodies can still be recovered
+            self._non_sse.append(line)
+            return
+        self.saw_fields = True
+
+    def non_sse_text(self) -> str:
+        """Lines that weren't SSE fields; for a non-SSE body this is the whole body"""
+        return "\n".join(self._non_sse)
+
+    def _dispatch(self, events: List[Dict[str, Optional[str]]]):
+        events.append({"event": self._event, "id": self._id, "data": "\n".join(self._data)})
+        self._reset_event()
+
+
+def generated_text_from_event(data: str) -> str:
+    """Pull the generated text out of one Watson stream event's data"""
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        return data
+    if isinstance(payload, dict):
+        results = payload.get("results") or [{}]
+        return results[0].get("generated_text", "")
+    return ""
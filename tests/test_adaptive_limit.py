@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from adaptive_limit import AdaptiveLimiter, AdaptiveStateStore, parse_retry_after
+from rate_limiter import RateLimiter
+
+
+def make_limiter(per_minute=60, **kwargs):
+    return AdaptiveLimiter("test@http://local", RateLimiter(per_minute=per_minute, per_hour=10 ** 6),
+                           max_per_minute=6000, **kwargs)
+
+
+def queued(limiter):
+    """Keep one request waiting for a token until the returned event is set"""
+    rate_limiter = limiter.rate_limiter
+    while rate_limiter.acquire(timeout=0):
+        pass
+    stop = threading.Event()
+    thread = threading.Thread(target=rate_limiter.acquire, kwargs={"cancel_event": stop})
+    thread.start()
+    deadline = time.monotonic() + 2
+    while rate_limiter.queue_length() == 0 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return stop, thread
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0  # in the past
+
+
+def test_keeps_the_configured_burst_until_a_limit_is_seen():
+    limiter = make_limiter(per_minute=5)
+    assert [limiter.rate_limiter.acquire(timeout=0) for _ in range(5)] == [True] * 5
+    assert not limiter.spread
+
+
+def test_grows_only_while_requests_queue():
+    limiter = make_limiter()
+    limiter.on_success({})
+    assert limiter.per_minute == 60
+    assert limiter.increases == 0
+
+    stop, thread = queued(limiter)
+    try:
+        limiter.on_success({})
+    finally:
+        stop.set()
+        thread.join()
+    assert limiter.per_minute == pytest.approx(66)  # slow start: +10%
+    assert limiter.rate_limiter.per_minute == pytest.approx(66)
+
+
+def test_first_429_while_bursting_only_spaces_requests():
+    limiter = make_limiter()
+    assert limiter.on_throttle({"Retry-After": "2"}) == 2.0
+    assert limiter.per_minute == 60
+    assert limiter.slow_start
+    assert limiter.decreases == 0
+    # The next requests are spaced evenly at the configured rate
+    assert limiter.spread
+    assert limiter.rate_limiter.acquire(timeout=0)
+    assert not limiter.rate_limiter.acquire(timeout=0)
+
+
+def test_429_halves_rate_and_concurrency_once_per_burst():
+    limiter = make_limiter(max_concurrency=16)
+    limiter.on_throttle({})  # switches spacing on
+    limiter.last_decrease -= 10
+    concurrency = limiter.concurrency
+    assert limiter.on_throttle({"Retry-After": "2"}) == 2.0
+    assert limiter.per_minute == 30
+    assert limiter.concurrency == max(1.0, concurrency / 2)
+    assert not limiter.slow_start
+
+    # More 429s from requests that were already in flight are the same signal
+    limiter.on_throttle({})
+    assert limiter.per_minute == 30
+    assert limiter.decreases == 1
+
+
+def test_headers_cap_the_rate_and_pause_when_used_up():
+    limiter = make_limiter(per_minute=600, header_window=1)
+    assert limiter.on_success({"X-RateLimit-Limit": "2", "X-RateLimit-Remaining": "1"}) is None
+    assert limiter.ceiling == 120
+    assert limiter.per_minute == 120
+    assert limiter.spread
+    assert limiter.on_success({"RateLimit-Limit": "2", "RateLimit-Remaining": "0", "RateLimit-Reset": "3"}) == 3
+
+
+def test_concurrency_slots():
+    limiter = make_limiter(max_concurrency=4)
+    limiter.concurrency = 1
+    assert limiter.acquire_slot()
+    cancel = threading.Event()
+    cancel.set()
+    assert not limiter.acquire_slot(cancel)
+    limiter.release_slot()
+    assert limiter.acquire_slot(cancel)
+
+
+def test_state_is_restored_from_the_saved_file(tmp_path):
+    path = str(tmp_path / "adaptive_limits.json")
+    store = AdaptiveStateStore(path)
+    limiter = make_limiter(state=store.get("test@http://local"), on_change=store.changed)
+    limiter.on_throttle({})  # switches spacing on
+    limiter.last_decrease -= 10
+    limiter.on_throttle({})  # a decrease is saved right away
+
+    restored = AdaptiveStateStore(path)
+    resumed = make_limiter(state=restored.get("test@http://local"))
+    assert resumed.per_minute == 30
+    assert resumed.spread
+    assert not resumed.slow_start
+
+    # Learned under another configured rate: start over
+    fresh = make_limiter(per_minute=120, state=restored.get("test@http://local"))
+    assert fresh.per_minute == 120
+    assert fresh.slow_start
+
+
+def test_clients_with_their_own_rate_limiter_get_their_own_adaptive_limiter(tmp_path, monkeypatch):
+    import adaptive_limit
+    from watson_client import IBMWatsonMLClient
+
+    monkeypatch.setattr(adaptive_limit, "_store", AdaptiveStateStore(str(tmp_path / "adaptive_limits.json")))
+    monkeypatch.setattr(adaptive_limit, "_limiters", {})
+    first, second = RateLimiter(per_minute=5), RateLimiter(per_minute=50)
+    c1 = IBMWatsonMLClient("key", rate_limiter=first, base_url="http://local", adaptive=True)
+    c2 = IBMWatsonMLClient("key", rate_limiter=second, base_url="http://local", adaptive=True)
+    assert c1.pool.endpoints[0].adaptive.rate_limiter is first
+    assert c2.pool.endpoints[0].adaptive.rate_limiter is second
+    assert sorted(adaptive_limit.adaptive_limiters()) == ["default@http://local", "default@http://local#2"]
@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+
+from chunking import _split_oversized, condense_long_text, estimate_tokens, split_into_chunks
+from jobs import JobCancelled
+from prompt_compaction import payload_messages
+
+
+def paper(paragraphs=60):
+    return "\n\n".join(
+        f"Paragraph {n} opens with a claim. It is supported by evidence number {n}. It ends here."
+        for n in range(paragraphs)
+    )
+
+
+class FakeClient:
+    """Answers each chunk with a one-point summary, or fails with `error` for chunks containing `fail_on`"""
+
+    def __init__(self, error=None, fail_on=""):
+        self.error = error
+        self.fail_on = fail_on
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def chat_completion(self, deployment_id, messages, version):
+        with self._lock:
+            self.calls.append(messages)
+        if self.error is not None and self.fail_on in messages[0]["content"]:
+            raise self.error
+        return {"summary": [f"point {len(messages[0]['content'])}"]}
+
+
+def test_chunks_stay_within_budget_and_overlap():
+    text = paper()
+    chunks = split_into_chunks(text, max_tokens=200, overlap_tokens=20)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 200 for chunk in chunks)
+    # Every paragraph lands in some chunk, and later chunks open with the end of the previous one
+    for n in range(60):
+        assert any(f"evidence number {n}." in chunk for chunk in chunks)
+    overlap = chunks[1].split("\n\n", 1)[0]
+    assert overlap.startswith("It ") and chunks[0].endswith(overlap)
+
+
+def test_editing_one_paragraph_keeps_distant_chunks():
+    text = paper(120)
+    edited = text.replace("evidence number 100.", "evidence number one hundred.")
+    before = split_into_chunks(text, max_tokens=200, overlap_tokens=20)
+    after = split_into_chunks(edited, max_tokens=200, overlap_tokens=20)
+    assert before[:3] == after[:3]
+
+
+def test_oversized_paragraphs_are_split():
+    pieces = _split_oversized("word " * 2000, 100)
+    assert len(pieces) > 1
+    assert all(estimate_tokens(piece) <= 100 for piece in pieces)
+    # A budget of zero tokens still makes progress
+    assert _split_oversized("x" * 10, 0) == ["xxxx", "xxxx", "xx"]
+
+
+def test_overlap_must_be_smaller_than_chunk():
+    with pytest.raises(ValueError):
+        split_into_chunks("word " * 2000, max_tokens=100, overlap_tokens=100)
+
+
+def test_condense_sends_each_chunk_as_a_payload():
+    client = FakeClient()
+    payload = {"text": paper(), "metadata": {"title": "T"}}
+    condensed = condense_long_text(client, "model", payload, parse=lambda response: response,
+                                   max_tokens=400, overlap_tokens=20)
+    chunks = split_into_chunks(payload["text"], 400, 20)
+    assert sorted(client.calls, key=str) == sorted((payload_messages(dict(payload, text=chunk)) for chunk in chunks), key=str)
+    assert condensed.startswith("Part 1:\n- point ")
+    assert f"Part {len(chunks)}:" in condensed
+
+
+def test_condense_keeps_the_text_of_failed_chunks():
+    client = FakeClient(error=RuntimeError("boom"), fail_on="evidence number 0.")
+    condensed = condense_long_text(client, "model", {"text": paper()}, parse=lambda response: response,
+                                   max_tokens=400, overlap_tokens=20)
+    assert "Part 1:\n- Paragraph 0 opens with a claim." in condensed
+    assert "Part 2:\n- point " in condensed
+
+
+def test_condense_stops_when_every_chunk_fails():
+    client = FakeClient(error=RuntimeError("service down"))
+    with pytest.raises(RuntimeError, match="service down"):
+        condense_long_text(client, "model", {"text": paper()}, parse=lambda response: response,
+                           max_tokens=400, overlap_tokens=20)
+    # One round only: the raw text isn't split and resent
+    assert len(client.calls) == len(split_into_chunks(paper(), 400, 20))
+
+
+def test_condense_reraises_cancellation():
+    client = FakeClient(error=JobCancelled())
+    with pytest.raises(JobCancelled):
+        condense_long_text(client, "model", {"text": paper()}, parse=lambda response: response,
+                           max_tokens=400, overlap_tokens=20)
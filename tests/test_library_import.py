@@ -0,0 +1,96 @@
+from library_import import iter_bibtex, iter_references, iter_ris, iter_unique_references, normalize_reference
+
+BIBTEX = r"""@string{jml = "Journal of Machine Learning"}
+% a comment line
+@article{doe2020,
+  title = {The {Deep} Learning of G\"{o}del and Caf\'e Data},
+  author = {Doe, John and M{\"u}ller, Anna and others},
+  journal = jml,
+  year = 2020,
+  pages = {1--10},
+  doi = {10.1000/ABC.123}
+}
+@inproceedings(smith2019, title="Short", author="Smith, A.", booktitle={Proc. of X}, year={2019})
+"""
+
+RIS = """TY  - JOUR
+TI  - Streaming parsers
+AU  - Doe, John
+AU  - Roe, Richard
+JO  - Journal of Things
+PY  - 2021///
+SP  - 5
+EP  - 9
+AB  - First part of the abstract
+  continues here.
+DO  - https://doi.org/10.1000/XYZ
+ER  - 
+TY  - BOOK
+TI  - Second
+ER  - 
+"""
+
+
+def test_bibtex_entries():
+    first, second = iter_bibtex(BIBTEX.splitlines(True))
+    assert first == {
+        "key": "doe2020",
+        "title": "The Deep Learning of Gödel and Café Data",
+        "authors": "Doe, John; Müller, Anna et al.",
+        "journal": "Journal of Machine Learning",
+        "year": "2020",
+        "pages": "1-10",
+        "doi": "10.1000/ABC.123",
+    }
+    assert second == {"key": "smith2019", "title": "Short", "authors": "Smith, A.",
+                      "journal": "Proc. of X", "year": "2019"}
+
+
+def test_bibtex_entry_on_one_line_with_nested_braces():
+    entries = list(iter_bibtex(["@misc{k, title={A {B {C}} D}} @misc{j, title={E}}"]))
+    assert [entry["title"] for entry in entries] == ["A B C D", "E"]
+
+
+def test_ris_records():
+    first, second = iter_ris(RIS.splitlines(True))
+    assert first == {
+        "title": "Streaming parsers",
+        "authors": "Doe, John; Roe, Richard",
+        "journal": "Journal of Things",
+        "year": "2021///",
+        "pages": "5-9",
+        "abstract": "First part of the abstract continues here.",
+        "doi": "https://doi.org/10.1000/XYZ",
+    }
+    assert second == {"title": "Second"}
+
+
+def test_ris_with_crlf_line_endings():
+    records = list(iter_ris(RIS.replace("\n", "\r\n").splitlines(True)))
+    assert records[0]["authors"] == "Doe, John; Roe, Richard"
+
+
+def test_iter_references_detects_the_format():
+    assert list(iter_references(RIS.encode(), filename="library.ris")) == list(iter_ris(RIS.splitlines(True)))
+    # No extension: sniffed from the first line (a UTF-8 BOM is dropped)
+    assert [entry["key"] for entry in iter_references(b"\xef\xbb\xbf" + BIBTEX.encode())] == ["doe2020", "smith2019"]
+    rows = list(iter_references(b"Title,Author,Publication Year,DOI\nA paper,\"Doe, J.\",2019,10.1000/q\n"))
+    assert rows == [{"title": "A paper", "authors": "Doe, J.", "year": "2019", "doi": "10.1000/q"}]
+
+
+def test_normalize_reference():
+    reference = normalize_reference(next(iter_ris(RIS.splitlines(True))))
+    assert reference["doi"] == "10.1000/xyz"
+    assert reference["year"] == "2021"
+    assert reference["url"] == ""
+    assert reference["volume"] == ""
+
+
+def test_duplicates_by_doi_and_by_title():
+    references = [
+        {"title": "A Study of Things.", "doi": "10.1000/X"},
+        {"title": "Renamed in the other export", "doi": "https://doi.org/10.1000/x"},
+        {"title": "a study of things", "authors": "Doe"},
+        {"title": "Different paper"},
+    ]
+    assert [duplicate_of for _, _, duplicate_of in iter_unique_references(references)] == [None, 0, 0, None]
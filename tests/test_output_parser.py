@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from output_parser import PartialJSONParser, parse_model_output, repair_json
+from response_handlers import parse_response
+
+
+def watson(text):
+    return {"results": [{"generated_text": text}]}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1,}', {"a": 1}),
+    ("{'a': 'x', 'b': \"it's\"}", {"a": "x", "b": "it's"}),
+    ("{a: True, b: None, c: False}", {"a": True, "b": None, "c": False}),
+    ('{"a": [1, 2,], // note\n "b": /* x */ 2}', {"a": [1, 2], "b": 2}),
+    ('{"a": "line one\nline two"}', {"a": "line one\nline two"}),
+    ('{"a": [1, 2}', {"a": [1, 2]}),
+])
+def test_repair_json(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_repair_closes_truncated_output_at_the_last_complete_value():
+    data = json.loads(repair_json('{"summary": ["one", "two"], "hypotheses": "H1 is tr'))
+    assert data["summary"] == ["one", "two"]
+
+
+def test_parse_response_finds_fenced_json_in_prose():
+    text = 'Here is the result:\n```json\n{"summary": ["a", "b",], "hypotheses": "H1"}\n```\nHope it helps.'
+    result = parse_response(watson(text))
+    assert result["summary"] == ["a", "b"]
+    assert result["hypotheses"] == "H1"
+
+
+def test_parse_response_merges_split_blocks_and_normalizes_shapes():
+    text = '{"summary": "- first\\n- second"}\n\n{"hypotheses": ["H1", "H2"], "citations": {"APA": "Doe (2020)"}}'
+    result = parse_response(watson(text))
+    assert result["summary"] == ["first", "second"]
+    assert result["hypotheses"] == "1. H1\n2. H2"
+    assert result["citations"] == {"APA": "Doe (2020)"}
+
+
+def test_parse_response_with_single_quotes_and_python_literals():
+    result = parse_response(watson("{'summary': ['ok'], 'section_draft': None, 'done': True}"))
+    assert result["summary"] == ["ok"]
+    assert result["done"] is True
+
+
+def test_parse_response_without_json_keeps_the_text():
+    assert parse_response(watson("No structured output here.")) == {"raw_content": "No structured output here."}
+    assert parse_model_output("{ not json at all") == {"raw_content": "{ not json at all"}
+
+
+def test_partial_parser_fills_fields_while_streaming():
+    parser = PartialJSONParser()
+    parser.feed('Sure! {"summary": ["first point", "sec')
+    partial = parser.parse()
+    assert partial["summary"][0] == "first point"
+    parser.feed('ond point"], "hypotheses": "H1"}')
+    assert parser.parse()["hypotheses"] == "H1"
@@ -0,0 +1,42 @@
+import io
+import json
+
+from pipeline import process_payloads
+
+
+class FakeClient:
+    """Answers every request with a one-point summary"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def bind(self, **kwargs):
+        return self
+
+    def chat_completion(self, deployment_id, messages, stream=False, version=None):
+        self.calls += 1
+        return {"results": [{"generated_text": json.dumps({"summary": ["ok"]})}]}
+
+
+def test_invalid_payloads_get_an_error_line():
+    records = [
+        '{"text": "fine", "metadata": null, "id": "a"}',
+        "not json",
+        "[1, 2]",
+        '{"text": 3}',
+        '{"text": "x", "metadata": "str"}',
+        {"text": "x", "section": "Intro"},
+        "",
+    ]
+    client, out = FakeClient(), io.StringIO()
+    stats = process_payloads(client, "model", records, out, max_workers=1)
+
+    assert stats.as_dict() == {"read": 6, "invalid": 5, "done": 1, "failed": 0}
+    assert client.calls == 1
+    lines = {line["index"]: line for line in map(json.loads, out.getvalue().splitlines())}
+    assert lines[0]["id"] == "a" and lines[0]["summary"] == ["ok"]
+    assert lines[1]["error"].startswith("Invalid JSON: ")
+    assert lines[2]["error"] == "Not a payload object"
+    assert lines[3]["error"] == "Invalid payload: text must be a string"
+    assert lines[4]["error"] == "Invalid payload: metadata must be an object"
+    assert lines[5]["error"] == "Invalid payload: section must be an object"
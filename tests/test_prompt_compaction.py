@@ -0,0 +1,29 @@
+from prompt_compaction import normalize_text, strip_boilerplate, strip_reference_list
+
+
+def test_page_numbers_are_only_stripped_at_page_edges():
+    page = "Results\nYear\nAccuracy\n2019\n87\n2020\n91\nTable 1 shows the trend.\n- 4 -"
+    assert strip_boilerplate([page]) == ["Results\nYear\nAccuracy\n2019\n87\n2020\n91\nTable 1 shows the trend."]
+    assert strip_boilerplate(["12\nShort page\nPage 3 of 10"]) == ["Short page"]
+
+
+def test_running_headers_and_footers_are_stripped():
+    words = ["alpha", "beta", "gamma", "delta"]
+    pages = [f"Journal of Things, Vol. {n}\nOpening {word}\nMiddle {word}\nClosing {word}\nPreprint {n}"
+             for n, word in enumerate(words, 1)]
+    cleaned = strip_boilerplate(pages)
+    assert cleaned[0] == "Opening alpha\nMiddle alpha\nClosing alpha"
+    # Two pages are too few to tell a running header from content
+    assert strip_boilerplate(pages[:2])[0].startswith("Journal of Things")
+
+
+def test_normalize_text_unwraps_and_rejoins_hyphens():
+    text = "The ﬁrst results of this experi-\nment were collected over many weeks and\nmonths.\n\n\n•  item"
+    assert normalize_text(text) == "The first results of this experiment were collected over many weeks and months.\n\n• item"
+
+
+def test_reference_list_is_cut_but_appendix_kept():
+    text = "Body text. " * 50 + "\nReferences\n[1] Someone. 2020.\nAppendix A\nExtra tables."
+    stripped = strip_reference_list(text)
+    assert "[1] Someone" not in stripped
+    assert stripped.endswith("Appendix A\nExtra tables.")
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from rate_limiter import RateLimiter, SQLiteBucketStore, TokenBucket, create_rate_limiter
+
+
+def test_token_bucket_refills_evenly_up_to_capacity():
+    bucket = TokenBucket(capacity=10, period=10, tokens=0, updated=100.0)
+    bucket.refill(103.0)
+    assert bucket.tokens == pytest.approx(3)
+    assert bucket.wait_time() == 0
+    bucket.refill(1000.0)
+    assert bucket.tokens == 10
+
+    bucket.tokens = 0.5
+    assert bucket.wait_time() == pytest.approx(0.5)
+
+
+def test_acquire_stops_at_the_per_minute_cap():
+    limiter = RateLimiter(per_minute=3, per_hour=100)
+    assert [limiter.acquire(timeout=0) for _ in range(4)] == [True, True, True, False]
+    assert limiter.requests_last_minute() == 3
+    assert limiter.wait_time() > 0
+
+
+def test_per_hour_cap_applies_too():
+    limiter = RateLimiter(per_minute=10, per_hour=2)
+    assert [limiter.acquire(timeout=0) for _ in range(3)] == [True, True, False]
+
+
+def test_waiters_are_served_in_arrival_order():
+    limiter = RateLimiter(per_minute=1200, per_hour=10 ** 6)
+    # One token every 0.05 s, so every waiter after the first has to queue
+    limiter.set_limits(1200, 10 ** 6, spread=True)
+    order = []
+
+    def wait(number):
+        limiter.acquire()
+        order.append(number)
+
+    threads = []
+    for number in range(5):
+        thread = threading.Thread(target=wait, args=(number,))
+        thread.start()
+        threads.append(thread)
+        # Don't start the next waiter until this one is queued (or already through)
+        deadline = time.monotonic() + 1
+        while len(order) + limiter.queue_length() <= number and time.monotonic() < deadline:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    limiter = RateLimiter(per_minute=1, per_hour=100)
+    assert limiter.acquire(timeout=0)
+    cancel = threading.Event()
+    cancel.set()
+    assert not limiter.acquire(cancel_event=cancel)
+    assert limiter.queue_length() == 0
+
+
+def test_spread_spaces_requests_by_the_rate():
+    limiter = RateLimiter(per_minute=120, per_hour=10 ** 6)
+    limiter.set_limits(120, 10 ** 6, spread=True)
+    assert limiter.acquire(timeout=0)
+    # A minute's burst is no longer available: the next token comes after 60 / 120 s
+    assert not limiter.acquire(timeout=0)
+    assert limiter.wait_time() == pytest.approx(0.5, abs=0.05)
+
+
+def test_set_limits_drops_tokens_above_the_new_capacity():
+    limiter = RateLimiter(per_minute=10, per_hour=100)
+    limiter.set_limits(2, 100)
+    assert [limiter.acquire(timeout=0) for _ in range(3)] == [True, True, False]
+
+
+def test_sqlite_store_shares_the_quota_between_limiters(tmp_path):
+    path = str(tmp_path / "rate_limit.db")
+    limits = [("minute", 2, 60), ("hour", 100, 3600)]
+    first = RateLimiter(per_minute=2, per_hour=100, store=SQLiteBucketStore(limits, path))
+    second = RateLimiter(per_minute=2, per_hour=100, store=SQLiteBucketStore(limits, path))
+    assert first.acquire(timeout=0)
+    assert second.acquire(timeout=0)
+    assert not first.acquire(timeout=0)
+
+
+def test_sqlite_prefixes_keep_endpoints_apart(tmp_path, monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_BACKEND", "sqlite")
+    monkeypatch.setenv("RATE_LIMIT_PATH", str(tmp_path / "rate_limit.db"))
+    us = create_rate_limiter(1, 100, prefix="us-south:")
+    eu = create_rate_limiter(1, 100, prefix="eu-de:")
+    assert isinstance(us.store, SQLiteBucketStore)
+    assert us.acquire(timeout=0)
+    assert eu.acquire(timeout=0)
+    assert not us.acquire(timeout=0)
@@ -0,0 +1,80 @@
+import pytest
+
+import response_cache
+from response_cache import MemoryCache, SQLiteCache, make_cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return MemoryCache(**kwargs)
+        return SQLiteCache(str(tmp_path / "cache.db"), **kwargs)
+    return make
+
+
+def test_make_cache_key_ignores_dict_order():
+    a = make_cache_key([{"role": "user", "content": "hi"}], "dep", "v1")
+    b = make_cache_key([{"content": "hi", "role": "user"}], "dep", "v1")
+    assert a == b
+    assert a != make_cache_key([{"role": "user", "content": "hi"}], "dep", "v2")
+
+
+def test_round_trip_and_stats(make_cache):
+    cache = make_cache(ttl=None)
+    assert cache.get("a") is None
+    cache.set("a", {"results": [{"generated_text": "x"}]})
+    assert cache.get("a") == {"results": [{"generated_text": "x"}]}
+    assert cache.stats.as_dict()["hits"] == 1
+    assert cache.stats.as_dict()["misses"] == 1
+
+
+def test_evicts_least_recently_used(make_cache, clock):
+    cache = make_cache(max_entries=2, ttl=None)
+    cache.set("a", 1)
+    clock[0] += 1
+    cache.set("b", 2)
+    clock[0] += 1
+    assert cache.get("a") == 1  # a is now the most recently used
+    clock[0] += 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+    assert cache.stats.evictions == 1
+
+
+def test_byte_cap(make_cache):
+    cache = make_cache(max_entries=100, max_bytes=30, ttl=None)
+    cache.set("a", "x" * 10)
+    cache.set("b", "y" * 10)
+    cache.set("c", "z" * 10)
+    assert cache.size_bytes() <= 30
+    assert cache.get("a") is None
+    # Too large to store at all
+    cache.set("big", "x" * 100)
+    assert cache.get("big") is None
+
+
+def test_ttl_expiry(make_cache, clock):
+    cache = make_cache(ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=600)
+    clock[0] += 61
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats.expirations == 1
+
+
+def test_sqlite_cache_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "cache.db")
+    SQLiteCache(path, ttl=None).set("a", [1, 2])
+    assert SQLiteCache(path, ttl=None).get("a") == [1, 2]
@@ -0,0 +1,82 @@
+import json
+
+from response_handlers import handle_streaming_response
+from sse import SSEDecoder, generated_text_from_event
+
+
+def event(text, line_ending="\n"):
+    data = json.dumps({"results": [{"generated_text": text}]}, ensure_ascii=False)
+    return f"id: 1{line_ending}event: message{line_ending}data: {data}{line_ending}{line_ending}"
+
+
+def decode(chunks):
+    decoder = SSEDecoder()
+    events = []
+    for chunk in chunks:
+        events += decoder.feed(chunk)
+    return events + decoder.flush()
+
+
+def split_every(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_event_fields():
+    events = decode([event("hello").encode()])
+    assert events == [{"event": "message", "id": "1", "data": json.dumps({"results": [{"generated_text": "hello"}]})}]
+
+
+def test_multibyte_characters_split_between_chunks():
+    body = (event("Größe ") + event("日本語 ✓")).encode("utf-8")
+    # Byte-at-a-time cuts every multi-byte character in the middle
+    events = decode(split_every(body, 1))
+    assert [generated_text_from_event(e["data"]) for e in events] == ["Größe ", "日本語 ✓"]
+
+
+def test_crlf_split_between_chunks():
+    body = (event("a", "\r\n") + event("b", "\r\n")).encode()
+    for size in (1, 2, 3, 7):
+        events = decode(split_every(body, size))
+        assert [generated_text_from_event(e["data"]) for e in events] == ["a", "b"]
+
+
+def test_bare_cr_line_endings():
+    events = decode([event("a", "\r").encode()])
+    assert [generated_text_from_event(e["data"]) for e in events] == ["a"]
+
+
+def test_comments_multiline_data_and_trailing_event():
+    decoder = SSEDecoder()
+    assert decoder.feed(b": keep-alive\n\ndata: one\ndata: two\n\ndata: last") == [
+        {"event": None, "id": None, "data": "one\ntwo"}
+    ]
+    assert decoder.flush() == [{"event": None, "id": None, "data": "last"}]
+
+
+def test_plain_json_body_is_not_sse():
+    decoder = SSEDecoder()
+    body = json.dumps({"results": [{"generated_text": "{}"}]}).encode()
+    assert decoder.feed(body) == []
+    assert decoder.flush() == []
+    assert not decoder.saw_fields
+    assert generated_text_from_event(decoder.non_sse_text()) == "{}"
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def iter_content(self, chunk_size=1024):
+        yield from self.chunks
+
+    def close(self):
+        pass
+
+
+def test_handle_streaming_response_joins_and_parses():
+    output = '{"summary": ["Größe matters"], "hypotheses": "H1"}'
+    body = "".join(event(output[i:i + 5], "\r\n") for i in range(0, len(output), 5)).encode("utf-8")
+    rendered = []
+    result = handle_streaming_response(FakeStream(split_every(body, 3)), on_update=rendered.append)
+    assert result["summary"] == ["Größe matters"]
+    assert rendered[-1] == output
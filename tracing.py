@@ -0,0 +1,122 @@
+"""Lightweight spans and latency histograms for the request hot path"""
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, List
+
+# Upper bounds (seconds) of the Prometheus histogram buckets
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+
+class Histogram:
+    """Counts per bucket for export plus a window of recent samples for percentiles"""
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.total = 0.0
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.bucket_counts[bisect_left(BUCKETS, seconds)] += 1
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+
+class Tracer:
+    """Process-wide registry of span timings and counters"""
+
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        """Time the enclosed block with a monotonic clock"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self) -> List[Dict[str, float]]:
+        """One row per span: count, mean and p50/p95/p99 in milliseconds"""
+        with self._lock:
+            rows = []
+            for name, histogram in sorted(self.histograms.items()):
+                rows.append({
+                    "span": name,
+                    "count": histogram.count,
+                    "mean_ms": histogram.total / histogram.count * 1000 if histogram.count else 0.0,
+                    "p50_ms": histogram.percentile(50) * 1000,
+                    "p95_ms": histogram.percentile(95) * 1000,
+                    "p99_ms": histogram.percentile(99) * 1000,
+                })
+            return rows
+
+    def export_json(self) -> Dict[str, object]:
+        return {"spans": self.summary(), "counters": dict(self.counters)}
+
+    def export_prometheus(self, prefix: str = "research_assistant") -> str:
+        """Prometheus text exposition format"""
+        lines = [
+            f"# HELP {prefix}_span_seconds Duration of instrumented operations",
+            f"# TYPE {prefix}_span_seconds histogram",
+        ]
+        with self._lock:
+            for name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ["+Inf"], histogram.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {histogram.total:.6f}')
+                lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {histogram.count}')
+
+            if self.counters:
+                lines.append(f"# TYPE {prefix}_events_total counter")
+                for name, value in sorted(self.counters.items()):
+                    lines.append(f'{prefix}_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+tracer = Tracer()
+span = tracer.span
+
+
+def traced(name: str):
+    """Decorator that records every call of the function as a span"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,240 @@
+"""Background COS upload worker with a bounded queue and a local spool directory"""
+import os
+import json
+import gzip
+import time
+import uuid
+import queue
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from cos_storage import get_cos_bucket, get_cos_client, upload_to_cos
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPOOL_DIR = os.path.join(".cache", "cos_spool")
+
+
+class UploadItem:
+    """One output waiting to be uploaded; its spool file is deleted once it's in COS"""
+
+    def __init__(self, filename: str, data: str, spool_path: str):
+        self.filename = filename
+        self.data = data
+        self.spool_path = spool_path
+        self.queued_at = time.time()
+
+
+class UploadQueue:
+    """Uploads outputs from a background thread so generation never waits on COS
+
+    Every item is written to the spool directory before it's queued, so nothing is lost if
+    COS is down or the process restarts; spooled items are retried with backoff. When several
+    small items are waiting at once they are bundled into a single JSONL object.
+    """
+
+    def __init__(self, spool_dir: str = DEFAULT_SPOOL_DIR, max_queue: int = 100,
+                 compress: bool = False, small_bytes: int = 8 * 1024, max_bundle: int = 20,
+                 client_factory=get_cos_client, bucket: Optional[str] = None):
+        self.spool_dir = spool_dir
+        self.compress = compress
+        self.small_bytes = small_bytes
+        self.max_bundle = max_bundle
+        self.client_factory = client_factory
+        self.bucket = bucket
+
+        self._queue: "queue.Queue[UploadItem]" = queue.Queue(maxsize=max_queue)
+        self._pending = set()  # spool paths queued or being uploaded
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._retry_delay = 5.0
+        self._next_retry = 0.0
+
+        # Metrics
+        self.uploaded = 0
+        self.failed_attempts = 0
+        self.bundles = 0
+        self.last_error: Optional[str] = None
+        self.latencies = deque(maxlen=200)  # seconds per PUT
+
+        os.makedirs(spool_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="cos-upload-worker", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, filename: str, data: str) -> bool:
+        """Spool and queue an upload; returns False only if the item couldn't even be spooled"""
+        # Time-prefixed names keep spool scans in arrival order
+        spool_path = os.path.join(self.spool_dir, f"{time.time_ns()}_{uuid.uuid4().hex[:8]}.json")
+        try:
+            with open(spool_path, "w", encoding="utf-8") as f:
+                json.dump({"filename": filename, "data": data}, f)
+        except OSError as e:
+            logger.error(f"Could not spool upload {filename}: {str(e)}")
+            return False
+
+        self._offer(UploadItem(filename, data, spool_path))
+        return True
+
+    def _offer(self, item: UploadItem):
+        with self._pending_lock:
+            if item.spool_path in self._pending:
+                return
+            self._pending.add(item.spool_path)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Stays in the spool; picked up again on the next spool scan
+            with self._pending_lock:
+                self._pending.discard(item.spool_path)
+
+    def _run(self):
+        self._requeue_spool()
+        while not self._stop.is_set():
+            try:
+                item = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                if time.time() >= self._next_retry:
+                    self._requeue_spool()
+                continue
+
+            # Take whatever else is already waiting, so a burst goes out together
+            batch = [item]
+            while len(batch) < self.max_bundle:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._upload_batch(batch)
+
+    def _upload_batch(self, batch: List[UploadItem]):
+        small = [item for item in batch if len(item.data) <= self.small_bytes]
+        groups = [[item] for item in batch if len(item.data) > self.small_bytes]
+        if len(small) >= 2:
+            groups.append(small)
+        else:
+            groups.extend([item] for item in small)
+
+        for group in groups:
+            if len(group) == 1:
+                key, body = group[0].filename, group[0].data.encode("utf-8")
+            else:
+                key, body = self._bundle(group)
+            self._put(key, body, group)
+
+    def _bundle(self, group: List[UploadItem]):
+        """Several small outputs as one JSONL object"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        key = f"bundles/{timestamp}_{uuid.uuid4().hex[:8]}.jsonl"
+        lines = []
+        for item in group:
+            try:
+                content = json.loads(item.data)
+            except ValueError:
+                content = item.data
+            lines.append(json.dumps({"filename": item.filename, "content": content}))
+        self.bundles += 1
+        return key, ("\n".join(lines) + "\n").encode("utf-8")
+
+    def _put(self, key: str, body: bytes, group: List[UploadItem]):
+        put_kwargs = {"ContentType": "application/json"}
+        if self.compress:
+            key += ".gz"
+            body = gzip.compress(body)
+            put_kwargs["ContentEncoding"] = "gzip"
+
+        start = time.perf_counter()
+        ok = upload_to_cos(key, body, max_retries=1, cos_client=self.client_factory(),
+                           bucket=self.bucket or get_cos_bucket(), **put_kwargs)
+        elapsed = time.perf_counter() - start
+        self.latencies.append(elapsed)
+        tracer.record("cos_upload", elapsed)
+
+        with self._pending_lock:
+            for item in group:
+                self._pending.discard(item.spool_path)
+
+        if ok:
+            self.uploaded += len(group)
+            self.last_error = None
+            self._retry_delay = 5.0
+            for item in group:
+                try:
+                    os.remove(item.spool_path)
+                except OSError:
+                    pass
+        else:
+            # Leave the spool files; back off before scanning the spool again
+            self.failed_attempts += 1
+            self.last_error = f"Upload of {key} failed at {datetime.now():%H:%M:%S}"
+            self._next_retry = time.time() + self._retry_delay
+            self._retry_delay = min(self._retry_delay * 2, 300.0)
+
+    def _requeue_spool(self):
+        """Queue spooled items left over from failures or a previous process"""
+        try:
+            names = sorted(os.listdir(self.spool_dir))
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.spool_dir, name)
+            with self._pending_lock:
+                if path in self._pending:
+                    continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    spooled = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self._offer(UploadItem(spooled["filename"], spooled["data"], path))
+
+    def spooled(self) -> int:
+        try:
+            return len(os.listdir(self.spool_dir))
+        except OSError:
+            return 0
+
+    def metrics(self) -> Dict[str, float]:
+        latencies = sorted(self.latencies)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "spooled": self.spooled(),
+            "uploaded": self.uploaded,
+            "bundles": self.bundles,
+            "failed_attempts": self.failed_attempts,
+            "latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+            "latency_max": latencies[-1] if latencies else 0.0,
+        }
+
+    def drain(self, timeout: float = 60.0) -> bool:
+        """Wait until everything spooled so far is uploaded; False if some is still spooled at timeout"""
+        deadline = time.monotonic() + timeout
+        while self.spooled() or not self._queue.empty():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.2)
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+
+_upload_queue = None
+_upload_queue_lock = threading.Lock()
+
+
+def get_upload_queue() -> UploadQueue:
+    """Return the process-wide upload queue, starting its worker on first use"""
+    global _upload_queue
+    with _upload_queue_lock:
+        if _upload_queue is None:
+            _upload_queue = UploadQueue(
+                spool_dir=os.getenv("COS_SPOOL_DIR", DEFAULT_SPOOL_DIR),
+                max_queue=int(os.getenv("COS_UPLOAD_QUEUE_SIZE", "100")),
+                compress=os.getenv("COS_GZIP", "false").lower() in ("true", "1", "yes"),
+            )
+        return _upload_queue
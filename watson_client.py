@@ -0,0 +1,479 @@
+import os
+import copy
+import time
+import random
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+from concurrent.futures import CancelledError
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from response_cache import make_cache_key
+from rate_limiter import get_rate_limiter
+from tracing import span, traced, tracer
+from iam_token import IAM_TOKEN_URL, get_token_manager
+from endpoint_pool import Endpoint, EndpointPool, default_base_url, get_default_pool
+from adaptive_limit import adaptive_enabled, get_adaptive_limiter, parse_retry_after
+from jobs import RUNNING, WAITING, JobCancelled
+from singleflight import SingleFlight, StreamFanout
+
+logger = logging.getLogger(__name__)
+
+# Identical requests already on their way to Watson, shared by every client in the process
+_in_flight = SingleFlight()
+_streams: Dict[str, StreamFanout] = {}
+_stream_flight = SingleFlight()
+_streams_lock = threading.Lock()
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Return the process-wide HTTP session so IAM and Watson calls reuse connections"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            pool_size = int(os.getenv("HTTP_POOL_SIZE", "20"))
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+
+# Per-result fields worth keeping; the rest of a generation response is never read
+RESULT_FIELDS = ("generated_text", "stop_reason", "generated_token_count", "input_token_count")
+
+
+def compact_response(data):
+    """A generation response reduced to what parsing and token accounting use, before it's cached"""
+    if not isinstance(data, dict) or not isinstance(data.get("results"), list):
+        return data
+    return {"results": [
+        {field: result[field] for field in RESULT_FIELDS if field in result}
+        for result in data["results"] if isinstance(result, dict)
+    ]}
+
+
+class RateLimitExceeded(Exception):
+    """The service asked for a longer wait than MAX_RETRY_AFTER allows"""
+
+
+class SlotHeldResponse:
+    """A streaming response that keeps its endpoint's concurrency slot until it's closed or read to the end"""
+
+    def __init__(self, response: requests.Response, release: Callable[[], None]):
+        self._response = response
+        self._release = release
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def iter_content(self, *args, **kwargs):
+        try:
+            yield from self._response.iter_content(*args, **kwargs)
+        finally:
+            self._done()
+
+    def close(self):
+        try:
+            self._response.close()
+        finally:
+            self._done()
+
+    def _done(self):
+        with self._lock:
+            release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+# IBM Watson ML Client with rate limit handling
+class IBMWatsonMLClient:
+    def __init__(self, api_key: str, cache=None, rate_limiter=None, semantic_cache=None,
+                 base_url: Optional[str] = None,
+                 iam_token_url: str = IAM_TOKEN_URL,
+                 session: Optional[requests.Session] = None, token_manager=None,
+                 on_status: Optional[Callable[[str, str], None]] = None,
+                 cancel_event: Optional[threading.Event] = None,
+                 pool: Optional[EndpointPool] = None, adaptive: Optional[bool] = None):
+        self.api_key = api_key
+        self.cache = cache
+        self.semantic_cache = semantic_cache
+        self.iam_token_url = iam_token_url
+        self.base_url = base_url or default_base_url()
+        
+        # Rate limiting components
+        self.max_retries = 5
+        self.base_delay = 2  # Base delay in seconds
+        self.max_delay = 60  # Maximum delay in seconds
+        # Longest Retry-After (or quota reset) a request waits out; past it the request fails
+        self.max_retry_after = float(os.getenv("MAX_RETRY_AFTER", "300"))
+        
+        # Shared across sessions so every user draws from the same quota
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+
+        # Pooled keep-alive connections; (connect, read) timeouts in seconds
+        self.session = session or get_http_session()
+        self.timeout = (5, float(os.getenv("API_TIMEOUT", "120")))
+
+        # One token per API key for the whole process, refreshed in the background before expiry
+        self.token_manager = token_manager or get_token_manager(api_key, iam_token_url, self.session)
+
+        # Where requests go: a configured pool of regions/deployments, or just base_url (shared
+        # by every client on the same URL, limiter and key, so they all see its 429 cooldowns)
+        self.pool = pool or get_default_pool(self.base_url, self.rate_limiter, self.token_manager)
+
+        # Learn each endpoint's real rate and concurrency from 429s and rate-limit headers
+        # (ADAPTIVE_RATE_LIMIT); the configured limits are only the starting point
+        if adaptive is None:
+            adaptive = adaptive_enabled()
+        if adaptive:
+            for endpoint in self.pool.endpoints:
+                if endpoint.adaptive is None:
+                    endpoint.adaptive = get_adaptive_limiter(endpoint.key, endpoint.rate_limiter)
+
+        # on_status(state, message) receives progress (background jobs show it); without it
+        # messages only go to the log. Setting cancel_event aborts rate-limit waits and retry backoff
+        self.on_status = on_status
+        self.cancel_event = cancel_event
+
+    def bind(self, on_status: Optional[Callable[[str, str], None]] = None,
+             cancel_event: Optional[threading.Event] = None) -> "IBMWatsonMLClient":
+        """Copy of this client that reports to on_status and can be cancelled"""
+        client = copy.copy(self)
+        client.on_status = on_status
+        client.cancel_event = cancel_event
+        return client
+
+    def _notify(self, state: str, message: str, level: str = "info"):
+        if self.on_status is not None:
+            self.on_status(state, message)
+        elif level == "error":
+            logger.error(message)
+        elif level == "warning":
+            logger.warning(message)
+        else:
+            logger.info(message)
+
+    def _check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def _sleep(self, seconds: float):
+        """Backoff sleep that returns early (by raising JobCancelled) when cancelled"""
+        if self.cancel_event is None:
+            time.sleep(seconds)
+        elif self.cancel_event.wait(seconds):
+            raise JobCancelled()
+
+    @property
+    def access_token(self) -> Optional[str]:
+        return self.token_manager.access_token
+
+    def _token_manager(self, endpoint: Optional[Endpoint]):
+        if endpoint is None:
+            return self.token_manager
+        if endpoint.token_manager is None:
+            endpoint.token_manager = get_token_manager(endpoint.api_key or self.api_key, self.iam_token_url,
+                                                       self.session)
+        return endpoint.token_manager
+
+    def authenticate(self, failed_token: Optional[str] = None, endpoint: Optional[Endpoint] = None) -> str:
+        """Authenticate with IBM Cloud and get access token (for the endpoint's API key)"""
+        token_manager = self._token_manager(endpoint)
+        try:
+            if failed_token is not None:
+                return token_manager.invalidate(failed_token)
+            return token_manager.get_token()
+        except Exception as e:
+            self._notify(RUNNING, f"Authentication error: {str(e)}", level="error")
+            raise
+
+    def is_token_valid(self):
+        """Check if the current token is valid"""
+        return self.token_manager.is_valid()
+    
+    @traced("rate_limit_wait")
+    def wait_for_rate_limit(self, avoid=()) -> Endpoint:
+        """Block until an endpoint's rate limiter lets this request through; returns that endpoint"""
+        waited = False
+
+        def report_wait(wait_time, position):
+            nonlocal waited
+            queued = f" ({position} request(s) ahead)" if position else ""
+            message = f"⏳ Rate limit reached. Waiting {wait_time:.1f} seconds{queued}..."
+            if self.on_status is not None:
+                self.on_status(WAITING, message)
+            elif not waited:
+                logger.info(message)
+            waited = True
+
+        endpoint = self.pool.acquire(avoid, on_wait=report_wait, cancel_event=self.cancel_event)
+        if endpoint is None:
+            raise JobCancelled()
+        if self.on_status is not None:
+            self.on_status(RUNNING, "Sending request" if len(self.pool) == 1 else f"Sending request ({endpoint.name})")
+        return endpoint
+
+    @traced("chat_completion")
+    def chat_completion(self, deployment_id: str, messages: List[Dict[str, str]], 
+                        stream: bool = False, version: str = "2021-05-01"):
+        """Send a request to the Watson ML chat API with rate limit handling"""
+        # Check cache first (only for non-streaming requests)
+        if not deployment_id:
+            raise ValueError("deployment_id cannot be None")
+        cache_key = make_cache_key(messages, deployment_id, version)
+        use_cache = self.cache is not None and not stream
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("Using cached response")
+                tracer.increment("cache_hit")
+                return cached
+
+            # Near-duplicate of an earlier request (e.g. a typo fixed in the abstract)?
+            if self.semantic_cache is not None:
+                cached = self.semantic_cache.lookup(messages, deployment_id, version)
+                if cached is not None:
+                    tracer.increment("semantic_cache_hit")
+                    return cached
+
+        # A double-click or two users with the same payload share one Watson call (and one quota slot)
+        if stream:
+            return self._coalesced_stream(cache_key, deployment_id, messages, version)
+
+        def fetch():
+            result = compact_response(self._send(deployment_id, messages, False, version))
+            if use_cache:
+                self.cache.set(cache_key, result)
+                if self.semantic_cache is not None:
+                    self.semantic_cache.add(messages, deployment_id, version, cache_key)
+            return result
+
+        while True:
+            try:
+                result, shared = _in_flight.do(cache_key, fetch, cancel_event=self.cancel_event)
+            except CancelledError:
+                raise JobCancelled()
+            except JobCancelled:
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    raise
+                continue  # the leader's job was cancelled, not ours; send it ourselves
+            if shared:
+                logger.info("Shared an identical in-flight request")
+                tracer.increment("coalesced")
+            return result
+
+    def _coalesced_stream(self, cache_key: str, deployment_id: str, messages: List[Dict[str, str]],
+                          version: str):
+        """Join an identical stream in progress (replaying it from the start) or open a new one"""
+        key = f"stream:{cache_key}"
+
+        def open_stream():
+            def forget(fanout):
+                with _streams_lock:
+                    if _streams.get(key) is fanout:
+                        del _streams[key]
+
+            fanout = StreamFanout(self._send(deployment_id, messages, True, version), on_done=forget)
+            with _streams_lock:
+                _streams[key] = fanout
+            return fanout
+
+        while True:
+            with _streams_lock:
+                fanout = _streams.get(key)
+            shared = fanout is not None
+            if fanout is None:
+                try:
+                    fanout, shared = _stream_flight.do(key, open_stream, cancel_event=self.cancel_event)
+                except CancelledError:
+                    raise JobCancelled()
+                except JobCancelled:
+                    if self.cancel_event is not None and self.cancel_event.is_set():
+                        raise
+                    continue
+
+            reader = fanout.subscribe()
+            if reader is None:
+                # Everyone else hung up before it finished; start over
+                with _streams_lock:
+                    if _streams.get(key) is fanout:
+                        del _streams[key]
+                continue
+            if shared:
+                logger.info("Replaying an identical in-flight stream")
+                tracer.increment("coalesced_stream")
+            return reader
+
+    def _send(self, deployment_id: str, messages: List[Dict[str, str]], stream: bool, version: str):
+        """POST to Watson with rate limiting, failover, retries and backoff; no caching or coalescing"""
+        path = "text/generation_stream" if stream else "text/generation"
+        # Endpoints that failed this request; retries go elsewhere while anything else is healthy
+        failed: List[Endpoint] = []
+
+        def fail_over(endpoint, error) -> bool:
+            """Count the failure; True if the retry can go straight to another endpoint"""
+            endpoint.failed(error)
+            failed.append(endpoint)
+            if not self.pool.has_alternative(failed):
+                return False
+            tracer.increment("watson_failover")
+            self._notify(RUNNING, f"↪️ {endpoint.name} failed ({error}), trying another endpoint...", level="warning")
+            return True
+
+        # Execute the request with retries and backoff
+        for attempt in range(self.max_retries):
+            endpoint = None
+            try:
+                self._check_cancelled()
+                # Every attempt counts against a quota, so take a token first
+                endpoint = self.wait_for_rate_limit(avoid=failed)
+
+                # Prepare headers (the token may have been refreshed while we waited)
+                token = self.authenticate(endpoint=endpoint)
+                headers = {
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {token}",
+                    "Accept": "application/json"
+                }
+
+                # Make the request, within the endpoint's learned concurrency
+                adaptive = endpoint.adaptive
+                if adaptive is not None and not adaptive.acquire_slot(self.cancel_event):
+                    raise JobCancelled()
+                endpoint.begin()
+                started = time.perf_counter()
+                response = None
+                try:
+                    with span("watson_attempt"):
+                        response = self.session.post(
+                            endpoint.url(deployment_id, path),
+                            headers=headers,
+                            params={"version": version},
+                            json={"messages": messages},
+                            stream=stream,
+                            timeout=self.timeout
+                        )
+                except Exception as e:
+                    # Timeouts and connection errors: the endpoint's fault, try another one
+                    if fail_over(endpoint, type(e).__name__):
+                        continue
+                    raise
+                finally:
+                    # A stream's body is still arriving when post returns, so a successful stream
+                    # keeps its slot until the reader closes it or reaches the end
+                    if adaptive is not None:
+                        if stream and response is not None and response.ok:
+                            response = SlotHeldResponse(response, adaptive.release_slot)
+                        else:
+                            adaptive.release_slot()
+                if attempt:
+                    tracer.increment("watson_retry")
+
+                # Handle specific status codes
+                if response.status_code == 429:  # Too Many Requests
+                    # The service's Retry-After is honored up to max_retry_after; without one, back off from the learned rate
+                    if adaptive is not None:
+                        retry_after = adaptive.on_throttle(response.headers)
+                        backoff = adaptive.retry_delay(attempt, self.max_delay)
+                    else:
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                        backoff = min(self.base_delay * (2 ** attempt), self.max_delay)
+                    wait_time = (retry_after if retry_after is not None else backoff) + random.uniform(0.1, 1.0)
+                    tracer.increment("watson_429")
+                    if wait_time > self.max_retry_after:
+                        # Too long to hold this request (and everything queued behind it): rest the
+                        # endpoint for the cap only, then go elsewhere or give up
+                        endpoint.throttle(self.max_retry_after)
+                        failed.append(endpoint)
+                        if self.pool.has_alternative(failed):
+                            self._notify(RUNNING, f"↪️ {endpoint.name} is rate limited for {wait_time:.0f}s, trying another endpoint...")
+                            continue
+                        message = f"Rate limited for {wait_time:.0f} seconds, longer than MAX_RETRY_AFTER ({self.max_retry_after:.0f}s)"
+                        self._notify(RUNNING, f"❌ {message}. Please try again later.", level="error")
+                        raise RateLimitExceeded(message)
+
+                    # Out of quota here: the next attempt goes to another endpoint, or waits this one out
+                    endpoint.throttle(wait_time)
+                    if attempt < self.max_retries - 1:
+                        if self.pool.has_alternative(failed):
+                            self._notify(RUNNING, f"↪️ {endpoint.name} is rate limited, trying another endpoint...")
+                        else:
+                            self._notify(WAITING, f"⏳ Rate limit exceeded. Waiting {wait_time:.1f} seconds before retry {attempt+1}/{self.max_retries}...", level="warning")
+                        continue
+                    else:
+                        self._notify(RUNNING, f"❌ Rate limit exceeded after {self.max_retries} retries. Please try again later.", level="error")
+                        raise Exception("Rate limit exceeded after multiple retries")
+
+                elif response.status_code == 401:  # Unauthorized
+                    # Token might be expired, refresh and retry
+                    endpoint.release()
+                    self.authenticate(failed_token=token, endpoint=endpoint)
+                    continue
+
+                elif response.status_code >= 500:
+                    if fail_over(endpoint, f"HTTP {response.status_code}"):
+                        continue
+                elif response.ok:
+                    endpoint.succeeded(time.perf_counter() - started)
+                    if adaptive is not None:
+                        pause = adaptive.on_success(response.headers)
+                        if pause:
+                            endpoint.pause(min(pause, self.max_retry_after))
+                else:
+                    # Other 4xx: the request's fault, so neither a success nor a strike against the endpoint
+                    endpoint.release()
+
+                # For any other error, raise it
+                response.raise_for_status()
+
+                # Success! Decode the response if non-streaming
+                if not stream:
+                    return response.json()
+                else:
+                    return response
+
+            except requests.exceptions.HTTPError as e:
+                # Already handled 429 and 401 above
+                if e.response.status_code not in (429, 401):
+                    error_msg = str(e)
+                    try:
+                        error_json = e.response.json()
+                        if 'error' in error_json:
+                            error_msg = f"{error_msg} - {error_json['error']}"
+                    except:
+                        pass
+
+                    self._notify(RUNNING, f"API error: {error_msg}", level="error")
+
+                    # If we're out of retries, raise the error
+                    if attempt >= self.max_retries - 1:
+                        raise
+
+                    # Otherwise backoff and retry
+                    wait_time = min(self.base_delay * (2 ** attempt) + random.uniform(0.1, 1.0), self.max_delay)
+                    self._notify(WAITING, f"⏳ Retrying in {wait_time:.1f} seconds ({attempt+1}/{self.max_retries})...")
+                    self._sleep(wait_time)
+
+            except (JobCancelled, RateLimitExceeded):
+                raise
+
+            except Exception as e:
+                self._notify(RUNNING, f"Request error: {str(e)}", level="error")
+                if attempt >= self.max_retries - 1:
+                    raise
+
+                wait_time = min(self.base_delay * (2 ** attempt) + random.uniform(0.1, 1.0), self.max_delay)
+                self._notify(WAITING, f"⏳ Retrying in {wait_time:.1f} seconds ({attempt+1}/{self.max_retries})...")
+                self._sleep(wait_time)
+
+        # If we get here, all retries failed
+        raise Exception(f"Failed after {self.max_retries} attempts")